@@ -0,0 +1,173 @@
+"""
+Admission control for voice sessions.
+
+This module is responsible for:
+    - Capping concurrent sessions; clients past the cap wait in a bounded FIFO
+      queue (with position updates) or are turned away immediately when the
+      queue is full.
+    - Capping concurrent agent runs, so a burst of transcripts can't queue
+      unbounded work on the executor.
+    - Per-client inbound frame rate limiting.
+
+Everything here runs on the event loop; none of it is thread-safe.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Optional
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+FRAMES_DROPPED = REGISTRY.counter(
+    "weppo_inbound_frames_dropped_total", "Client frames dropped for exceeding the per-client frame rate")
+
+ADMITTED = "admitted"
+REJECTED = "rejected"
+TIMEOUT = "timeout"
+DISCONNECTED = "disconnected"
+
+
+class AdmissionController:
+    """
+    Session and agent-run limits for one server.
+
+    Args:
+        max_sessions: Sessions served at once.
+        max_queue: Clients allowed to wait for a slot; 0 rejects as soon as the server is full.
+        queue_timeout: Seconds a client waits before being turned away.
+        max_agent_runs: Agent turns executing at once across all sessions.
+    """
+
+    def __init__(self, max_sessions: int = None, max_queue: int = None, queue_timeout: float = None,
+                 max_agent_runs: int = None, registry: MetricsRegistry = REGISTRY):
+        self.max_sessions = max_sessions or int(os.environ.get("WEPPO_MAX_SESSIONS", 50))
+        self.max_queue = max_queue if max_queue is not None else int(os.environ.get("WEPPO_SESSION_QUEUE", 20))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(
+            os.environ.get("WEPPO_SESSION_QUEUE_TIMEOUT", 30))
+        self.max_agent_runs = max_agent_runs or int(os.environ.get("WEPPO_MAX_AGENT_RUNS", 8))
+
+        self.active = 0
+        self._waiters: Deque[object] = deque()
+        self._changed = asyncio.Event()
+        self._agent_runs = asyncio.Semaphore(self.max_agent_runs)
+        self._agent_waiting = 0
+
+        self.decisions = registry.counter(
+            "weppo_session_admission_total", "Session admission outcomes", ["result"])
+        self.queue_wait = registry.histogram(
+            "weppo_session_queue_wait_seconds", "Time admitted sessions spent waiting for a slot")
+        registry.gauge("weppo_sessions_active", "Sessions currently admitted").set_function(lambda: self.active)
+        registry.gauge("weppo_sessions_queued", "Clients waiting for a session slot").set_function(
+            lambda: len(self._waiters))
+        registry.gauge("weppo_agent_runs_waiting", "Agent turns waiting for a free run slot").set_function(
+            lambda: self._agent_waiting)
+
+    def _notify(self):
+        """Wake every waiter so it can re-check its position."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def admit(self, on_position: Optional[Callable[[int], Awaitable[None]]] = None,
+                    closed: Optional[Callable[[], Awaitable[None]]] = None) -> str:
+        """
+        Wait for a session slot. Returns ADMITTED, or REJECTED (queue full),
+        TIMEOUT (waited queue_timeout) or DISCONNECTED (the awaitable `closed()`
+        returns finished first; it is only created for clients that queue).
+        `on_position` is awaited with the client's 1-based queue position whenever it changes.
+        """
+        if self.active < self.max_sessions and not self._waiters:
+            self.active += 1
+            self.decisions.inc(result=ADMITTED)
+            return ADMITTED
+        if len(self._waiters) >= self.max_queue:
+            self.decisions.inc(result=REJECTED)
+            return REJECTED
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.queue_timeout
+        ticket = object()
+        self._waiters.append(ticket)
+        closed_task = asyncio.ensure_future(closed()) if closed is not None else None
+        last_position = None
+        result = TIMEOUT
+        try:
+            while True:
+                position = self._waiters.index(ticket) + 1
+                if position == 1 and self.active < self.max_sessions:
+                    self._waiters.popleft()
+                    self.active += 1
+                    self._notify()
+                    self.queue_wait.observe(loop.time() - started)
+                    result = ADMITTED
+                    return result
+                if on_position and position != last_position:
+                    last_position = position
+                    await on_position(position)
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return result
+                changed_task = asyncio.ensure_future(self._changed.wait())
+                waiting = {changed_task} | ({closed_task} if closed_task else set())
+                await asyncio.wait(waiting, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                changed_task.cancel()
+                if closed_task is not None and closed_task.done():
+                    result = DISCONNECTED
+                    return result
+        finally:
+            if closed_task is not None and not closed_task.done():
+                closed_task.cancel()
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                self._notify()
+            self.decisions.inc(result=result)
+
+    def release(self):
+        """Free an admitted session's slot for the next client in the queue."""
+        self.active = max(0, self.active - 1)
+        self._notify()
+
+    @asynccontextmanager
+    async def agent_run(self):
+        """Hold one of the max_agent_runs slots for the duration of an agent turn."""
+        self._agent_waiting += 1
+        try:
+            await self._agent_runs.acquire()
+        finally:
+            self._agent_waiting -= 1
+        try:
+            yield
+        finally:
+            self._agent_runs.release()
+
+
+class FrameRateLimiter:
+    """Token bucket over inbound frames: `rate` frames/s sustained, bursts of up to `burst`."""
+
+    def __init__(self, rate: float = None, burst: float = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate or float(os.environ.get("WEPPO_MAX_FRAMES_PER_SECOND", 50))
+        self.burst = burst or self.rate * 2
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self.dropped = 0
+
+    def allow(self) -> bool:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        self.dropped += 1
+        FRAMES_DROPPED.inc()
+        return False
+
+    @property
+    def abusive(self) -> bool:
+        """Dropped more than two seconds' worth of frames: the client ignores the limit."""
+        return self.dropped > self.rate * 2
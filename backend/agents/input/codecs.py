@@ -0,0 +1,193 @@
+"""
+Inbound audio formats.
+
+This module is responsible for:
+    - Negotiating the format a client streams in, from the "audio" field of its
+      hello frame, e.g. {"encoding": ["opus", "mulaw"], "sample_rate": 48000}.
+    - Decoding each inbound frame to 16-bit PCM (LINEAR16, G.711 mu-law and
+      A-law, and Opus packets when `opuslib` is installed).
+    - Downmixing and resampling to the recognizer's rate with a streaming,
+      vectorized (numpy) anti-aliasing filter and interpolator.
+
+Decoding runs in the speech recognition thread (see WebSocketStream), not on
+the event loop.
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.agents.outils.metrics import REGISTRY
+
+LINEAR16 = "linear16"
+MULAW = "mulaw"
+ALAW = "alaw"
+OPUS = "opus"
+
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+# Rates an Opus decoder can produce directly
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+_inbound_bytes = REGISTRY.counter(
+    "weppo_inbound_audio_bytes_total", "Audio bytes received from clients, by negotiated encoding", ["encoding"])
+
+
+def _mulaw_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    magnitude = (((codes & 0x0F) << 3) + 0x84) << ((codes & 0x70) >> 4)
+    return np.where(codes & 0x80, 0x84 - magnitude, magnitude - 0x84).astype(np.int16)
+
+
+def _alaw_table() -> np.ndarray:
+    codes = np.arange(256, dtype=np.int32) ^ 0x55
+    segment = (codes & 0x70) >> 4
+    magnitude = ((codes & 0x0F) << 4) + 8
+    magnitude = np.where(segment > 0, (magnitude + 0x100) << np.maximum(segment - 1, 0), magnitude)
+    return np.where(codes & 0x80, magnitude, -magnitude).astype(np.int16)
+
+
+_TABLES = {MULAW: _mulaw_table(), ALAW: _alaw_table()}
+
+
+def opus_available() -> bool:
+    try:
+        import opuslib  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def supported_encodings() -> List[str]:
+    encodings = [LINEAR16, MULAW, ALAW]
+    if opus_available():
+        encodings.insert(0, OPUS)
+    return encodings
+
+
+class AudioFormat:
+    """What a client sends: encoding, sample rate and channel count."""
+
+    def __init__(self, encoding: str = LINEAR16, sample_rate: int = 16000, channels: int = 1):
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"encoding": self.encoding, "sample_rate": self.sample_rate, "channels": self.channels}
+
+    def __repr__(self) -> str:
+        return f"AudioFormat({self.encoding}, {self.sample_rate} Hz, {self.channels} ch)"
+
+
+def negotiate(spec: Optional[Dict[str, Any]], default_rate: int = 16000) -> AudioFormat:
+    """
+    Pick the first encoding in the client's preference list that this server can
+    decode. Raises ValueError when none is supported or the rate/channels are invalid.
+    """
+    if not spec:
+        return AudioFormat(LINEAR16, default_rate, 1)
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid audio format {spec!r}; expected an object")
+    requested = spec.get("encoding", LINEAR16)
+    preferences = [requested] if isinstance(requested, str) else list(requested)
+    available = supported_encodings()
+    encoding = next((e.lower() for e in preferences if str(e).lower() in available), None)
+    if encoding is None:
+        raise ValueError(f"Unsupported audio encoding {requested!r}. Supported: {', '.join(available)}")
+
+    sample_rate = int(spec.get("sample_rate", default_rate))
+    channels = int(spec.get("channels", 1))
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(f"Unsupported sample rate {sample_rate}; expected {MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE} Hz")
+    if channels not in (1, 2):
+        raise ValueError(f"Unsupported channel count {channels}; expected 1 or 2")
+    if encoding == OPUS and sample_rate not in OPUS_RATES:
+        raise ValueError(f"Opus sample rate must be one of {OPUS_RATES}")
+    return AudioFormat(encoding, sample_rate, channels)
+
+
+class Resampler:
+    """
+    Streaming resampler for mono int16 audio.
+
+    Downsampling first low-pass filters with a windowed-sinc FIR so content
+    above the new Nyquist frequency doesn't alias into the speech band, then
+    interpolates linearly at the output rate. Filter history and the
+    fractional read position carry over between chunks, so frame boundaries
+    leave no clicks.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int, taps: int = 63):
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.step = from_rate / to_rate
+        if to_rate < from_rate:
+            cutoff = 0.45 * to_rate / from_rate  # cycles/sample, with a little transition band
+            n = np.arange(taps) - (taps - 1) / 2
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+            self._kernel = kernel / kernel.sum()
+        else:
+            self._kernel = None
+        self._history = np.zeros(taps - 1 if self._kernel is not None else 0)
+        self._previous = 0.0
+        self._position = 1.0  # next output sample, in units of input samples; index 0 is `_previous`
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        x = samples.astype(np.float64)
+        if self._kernel is not None:
+            padded = np.concatenate([self._history, x])
+            self._history = padded[len(padded) - len(self._history):]
+            x = np.convolve(padded, self._kernel, mode="valid")
+
+        buffer = np.concatenate([[self._previous], x])
+        last = len(buffer) - 1
+        count = max(0, math.ceil((last - self._position) / self.step))
+        positions = self._position + self.step * np.arange(count)
+        index = positions.astype(np.int64)
+        fraction = positions - index
+        out = buffer[index] * (1 - fraction) + buffer[np.minimum(index + 1, last)] * fraction
+
+        self._position = self._position + self.step * count - last
+        self._previous = buffer[-1]
+        return np.clip(np.round(out), -32768, 32767).astype(np.int16)
+
+
+class InboundAudio:
+    """Decoder stage: client frames in the negotiated format -> mono LINEAR16 at `target_rate`."""
+
+    def __init__(self, audio_format: AudioFormat, target_rate: int = 16000):
+        self.format = audio_format
+        self.target_rate = target_rate
+        decode_rate = audio_format.sample_rate
+        self._opus = None
+        if audio_format.encoding == OPUS:
+            import opuslib
+            # Opus decodes straight to any of its rates, so ask for the recognizer's when possible
+            decode_rate = target_rate if target_rate in OPUS_RATES else audio_format.sample_rate
+            self._opus = opuslib.Decoder(decode_rate, audio_format.channels)
+            self._opus_frame = decode_rate * 120 // 1000  # largest Opus frame, 120 ms
+        self._resampler = Resampler(decode_rate, target_rate) if decode_rate != target_rate else None
+        self.passthrough = (audio_format.encoding == LINEAR16 and audio_format.channels == 1
+                            and self._resampler is None)
+
+    def _pcm(self, frame: bytes) -> np.ndarray:
+        encoding = self.format.encoding
+        if encoding == LINEAR16:
+            return np.frombuffer(frame[:len(frame) - len(frame) % 2], dtype="<i2")
+        if encoding in _TABLES:
+            return _TABLES[encoding][np.frombuffer(frame, dtype=np.uint8)]
+        # One Opus packet per websocket frame
+        return np.frombuffer(self._opus.decode(frame, self._opus_frame), dtype="<i2")
+
+    def decode(self, frame: bytes) -> bytes:
+        _inbound_bytes.inc(len(frame), encoding=self.format.encoding)
+        if self.passthrough:
+            return frame
+        samples = self._pcm(frame)
+        if self.format.channels == 2:
+            samples = samples[:len(samples) - len(samples) % 2].reshape(-1, 2).mean(axis=1)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        return samples.astype("<i2").tobytes()
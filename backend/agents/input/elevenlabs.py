@@ -1,6 +1,6 @@
 import os
+from typing import Dict, Iterable, Tuple
 from dotenv import load_dotenv
-from elevenlabs.client import ElevenLabs
 
 class ElevenLabsTTS:
     def __init__(self):
@@ -12,7 +12,31 @@ class ElevenLabsTTS:
         api_key = os.getenv("ELEVENLABS_API_KEY")
         if not api_key:
             raise ValueError("ELEVENLABS_API_KEY environment variable not found.")
+        # The SDK (and its generated pydantic models) loads here, off the server's import path
+        from elevenlabs.client import ElevenLabs
         self.client = ElevenLabs(api_key=api_key)
+        # Pre-synthesized audio for phrases spoken often, keyed by (text, voice, model, format)
+        self._phrase_audio: Dict[Tuple[str, str, str, str], bytes] = {}
+
+    def prime(
+        self,
+        phrases: Iterable[str],
+        voice_id: str = "JBFqnCBsd6RMkjVDRZzb",
+        model_id: str = "eleven_multilingual_v2",
+        output_format: str = "mp3_44100_128",
+    ) -> int:
+        """
+        Synthesizes `phrases` ahead of time; stream_audio then serves them
+        without an API call. Returns the number of phrases newly cached.
+        """
+        primed = 0
+        for text in phrases:
+            key = (text, voice_id, model_id, output_format)
+            if key in self._phrase_audio:
+                continue
+            self._phrase_audio[key] = b"".join(self.stream_audio(text, voice_id, model_id, output_format))
+            primed += 1
+        return primed
 
     def stream_audio(
         self,
@@ -33,6 +57,11 @@ class ElevenLabsTTS:
         Yields:
             Audio chunks from the ElevenLabs API.
         """
+        cached = self._phrase_audio.get((text, voice_id, model_id, output_format))
+        if cached is not None:
+            yield cached
+            return
+
         audio_stream = self.client.text_to_speech.convert_as_stream(
             text=text,
             voice_id=voice_id,
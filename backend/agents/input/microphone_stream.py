@@ -2,15 +2,11 @@ import queue
 import re
 import sys
 from dotenv import load_dotenv
-from google.cloud import speech
-import pyaudio
 import os
 load_dotenv()
 
-if not os.environ.get("GOOGLE_API_KEY"):
-    raise ValueError("GOOGLE_API_KEY is not set")
-
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+if os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 
 # Audio recording parameters
 RATE = 16000
@@ -20,6 +16,9 @@ class MicrophoneStream:
 
     def __init__(self: object, rate: int = RATE, chunk: int = CHUNK) -> None:
         """The audio -- and generator -- is guaranteed to be on the main thread."""
+        # Checked here rather than at import so servers can import this module without the key
+        if not os.environ.get("GOOGLE_API_KEY"):
+            raise ValueError("GOOGLE_API_KEY is not set")
         self._rate = rate
         self._chunk = chunk
 
@@ -28,6 +27,9 @@ class MicrophoneStream:
         self.closed = True
 
     def __enter__(self: object) -> object:
+        # pyaudio is only needed with a local input device
+        import pyaudio
+        self._pa_continue = pyaudio.paContinue
         self._audio_interface = pyaudio.PyAudio()
         self._audio_stream = self._audio_interface.open(
             format=pyaudio.paInt16,
@@ -81,7 +83,7 @@ class MicrophoneStream:
             The audio data as a bytes object
         """
         self._buff.put(in_data)
-        return None, pyaudio.paContinue
+        return None, self._pa_continue
 
     def generator(self: object) -> object:
         """Generates audio chunks from the stream of audio data in chunks.
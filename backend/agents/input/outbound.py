@@ -0,0 +1,222 @@
+"""
+Per-connection outbound scheduler.
+
+This module is responsible for:
+    - Sending everything for one websocket from a single writer task, so a slow
+      client stalls that task instead of the session's turn loop.
+    - Two lanes: control (transcripts, agent responses, status and errors) is
+      always sent before media (TTS audio and its tts_starting/tts_finished
+      markers, which keep their order relative to the audio).
+    - Bounding buffered audio and applying a policy when the client falls behind:
+        pause      the producer waits for the buffer to drain, which pauses
+                   pulling audio from the TTS stream (default)
+        drop       the oldest buffered audio is discarded to make room
+        downgrade  pause, and synthesize later turns at a lower bitrate
+    - Reporting buffered bytes per connection as a gauge.
+    - For protocol v2 sessions, framing each message as it is sent and
+      surviving a dropped connection: the queue is detached, keeps buffering,
+      and on reattach replays the frames the client missed before continuing.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Optional, Tuple, Union
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+Message = Union[str, bytes]
+
+PAUSE = "pause"
+DROP = "drop"
+DOWNGRADE = "downgrade"
+POLICIES = (PAUSE, DROP, DOWNGRADE)
+
+DEFAULT_AUDIO_FORMAT = "mp3_44100_128"
+DOWNGRADED_AUDIO_FORMAT = "mp3_22050_32"
+
+
+class OutboundQueue:
+    """
+    Prioritized, byte-bounded send buffer for one websocket.
+
+    Args:
+        websocket: Connection to write to.
+        session: Label for the buffered-bytes gauge, usually the session thread id.
+        max_bytes: Audio bytes buffered before the policy applies.
+        policy: One of pause, drop, downgrade.
+        encoder: Optional protocol v2 FrameEncoder; makes the queue resumable.
+    """
+
+    def __init__(self, websocket, session: str, max_bytes: int = None, policy: str = None,
+                 encoder=None, registry: MetricsRegistry = REGISTRY):
+        self.websocket = websocket
+        self.encoder = encoder
+        self._attached = asyncio.Event()
+        self._attached.set()
+        self._replay_after: Optional[int] = None
+        self.session = session
+        self.max_bytes = max_bytes or int(os.environ.get("WEPPO_OUTBOUND_MAX_BYTES", 131072))
+        self.policy = (policy or os.environ.get("WEPPO_OUTBOUND_POLICY", PAUSE)).lower()
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown outbound policy '{self.policy}'. Available: {', '.join(POLICIES)}")
+        self.audio_format = DEFAULT_AUDIO_FORMAT
+
+        self._control: Deque[Message] = deque()
+        # (message, is_audio, stream) so markers are never dropped with the audio around them
+        self._media: Deque[Tuple[Message, bool, Optional[int]]] = deque()
+        self.buffered_bytes = 0
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+
+        self._buffered = registry.gauge(
+            "weppo_outbound_buffered_bytes", "Audio bytes waiting to be sent, per connection", ["session"])
+        self._buffered.set_function(lambda: self.buffered_bytes, session=session)
+        self.backpressure = registry.counter(
+            "weppo_outbound_backpressure_total", "Times a connection's audio buffer hit its limit", ["policy"])
+        self.dropped_bytes = registry.counter(
+            "weppo_outbound_audio_dropped_bytes_total", "Stale audio bytes discarded for slow clients")
+
+    def start(self):
+        self._writer = asyncio.create_task(self._run())
+        return self
+
+    def send(self, message: Message):
+        """Queue a control message; it goes out ahead of any buffered audio."""
+        if not self.closed:
+            self._control.append(message)
+            self._idle.clear()
+            self._ready.set()
+
+    def send_media(self, message: Message, stream: int = None):
+        """Queue a message in order with the audio stream (e.g. tts_starting / tts_finished)."""
+        if not self.closed:
+            self._media.append((message, False, stream))
+            self._idle.clear()
+            self._ready.set()
+
+    async def put_audio(self, chunk: bytes, stream: int = None) -> bool:
+        """
+        Queue an audio chunk, applying the policy if the buffer is full.
+        Returns False once the connection is closed, so the caller can stop synthesizing.
+        """
+        if self.closed:
+            return False
+        if self.buffered_bytes + len(chunk) > self.max_bytes:
+            self.backpressure.inc(policy=self.policy)
+            if self.policy == DROP:
+                self._drop_oldest_audio(self.buffered_bytes + len(chunk) - self.max_bytes)
+            else:
+                if self.policy == DOWNGRADE and self.audio_format != DOWNGRADED_AUDIO_FORMAT:
+                    logger.info("Client %s is falling behind; downgrading audio to %s", self.session,
+                                DOWNGRADED_AUDIO_FORMAT)
+                    self.audio_format = DOWNGRADED_AUDIO_FORMAT
+                # Resume once half the buffer has been sent
+                while not self.closed and self.buffered_bytes > self.max_bytes // 2:
+                    self._drained.clear()
+                    await self._drained.wait()
+                if self.closed:
+                    return False
+        self._media.append((chunk, True, stream))
+        self.buffered_bytes += len(chunk)
+        self._idle.clear()
+        self._ready.set()
+        return True
+
+    def _drop_oldest_audio(self, needed: int):
+        kept: Deque[Tuple[Message, bool, Optional[int]]] = deque()
+        freed = 0
+        while self._media:
+            message, is_audio, stream = self._media.popleft()
+            if is_audio and freed < needed:
+                freed += len(message)
+                continue
+            kept.append((message, is_audio, stream))
+        self._media = kept
+        self.buffered_bytes -= freed
+        self.dropped_bytes.inc(freed)
+
+    def detach(self):
+        """Connection lost (protocol v2): keep queueing until `attach` or `close`."""
+        self.websocket = None
+        self._attached.clear()
+
+    def attach(self, websocket, last_seq: int) -> bool:
+        """
+        Continue on a new connection, first replaying frames after `last_seq`.
+        Returns False if some of them had already left the replay buffer.
+        """
+        _, complete = self.encoder.frames_after(last_seq)
+        self._replay_after = last_seq
+        self.websocket = websocket
+        self._attached.set()
+        self._ready.set()
+        return complete
+
+    async def _run(self):
+        try:
+            while True:
+                websocket = self.websocket
+                if websocket is None:
+                    await self._attached.wait()
+                    continue
+                if self._replay_after is not None:
+                    frames, _ = self.encoder.frames_after(self._replay_after)
+                    self._replay_after = None
+                    for frame in frames:
+                        await websocket.send(frame)
+                    continue
+                if not self._control and not self._media:
+                    self._idle.set()
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                if self._control:
+                    message, is_audio, stream = self._control.popleft(), False, None
+                else:
+                    message, is_audio, stream = self._media.popleft()
+                if is_audio:
+                    self.buffered_bytes -= len(message)
+                    if self.buffered_bytes <= self.max_bytes // 2:
+                        self._drained.set()
+                # Framed before sending so a frame lost with the connection can be replayed
+                frame = self.encoder.encode(message, stream) if self.encoder else message
+                try:
+                    # send() waits for the transport to drain, so a slow client holds this task only
+                    await websocket.send(frame)
+                except Exception:
+                    if self.encoder is None:
+                        raise
+                    if self.websocket is websocket:
+                        self.detach()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("Outbound writer for %s stopped: %s", self.session, e)
+        finally:
+            self.closed = True
+            self._idle.set()
+            self._drained.set()
+
+    async def close(self, timeout: float = 5.0):
+        """Flush what is queued (up to `timeout`), then stop the writer and the gauge."""
+        if self._writer is not None and not self._writer.done():
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.debug("Dropping unsent messages for %s", self.session)
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+        self.closed = True
+        self._drained.set()
+        self._buffered.remove(session=self.session)
@@ -0,0 +1,264 @@
+"""
+Websocket protocol v2: typed binary frames, sequence numbers and session resumption.
+
+A client opts in with `"protocol": 2` in its hello frame (a JSON text frame, the
+only text frame in v2). After that, every frame in both directions is binary:
+
+    +---------+------+-----------+----------+----------------+---------+
+    | version | type | stream id | sequence | timestamp (ms) | payload |
+    |   u8    |  u8  |    u16    |   u32    |      u32       |         |
+    +---------+------+-----------+----------+----------------+---------+
+    (network byte order, 12-byte header)
+
+    type  CONTROL (1)  payload is a UTF-8 JSON message, stream 0
+          AUDIO   (2)  client -> server: audio in the negotiated format, stream 1
+                       server -> client: TTS audio, one stream id per response
+          ACK     (3)  client -> server: "received everything up to `sequence`"
+
+Sequences count per direction from 1; timestamps are milliseconds since the
+session started. The server's ready message carries a `resume` token. A client
+that drops and reconnects within WEPPO_RESUME_WINDOW seconds sends
+`{"type": "hello", "protocol": 2, "resume": <token>, "last_seq": <n>}` and is
+reattached to the same agent thread: frames after `last_seq` are replayed, then
+the session continues, including any turn that completed while it was away.
+
+Resume tokens are also recorded in the shared session state (WEPPO_STATE_URL),
+so a client whose reconnect lands on another worker still gets its agent thread,
+store and audio format back; only the unsent frames, which live in the original
+worker's memory, are lost (`replay_complete` is false and sequences restart).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import struct
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from backend.agents.outils.metrics import REGISTRY
+from backend.agents.state.store import SETTINGS, SessionStateStore, resume_key, session_key
+
+logger = logging.getLogger(__name__)
+
+VERSION = 2
+HEADER = struct.Struct("!BBHII")
+
+CONTROL = 1
+AUDIO = 2
+ACK = 3
+
+CONTROL_STREAM = 0
+INBOUND_AUDIO_STREAM = 1
+
+_resumes = REGISTRY.counter("weppo_session_resumes_total", "Protocol v2 resume attempts", ["result"])
+
+
+class ProtocolError(ValueError):
+    """Raised for frames that don't follow protocol v2."""
+
+
+def encode_frame(frame_type: int, stream: int, seq: int, timestamp_ms: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(VERSION, frame_type, stream & 0xFFFF, seq & 0xFFFFFFFF, timestamp_ms & 0xFFFFFFFF) + payload
+
+
+def decode_frame(frame: bytes) -> Tuple[int, int, int, int, bytes]:
+    """Return (type, stream, seq, timestamp_ms, payload)."""
+    if len(frame) < HEADER.size:
+        raise ProtocolError("Frame shorter than the v2 header")
+    version, frame_type, stream, seq, timestamp_ms = HEADER.unpack_from(frame)
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    return frame_type, stream, seq, timestamp_ms, frame[HEADER.size:]
+
+
+class FrameEncoder:
+    """
+    Server-side framing for one session: numbers outbound frames and keeps the
+    most recent ones (up to `replay_bytes`) until the client acknowledges them.
+    """
+
+    def __init__(self, replay_bytes: int = None):
+        self.replay_bytes = replay_bytes or int(os.environ.get("WEPPO_RESUME_BUFFER_BYTES", 1048576))
+        self.started = time.monotonic()
+        self.seq = 0
+        self.acked = 0
+        self._replay: Deque[Tuple[int, bytes]] = deque()
+        self._buffered = 0
+
+    def encode(self, message, stream: int = None) -> bytes:
+        """Frame a queued message: str -> CONTROL, bytes -> AUDIO on `stream`."""
+        self.seq += 1
+        timestamp_ms = int((time.monotonic() - self.started) * 1000)
+        if isinstance(message, str):
+            frame = encode_frame(CONTROL, CONTROL_STREAM, self.seq, timestamp_ms, message.encode("utf-8"))
+        else:
+            frame = encode_frame(AUDIO, stream or 0, self.seq, timestamp_ms, message)
+        self._replay.append((self.seq, frame))
+        self._buffered += len(frame)
+        while self._buffered > self.replay_bytes and len(self._replay) > 1:
+            _, dropped = self._replay.popleft()
+            self._buffered -= len(dropped)
+        return frame
+
+    def ack(self, seq: int):
+        self.acked = max(self.acked, seq)
+        while self._replay and self._replay[0][0] <= self.acked:
+            _, frame = self._replay.popleft()
+            self._buffered -= len(frame)
+
+    def frames_after(self, seq: int) -> Tuple[List[bytes], bool]:
+        """Frames the client hasn't seen, and whether the buffer still held all of them."""
+        self.ack(seq)
+        complete = not self._replay or self._replay[0][0] <= seq + 1
+        return [frame for frame_seq, frame in self._replay if frame_seq > seq], complete
+
+
+class ResumableSession:
+    """What survives a dropped connection: the agent thread, store, audio format and outbound queue."""
+
+    def __init__(self, thread_id: str, store: str, audio_format: Dict[str, Any], outbound, token: str = None):
+        self.token = token or secrets.token_urlsafe(24)
+        self.thread_id = thread_id
+        self.store = store
+        self.audio_format = audio_format
+        self.outbound = outbound
+        self.last_inbound_seq = 0
+        self.audio_streams = 0
+        self.connected = True
+        self._generation = 0
+
+    def next_audio_stream(self) -> int:
+        """Stream id for the next TTS response (2..65535; 0 and 1 are reserved)."""
+        self.audio_streams += 1
+        return 2 + (self.audio_streams - 1) % 65534
+
+    def accept_inbound(self, seq: int) -> bool:
+        """False for frames already received before a reconnect."""
+        if seq <= self.last_inbound_seq:
+            return False
+        self.last_inbound_seq = seq
+        return True
+
+
+class SessionResumer:
+    """
+    Resumable sessions of this worker, kept for `window` seconds after their connection drops.
+    With a shared `state` store, sessions started on other workers can be adopted too.
+    """
+
+    def __init__(self, window: float = None, state: Optional[SessionStateStore] = None):
+        self.window = window if window is not None else float(os.environ.get("WEPPO_RESUME_WINDOW", 30))
+        self.state = state
+        # Written into resume records, so only the worker that holds a session deletes its record
+        self.owner = uuid.uuid4().hex
+        self._sessions: Dict[str, ResumableSession] = {}
+        sessions = self._sessions
+        REGISTRY.gauge("weppo_sessions_detached", "Protocol v2 sessions waiting to be resumed").set_function(
+            lambda: sum(1 for s in list(sessions.values()) if not s.connected))
+
+    def create(self, thread_id: str, store: str, audio_format: Dict[str, Any], outbound) -> ResumableSession:
+        session = ResumableSession(thread_id, store, audio_format, outbound)
+        self._sessions[session.token] = session
+        self._publish(session)
+        return session
+
+    def _publish(self, session: ResumableSession):
+        """Record the resume token in the shared state, without blocking the event loop on the write."""
+        if self.state is None:
+            return
+        self.state.put_json(resume_key(session.token), {"thread_id": session.thread_id, "owner": self.owner})
+        asyncio.get_running_loop().run_in_executor(None, self.state.flush)
+
+    def _adopt(self, token: str) -> Optional[ResumableSession]:
+        """Load a session another worker started; it gets an outbound queue from the caller."""
+        self.state.invalidate(resume_key(token))
+        record = self.state.get_json(resume_key(token))
+        if not record:
+            return None
+        # Whatever this worker cached for the thread predates the other worker's turns
+        self.state.forget(record["thread_id"])
+        settings = self.state.get_json(session_key(record["thread_id"], SETTINGS))
+        if not settings:
+            return None
+        return ResumableSession(record["thread_id"], settings["store"], settings.get("audio"), None, token=token)
+
+    async def resume(self, token: Optional[str], websocket, last_seq: int = 0
+                     ) -> Optional[Tuple[ResumableSession, bool]]:
+        """
+        Reattach `websocket` to a detached session. Returns (session, replay_complete) or None.
+        A session adopted from another worker comes back with `outbound` set to None.
+        """
+        session = self._sessions.get(token) if token else None
+        if session is None and token and self.state is not None:
+            try:
+                session = await asyncio.get_running_loop().run_in_executor(None, self._adopt, token)
+            except Exception as e:
+                logger.warning("Could not look up resume token in session state: %s", e)
+            if session is not None:
+                self._sessions[token] = session
+                self._publish(session)
+                _resumes.inc(result="adopted")
+                logger.info("Adopted session %s from another worker", session.thread_id)
+                return session, False
+        if session is None:
+            _resumes.inc(result="expired" if token else "none")
+            return None
+        if session.connected:
+            # The old connection hasn't noticed the drop yet; take the session over
+            session.outbound.detach()
+        session.connected = True
+        session._generation += 1
+        complete = session.outbound.attach(websocket, last_seq)
+        _resumes.inc(result="resumed")
+        logger.info("Resumed session %s after reconnect (replay %s)", session.thread_id,
+                    "complete" if complete else "partial")
+        return session, complete
+
+    def detach(self, session: ResumableSession, websocket=None):
+        """The connection dropped: keep the session for `window` seconds, then close it."""
+        if session.outbound is None:
+            # Adopted, but the connection failed before it got a queue
+            self._sessions.pop(session.token, None)
+            return
+        current = session.outbound.websocket
+        if websocket is not None and current is not None and current is not websocket:
+            # Already resumed on a newer connection
+            return
+        session.connected = False
+        session.outbound.detach()
+        session._generation += 1
+        generation = session._generation
+        asyncio.get_running_loop().call_later(self.window, self._expire, session.token, generation)
+
+    def _expire(self, token: str, generation: int):
+        session = self._sessions.get(token)
+        if session is None or session.connected or session._generation != generation:
+            return
+        del self._sessions[token]
+        logger.debug("Resume window for %s expired", session.thread_id)
+        asyncio.ensure_future(session.outbound.close(timeout=0))
+        if self.state is not None:
+            asyncio.get_running_loop().run_in_executor(None, self._unpublish, token)
+
+    def _unpublish(self, token: str):
+        self.state.invalidate(resume_key(token))
+        record = self.state.get_json(resume_key(token))
+        # Another worker that adopted the session owns the record now
+        if record and record.get("owner") == self.owner:
+            self.state.delete(resume_key(token), flush=True)
+
+    @staticmethod
+    def ready_message(session: ResumableSession, resumed: bool, replay_complete: bool = True) -> str:
+        return json.dumps({
+            "status": "ready",
+            "protocol": VERSION,
+            "store": session.store,
+            "audio": session.audio_format,
+            "resume": session.token,
+            "resumed": resumed,
+            "replay_complete": replay_complete,
+        })
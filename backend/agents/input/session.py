@@ -0,0 +1,219 @@
+"""
+Voice session lifecycle.
+
+This module is responsible for:
+    - Owning what one voice connection holds beyond the event loop: the
+      speech-to-text stream and its recognizer thread, agent runs and TTS reads
+      on the executor, TTS iterators, background tasks and the agent thread id.
+    - Tearing all of it down in a fixed order when the connection ends, however
+      it ends (client close, dropped socket, rejection, server shutdown).
+    - Live counts of sessions, session threads and open recognition streams
+      (weppo_voice_sessions_live, weppo_voice_threads_live, weppo_stt_streams_open),
+      so leaks show up on /metrics as soon as they happen.
+
+Sessions are driven from the event loop; only TTSStream is used from threads.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+
+from backend.agents.input.speech_input import WebSocketStream
+from backend.agents.outils.metrics import REGISTRY, TRACER, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class SessionTracker:
+    """Process-wide counts of live voice sessions and the resources they hold."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self.sessions = 0
+        self.threads = 0
+        self.streams = 0
+        registry.gauge("weppo_voice_sessions_live", "Voice sessions not yet torn down").set_function(
+            lambda: self.sessions)
+        registry.gauge("weppo_voice_threads_live",
+                       "Executor calls still running for voice sessions, closed ones included").set_function(
+            lambda: self.threads)
+        registry.gauge("weppo_stt_streams_open", "Speech recognition streams still open").set_function(
+            lambda: self.streams)
+
+    def counts(self) -> Dict[str, int]:
+        return {"sessions": self.sessions, "threads": self.threads, "streams": self.streams}
+
+
+SESSIONS = SessionTracker()
+
+
+def _log_close_error(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.debug("Error closing TTS stream: %s", future.exception())
+
+
+class TTSStream:
+    """
+    A synchronous TTS audio iterator whose reads and close are serialized, so
+    it can be closed from one executor thread while another is still reading.
+    """
+
+    def __init__(self, iterator: Iterator[bytes]):
+        self._iterator = iterator
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def next_chunk(self, done: Any) -> Any:
+        """The next audio chunk, or `done` once the stream is exhausted or closed."""
+        with self._lock:
+            if self.closed:
+                return done
+            try:
+                return next(self._iterator)
+            except StopIteration:
+                return done
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                # Releases the synthesis request's connection
+                close()
+
+
+class VoiceSession:
+    """
+    Resources of one voice connection, released by `close()`.
+
+    Args:
+        thread_id: The agent thread id; updated when a protocol v2 session is resumed.
+        stream: Inbound audio for the recognizer. It is opened here, so audio that
+            arrives before the recognizer thread starts is buffered, not dropped.
+        close_timeout: Seconds `close()` waits for in-flight work before giving up
+            on it (WEPPO_SESSION_CLOSE_TIMEOUT).
+    """
+
+    def __init__(self, thread_id: str, stream: WebSocketStream, close_timeout: float = None,
+                 tracker: SessionTracker = SESSIONS):
+        self.thread_id = thread_id
+        self.stream = stream
+        self.close_timeout = close_timeout if close_timeout is not None else float(
+            os.environ.get("WEPPO_SESSION_CLOSE_TIMEOUT", 10))
+        self.tracker = tracker
+        self.recognition: Optional[asyncio.Future] = None
+        self.recognizing = False
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._tasks: Set[asyncio.Task] = set()
+        self._tts: Set[TTSStream] = set()
+        # Resolved when an executor call has actually returned; cancelling the
+        # future run_in_executor hands out doesn't stop its thread
+        self._running: Set[asyncio.Future] = set()
+        stream.__enter__()
+        tracker.sessions += 1
+
+    def _submit(self, func: Callable[..., Any], args: tuple, on_finish: Optional[Callable[[], None]] = None) -> asyncio.Future:
+        finished = self._loop.create_future()
+        self._running.add(finished)
+        self.tracker.threads += 1
+
+        def mark_finished():
+            self._running.discard(finished)
+            self.tracker.threads -= 1
+            if on_finish is not None:
+                on_finish()
+            if not finished.done():
+                finished.set_result(None)
+
+        def call(context: contextvars.Context):
+            try:
+                return context.run(func, *args)
+            finally:
+                try:
+                    self._loop.call_soon_threadsafe(mark_finished)
+                except RuntimeError:
+                    # The loop is gone (interpreter shutdown); nothing is left to count
+                    pass
+
+        # Runs in a copy of this context, so log records keep the session id
+        return self._loop.run_in_executor(None, call, contextvars.copy_context())
+
+    def run_in_thread(self, func: Callable[..., Any], *args: Any) -> asyncio.Future:
+        """Run a blocking call on the executor as part of this session."""
+        return self._submit(func, args)
+
+    def start_recognition(self, func: Callable[..., Any], *args: Any) -> asyncio.Future:
+        """Run the recognizer loop (which reads `stream`) on the executor; counted as an open stream until it returns."""
+        self.tracker.streams += 1
+        self.recognizing = True
+
+        def stream_closed():
+            self.recognizing = False
+            self.tracker.streams -= 1
+
+        self.recognition = self._submit(func, args, on_finish=stream_closed)
+        return self.recognition
+
+    def create_task(self, coro) -> asyncio.Task:
+        """Start a task that is cancelled if it outlives the session."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def tts_stream(self, iterator: Iterator[bytes]) -> TTSStream:
+        stream = TTSStream(iterator)
+        self._tts.add(stream)
+        return stream
+
+    def release_tts(self, stream: TTSStream):
+        """Close a finished or abandoned TTS stream; waits for an in-flight read on the executor, not on the loop."""
+        if stream in self._tts:
+            self._tts.discard(stream)
+            self.run_in_thread(stream.close).add_done_callback(_log_close_error)
+
+    async def _wait(self, futures: Set[asyncio.Future], timeout: float):
+        pending = {future for future in futures if not future.done()}
+        if pending and timeout > 0:
+            await asyncio.wait(pending, timeout=timeout)
+
+    async def close(self, drain: bool = False):
+        """
+        Tear the session down; safe to call more than once.
+
+        Ends the audio stream, then lets in-flight tasks finish (`drain`, e.g. a
+        turn a resumable client will be replayed) or cancels them, closes TTS
+        streams and waits for the session's executor calls. A recognizer still
+        running after `close_timeout` has its gRPC stream cancelled.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        deadline = self._loop.time() + self.close_timeout
+        try:
+            self.stream.close()
+            if drain:
+                await self._wait(set(self._tasks), self.close_timeout)
+            for task in list(self._tasks):
+                task.cancel()
+            await self._wait(set(self._tasks), 1.0)
+            for stream in list(self._tts):
+                self.release_tts(stream)
+
+            if self.recognizing:
+                await self._wait(set(self._running), deadline - self._loop.time())
+                if self.recognizing:
+                    logger.warning("Recognition stream of session %s did not end; cancelling it", self.thread_id)
+                    self.stream.abort()
+            await self._wait(set(self._running), max(deadline - self._loop.time(), 1.0))
+            if self._running:
+                logger.warning("Session %s closed with %d executor call(s) still running",
+                               self.thread_id, len(self._running))
+        finally:
+            TRACER.discard(self.thread_id)
+            self.tracker.sessions -= 1
@@ -7,40 +7,77 @@
 """
 
 from dotenv import load_dotenv
-from typing import List, Optional, Generator
-from google.cloud import speech
-from google.protobuf.duration_pb2 import Duration
-from backend.agents.input.microphone_stream import MicrophoneStream
+from typing import Callable, List, Optional, Generator
 import os
 import re
-import sys
 import queue
+import logging
+import threading
 load_dotenv()
+logger = logging.getLogger(__name__)
 # load google credentials
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+if os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 # Audio recording parameters
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms
 
+_speech_client = None
+_speech_client_lock = threading.Lock()
+
+
+def get_speech_client():
+    """Process-wide SpeechClient; its gRPC channel is shared by every session."""
+    global _speech_client
+    if _speech_client is None:
+        with _speech_client_lock:
+            if _speech_client is None:
+                # The gRPC speech client is heavy to import; load it at warm-up or with the first session
+                from google.cloud import speech
+                _speech_client = speech.SpeechClient()
+    return _speech_client
+
+
 class WebSocketStream:
     """Handles audio streaming from WebSocket connection."""
-    def __init__(self, rate: int = RATE, chunk: int = CHUNK):
+    def __init__(self, rate: int = RATE, chunk: int = CHUNK, transform: Optional[Callable[[bytes], bytes]] = None):
         self._rate = rate
         self._chunk = chunk
+        # Per-frame decoder to LINEAR16 at `rate` (see codecs.InboundAudio); runs in the recognizer's thread
+        self.transform = transform
         # Create a thread-safe buffer of audio data
         self._buff = queue.Queue()
         self.closed = True
+        # Set once closed for good; a later __enter__ (the recognizer's) must not reopen it
+        self._finished = False
+        # The streaming_recognize call reading this stream, so it can be cancelled
+        self.recognition = None
 
     def __enter__(self):
-        self.closed = False
+        if not self._finished:
+            self.closed = False
         return self
 
     def __exit__(self, type, value, traceback):
         """Closes the stream, regardless of whether the connection was lost or not."""
+        self.close()
+
+    def close(self):
+        """End the stream; the generator stops and the recognizer's request stream completes. Idempotent."""
+        if self._finished:
+            return
+        self._finished = True
         self.closed = True
         # Signal the generator to terminate
         self._buff.put(None)
 
+    def abort(self):
+        """Close the stream and cancel the recognition call reading it."""
+        self.close()
+        cancel = getattr(self.recognition, "cancel", None)
+        if cancel is not None:
+            cancel()
+
     def put_audio(self, audio_chunk):
         """Put an audio chunk into the buffer."""
         if not self.closed:
@@ -59,7 +96,7 @@ class WebSocketStream:
             chunk = self._buff.get()
             if chunk is None:
                 return
-            data = [chunk]
+            data = [self.transform(chunk) if self.transform else chunk]
 
             # Now consume whatever other data's still buffered.
             while True:
@@ -71,7 +108,7 @@ class WebSocketStream:
                         # and self.closed would be true, exiting the outer loop.
                         # However, if it can happen, log and exit.
                         return
-                    data.append(chunk)
+                    data.append(self.transform(chunk) if self.transform else chunk)
                 except queue.Empty:
                     break
 
@@ -80,9 +117,12 @@ class WebSocketStream:
 
 def speech_to_text(audio_stream: Optional[WebSocketStream] = None) -> Generator[str, None, None]:
     """Transcribe speech from audio stream and return the transcribed text."""
+    from google.cloud import speech
+    from google.protobuf.duration_pb2 import Duration
+
     timeout = Duration(seconds=7)
     language_code = "en-US"
-    client = speech.SpeechClient()
+    client = get_speech_client()
     config = speech.RecognitionConfig(
             encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
             sample_rate_hertz=RATE,
@@ -105,29 +145,26 @@ def speech_to_text(audio_stream: Optional[WebSocketStream] = None) -> Generator[
             for content in audio_generator
         )
         responses = client.streaming_recognize(streaming_config, requests)
+        stream.recognition = responses
 
         # Iterate over the transcripts yielded by listen_print_loop
         for transcript in listen_print_loop(responses):
             yield transcript
 
 def listen_print_loop(responses: object) -> Generator[str, None, None]:
-    """Iterates through server responses and prints them.
+    """Iterates through server responses and logs them.
     The responses passed is a generator that will block until a response
     is provided by the server.
     Each response may contain multiple results, and each result may contain
     multiple alternatives; for details, see https://goo.gl/tjCPAU. Here we
-    print only the transcription for the top alternative of the top result.
-    In this case, responses are provided for interim results as well. If the
-    response is an interim one, print a line feed at the end of it, to allow
-    the next result to overwrite it, until the response is a final one. For the
-    final one, print a newline to preserve the finalized transcription.
+    log only the transcription for the top alternative of the top result.
+    Interim results arrive many times per second, so they are logged at DEBUG
+    and sampled; final results are logged at INFO and yielded.
     Args:
         responses: List of server responses
     Returns:
         The transcribed text.
     """
-    num_chars_printed = 0
-    
     for response in responses:
         if not response.results:
             continue
@@ -139,29 +176,19 @@ def listen_print_loop(responses: object) -> Generator[str, None, None]:
         if not result.alternatives:
             continue
             
-        # Display the transcription of the top alternative.
+        # Log the transcription of the top alternative.
         current_transcript = result.alternatives[0].transcript
         
-        # Display interim results, but with a carriage return at the end of the
-        # line, so subsequent lines will overwrite them.
-        #
-        # If the previous result was longer than this one, we need to print
-        # some extra spaces to overwrite the previous result
-        overwrite_chars = " " * (num_chars_printed - len(current_transcript))
-        
         if not result.is_final:
-            sys.stdout.write(current_transcript + overwrite_chars + "\r")
-            sys.stdout.flush()
-            num_chars_printed = len(current_transcript)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Interim transcript: %s", current_transcript, extra={"sample": "stt_interim"})
         else:
-            sys.stdout.write(current_transcript + overwrite_chars + "\n")
-            sys.stdout.flush()
+            logger.info("Final transcript: %s", current_transcript)
             # Exit recognition if any of the transcribed phrases could be
             # one of our keywords.
             if re.search(r"\b(exit|quit)\b", current_transcript, re.I):
-                print("Exiting..") # Original print
+                logger.info("Exit keyword detected")
                 # If we want to stop the generator on "exit" or "quit", we might `return` here.
                 # For now, per instructions, we remove the break to allow continuous processing.
 
             yield current_transcript
-            num_chars_printed = 0
@@ -1,79 +1,270 @@
 import asyncio
-import websockets
-import queue 
-import re
+import contextvars
+import logging
+import os
+import time
+import uuid
 import json
-from google.cloud import speech
-from backend.agents.input.speech_input import speech_to_text, WebSocketStream
-from backend.agents.orchestrator.agent import PersonalShopperAgent
+from http import HTTPStatus
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+# The asyncio implementation (websockets >= 13): process_request(connection, request), connection.respond()
+from websockets.asyncio.server import serve
+from backend.agents.input.speech_input import speech_to_text, get_speech_client, WebSocketStream
+from backend.agents.orchestrator.agent_pool import AgentPool, UnknownStoreError
+from backend.agents.orchestrator.catalog_sync import CATALOG
 from backend.agents.input.elevenlabs import ElevenLabsTTS
+from backend.agents.input.admission import ADMITTED, DISCONNECTED, AdmissionController, FrameRateLimiter
+from backend.agents.input.outbound import DEFAULT_AUDIO_FORMAT, DOWNGRADE, DOWNGRADED_AUDIO_FORMAT, OutboundQueue
+from backend.agents.input.protocol import ACK, AUDIO, FrameEncoder, ProtocolError, SessionResumer, decode_frame
+from backend.agents.input.session import VoiceSession
+from backend.agents.output.filler import FILLERS
+from backend.agents.output.spoken import SPEECH, spoken_rendition
+from backend.agents.state.store import SETTINGS, SessionStateStore, default_state_store, session_key
+from backend.agents.outils.metrics import TRACER
+from backend.agents.outils.log_pipeline import session_id
+from backend.agents.outils.health import READINESS, Readiness
 
 """
 ws connection with client <-> server
 """
+logger = logging.getLogger(__name__)
+
 # Audio recording parameters
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms
 
+# Warm-up (WEPPO_WARMUP=0 skips it): a search to open the MCP connection pool, and phrases
+# spoken often enough to synthesize ahead of time (the agent's fallback answers by default)
+WARMUP_QUERY = os.environ.get("WEPPO_WARMUP_QUERY", "shoes")
+WARMUP_PHRASES = [
+    phrase for phrase in os.environ.get(
+        "WEPPO_WARMUP_PHRASES",
+        "I'm sorry, I couldn't process your request. Please try again.|"
+        "I apologize, but I encountered an issue formatting my response. Please try asking again.",
+    ).split("|") if phrase.strip()
+]
+
 class AudioWebSocketServer:
-    def __init__(self, host='localhost', port=8000, rate: int = RATE, chunk: int = CHUNK, store_domain: str = "www.allbirds.com"):
+    def __init__(self, host='localhost', port=8000, rate: int = RATE, chunk: int = CHUNK, store_domain: str = "www.allbirds.com",
+                 agent_pool: Optional[AgentPool] = None, readiness: Optional[Readiness] = None,
+                 admission: Optional[AdmissionController] = None, state: Optional[SessionStateStore] = None):
         self.host = host
         self.port = port
         self._rate = rate
         self._chunk = chunk
         self.clients = set()
-          # Initialize the agent
-        self.agent = PersonalShopperAgent(store_domain)
+        self.readiness = readiness or READINESS
+        # Session, agent-run and inbound frame limits (WEPPO_MAX_SESSIONS, WEPPO_MAX_AGENT_RUNS, ...)
+        self.admission = admission or AdmissionController()
+        self.max_frame_bytes = int(os.environ.get("WEPPO_MAX_FRAME_BYTES", 65536))
+        # Speak a short summary of each response instead of its markdown (WEPPO_SPOKEN_RENDITION=0 speaks it all)
+        self.spoken_rendition = os.environ.get("WEPPO_SPOKEN_RENDITION", "1") != "0"
+        # Session settings and resume tokens go to the shared session state (WEPPO_STATE_URL),
+        # so protocol v2 sessions can be resumed here or on any other worker
+        self.state = state or default_state_store()
+        self.resumer = SessionResumer(state=self.state)
+        # Per-store agents, built on first use; store_domain serves connections that don't name a store.
+        # A pool passed in is used even while empty (AgentPool defines __len__)
+        self.agents = agent_pool if agent_pool is not None else AgentPool(default_store=store_domain)
         # Initialize ElevenLabsTTS client
         self.tts_client = None
         try:
             self.tts_client = ElevenLabsTTS()
-            print("ElevenLabsTTS client initialized successfully.")
+            logger.info("ElevenLabsTTS client initialized successfully.")
         except ValueError as e:
-            print(f"WARNING: ElevenLabsTTS client initialization failed: {e}. TTS will not be available.")
+            logger.warning("ElevenLabsTTS client initialization failed: %s. TTS will not be available.", e)
         except Exception as e: # Catch any other unexpected errors during init
-            print(f"WARNING: An unexpected error occurred during ElevenLabsTTS initialization: {e}. TTS will not be available.")
+            logger.warning("An unexpected error occurred during ElevenLabsTTS initialization: %s. TTS will not be available.", e)
         
+    @staticmethod
+    def _store_from_path(websocket) -> Optional[str]:
+        """Store named in the connection URL: /store/<domain>, /<domain> or ?store=<domain>."""
+        request = getattr(websocket, "request", None)
+        path = getattr(request, "path", None) or getattr(websocket, "path", None) or ""
+        parts = urlsplit(path)
+        query_store = parse_qs(parts.query).get("store")
+        if query_store:
+            return query_store[0]
+        segments = [segment for segment in parts.path.split("/") if segment]
+        if segments and segments[0] == "store":
+            segments = segments[1:]
+        if segments and "." in segments[0]:
+            return segments[0]
+        return None
+
+    @staticmethod
+    def _parse_hello(message: str) -> Optional[dict]:
+        """Handshake sent as the first text frame, e.g. {"type": "hello", "store": "shop.example.com"}."""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return None
+        if isinstance(data, dict) and data.get("type") == "hello":
+            return data
+        return None
+
+    @staticmethod
+    def _check_hello(hello: Optional[dict]) -> int:
+        """Validate a hello frame's session fields and return its last_seq; raises ProtocolError."""
+        if not hello:
+            return 0
+        for field, types in (("store", (str,)), ("resume", (str,)), ("customer_id", (str, int))):
+            value = hello.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+                raise ProtocolError(f"Invalid hello field '{field}'")
+        last_seq = hello.get("last_seq") or 0
+        if isinstance(last_seq, bool) or not isinstance(last_seq, (int, str)):
+            raise ProtocolError("Invalid hello field 'last_seq'")
+        try:
+            last_seq = int(last_seq)
+        except ValueError:
+            raise ProtocolError("Invalid hello field 'last_seq'") from None
+        if last_seq < 0:
+            raise ProtocolError("Invalid hello field 'last_seq'")
+        return last_seq
+
+    def _negotiate_audio(self, spec: Optional[dict], ws_stream: WebSocketStream) -> dict:
+        """Set up decoding for the client's inbound audio format; raises ValueError if unsupported."""
+        if not spec:
+            return {"encoding": "linear16", "sample_rate": self._rate, "channels": 1}
+        # Compressed or higher-rate input is decoded and resampled before recognition;
+        # numpy is only loaded for clients that negotiate a format
+        from backend.agents.input.codecs import InboundAudio, negotiate
+        inbound_audio = InboundAudio(negotiate(spec, self._rate), self._rate)
+        if not inbound_audio.passthrough:
+            ws_stream.transform = inbound_audio.decode
+        return inbound_audio.format.as_dict()
+
+    def _process_request(self, connection, request):
+        """Answer health checks over plain HTTP and refuse sessions until warm-up has finished."""
+        path = urlsplit(request.path).path
+        if path == "/healthz":
+            return connection.respond(HTTPStatus.OK, "ok\n")
+        if path == "/ready":
+            status = HTTPStatus.OK if self.readiness.ready else HTTPStatus.SERVICE_UNAVAILABLE
+            return connection.respond(status, json.dumps(self.readiness.status()) + "\n")
+        if not self.readiness.ready:
+            return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "warming up\n")
+        return None
+
+    async def warm_up(self):
+        """
+        Build the default store's agent and its LangGraph graph, open the MCP,
+        Speech and TTS connections, run a search and pre-synthesize common
+        phrases, then report the worker ready. Independent steps run
+        concurrently; only a failed agent build keeps the worker unready.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def step(name, func, *args) -> bool:
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, func, *args)
+            except Exception as e:
+                self.readiness.record_step(name, time.perf_counter() - started, e)
+                logger.warning("Warm-up step %s failed: %s", name, e)
+                return False
+            self.readiness.record_step(name, time.perf_counter() - started)
+            logger.info("Warm-up step %s done in %.2fs", name, time.perf_counter() - started)
+            return True
+
+        def build_agent():
+            self.agents.acquire()
+            self.agents.release()
+
+        def search():
+            self.agents.get().tools[0].search_products(WARMUP_QUERY)
+
+        async def agent_then_search() -> bool:
+            if not await step("agent", build_agent):
+                return False
+            await step("search", search)
+            return True
+
+        steps = [agent_then_search(), step("speech", get_speech_client)]
+        if self.tts_client:
+            steps.append(step("tts", self.tts_client.prime, WARMUP_PHRASES))
+            if FILLERS.enabled:
+                # Clients may be switched to the downgraded format mid-session
+                formats = [DEFAULT_AUDIO_FORMAT]
+                if os.environ.get("WEPPO_OUTBOUND_POLICY", "").lower() == DOWNGRADE:
+                    formats.append(DOWNGRADED_AUDIO_FORMAT)
+                steps.append(step("filler", FILLERS.load, self.tts_client, formats))
+        agent_ok, *_ = await asyncio.gather(*steps)
+
+        if agent_ok:
+            self.readiness.mark_ready()
+            logger.info("Warm-up finished; worker is ready")
+        else:
+            logger.error("Agent warm-up failed; worker stays unready")
+
     async def handler(self, websocket):
         """Handle individual WebSocket connections."""
         self.clients.add(websocket)
-        print(f"DEBUG: New client connected: {websocket.remote_address}")
         process_task = None # Initialize process_task
+        session = None  # owns the STT stream, executor calls and TTS streams of this connection
+        agent = None
+        admitted = False
+        outbound = None
+        resumable = None  # protocol v2 session state
+        store = self._store_from_path(websocket)
+        customer_id = None  # from the hello frame; results are personalized for known customers
         
         # Generate a unique thread_id for this client session
-        client_thread_id = f"client_{id(websocket)}"
+        # Unique across workers and restarts, since conversation state outlives this process
+        client_thread_id = f"client_{uuid.uuid4().hex}"
+        # Every record logged while serving this connection carries its thread id
+        session_token = session_id.set(client_thread_id)
+        logger.debug("New client connected: %s", websocket.remote_address)
         try:
-            # Create WebSocket stream for this connection
+            # Past capacity, clients wait in a bounded queue with position updates or are turned away fast
+            async def send_position(position):
+                await websocket.send(json.dumps({"status": "queued", "position": position}))
+
+            admission = await self.admission.admit(send_position, websocket.wait_closed)
+            if admission != ADMITTED:
+                if admission != DISCONNECTED:
+                    logger.info("Turning client %s away (%s)", websocket.remote_address, admission)
+                    await websocket.send(json.dumps({"status": "busy", "error": "Server is at capacity, please retry shortly"}))
+                    await websocket.close(1013, "server busy")
+                return
+            admitted = True
+            frame_limiter = FrameRateLimiter()
+
+            # Create WebSocket stream for this connection; the session releases it and everything reading it
             ws_stream = WebSocketStream(self._rate, self._chunk)
+            session = VoiceSession(client_thread_id, ws_stream)
             
             # Define speech recognition task
             async def process_audio():
-                print(f"INFO: process_audio task started for client {websocket.remote_address}")
-                print("Starting speech recognition in executor...")
+                logger.info("process_audio task started for client %s", websocket.remote_address)
 
                 loop = asyncio.get_running_loop()
                 transcript_queue = asyncio.Queue()
                 processing_exception = None
 
-                # Synchronous wrapper function to run in executor
+                # Synchronous wrapper function to run in executor; asyncio.Queue isn't thread-safe,
+                # so segments and the sentinel are handed to the loop
                 def sync_speech_processor(stream, queue_obj):
                     nonlocal processing_exception
                     try:
-                        print("DEBUG: sync_speech_processor started...")
+                        logger.debug("sync_speech_processor started")
                         for segment in speech_to_text(stream):
-                            print(f"DEBUG: sync_speech_processor got segment: {segment}")
-                            queue_obj.put_nowait(segment)
-                        queue_obj.put_nowait(None)  # Sentinel to indicate end of processing
-                        print("DEBUG: sync_speech_processor finished...")
+                            logger.debug("sync_speech_processor got segment: %s", segment)
+                            loop.call_soon_threadsafe(queue_obj.put_nowait, segment)
+                        logger.debug("sync_speech_processor finished")
                     except Exception as e:
-                        print(f"ERROR: Exception in sync_speech_processor: {e}")
+                        logger.error("Exception in sync_speech_processor: %s", e)
                         processing_exception = e
-                        queue_obj.put_nowait(None)
-
-                print("DEBUG LE SANG 🇬🇧")
+                    finally:
+                        try:
+                            loop.call_soon_threadsafe(queue_obj.put_nowait, None)  # Sentinel to indicate end of processing
+                        except RuntimeError:
+                            pass  # loop already closed
 
                 # Start the synchronous generator in an executor (don't await it yet)
-                executor_task = loop.run_in_executor(None, sync_speech_processor, ws_stream, transcript_queue)
+                executor_task = session.start_recognition(sync_speech_processor, ws_stream, transcript_queue)
                 
                 # Create a task to consume from the queue concurrently
                 async def consume_transcripts():
@@ -83,34 +274,46 @@ class AudioWebSocketServer:
                             transcript_segment = await asyncio.wait_for(transcript_queue.get(), timeout=1.0)
                             
                             if transcript_segment is None:  # Sentinel received
-                                print("DEBUG: Received sentinel, breaking consume loop")
+                                logger.debug("Received sentinel, breaking consume loop")
                                 break
 
                             if processing_exception:
-                                print(f"ERROR: An exception occurred during speech processing: {processing_exception}. Breaking loop.")
+                                logger.error("An exception occurred during speech processing: %s. Breaking loop.", processing_exception)
                                 break
 
-                            print(f"Received transcript segment (from queue): {transcript_segment}")
+                            logger.debug("Received transcript segment (from queue): %s", transcript_segment)
                             if transcript_segment and transcript_segment.strip():
-                                await websocket.send(json.dumps({
+                                TRACER.mark(client_thread_id, "stt_final")
+                                TRACER.observe_between(client_thread_id, "stt", "audio_received", "stt_final")
+                                outbound.send(json.dumps({
                                     "transcript": transcript_segment,
                                     "is_final": True
                                 }))
 
                                 # Process with agent and get response
                                 try:
-                                    print(f"Processing transcript with agent: {transcript_segment}")
-                                    agent_response = await self.process_with_agent(transcript_segment, client_thread_id)
-                                    print(f"Agent response: {agent_response}")
+                                    logger.info("Processing transcript with agent: %s", transcript_segment)
+                                    agent_run = session.create_task(self.process_with_agent(
+                                        transcript_segment, client_thread_id, agent, customer_id, session))
+                                    # A slow answer is preceded by a short acknowledgement, queued whole
+                                    # before the answer's audio so the two never interleave
+                                    await self.play_filler(agent_run, outbound, resumable, client_thread_id,
+                                                           transcript_segment)
+                                    agent_response = await agent_run
+                                    logger.debug("Agent response: %s", agent_response)
+                                    # The screen gets the full markdown; TTS gets this
+                                    spoken_response = spoken_rendition(agent_response) if self.spoken_rendition else agent_response
                                     
                                     # Send agent response to client
-                                    await websocket.send(json.dumps({
+                                    outbound.send(json.dumps({
                                         "agent_response": agent_response,
+                                        "spoken": spoken_response,
                                         "transcript": transcript_segment
                                     }))
 
                                     # Start TTS streaming if client is available
                                     if self.tts_client:
+                                        tts_stream = None
                                         try:
                                             # TTS Streaming Protocol:
                                             # The client will receive a sequence of messages related to TTS streaming for the agent's response.
@@ -160,27 +363,34 @@ class AudioWebSocketServer:
                                             #    }
                                             #    The client should handle this gracefully, perhaps by informing the user that audio playback failed.
                                             #
+                                            # 5. Filler Audio (optional):
+                                            #    If the agent takes longer than WEPPO_FILLER_AFTER seconds, a short acknowledgement is
+                                            #    sent first as its own tts_starting / audio / tts_finished sequence, with "filler": true
+                                            #    and its "text" in both notifications. It always ends before the answer's tts_starting,
+                                            #    so clients can play it as-is and queue the answer behind it.
+                                            #
                                             # The `transcript` field in these messages helps associate the TTS audio with the specific part of the conversation.
-                                            await websocket.send(json.dumps({"status": "tts_starting", "transcript": transcript_segment}))
-                                            print(f"Streaming TTS for agent response: '{agent_response}' related to transcript: '{transcript_segment}'")
+                                            audio_stream = resumable.next_audio_stream() if resumable else None
+                                            outbound.send_media(json.dumps({"status": "tts_starting", "transcript": transcript_segment}))
+                                            TRACER.mark(client_thread_id, "tts_start")
+                                            logger.debug("Streaming TTS for transcript: '%s'", transcript_segment)
 
-                                            # Define sentinel and helper for more robust TTS stream handling
+                                            # Sentinel for the end of the TTS stream
                                             _TTS_STREAM_DONE = object()
-                                            def _get_next_chunk_sync(iterator, sentinel_on_done):
-                                                try:
-                                                    return next(iterator)
-                                                except StopIteration:
-                                                    return sentinel_on_done
-                                                # Other exceptions from the iterator will propagate
 
-                                            # Get audio stream from ElevenLabsTTS (which is a synchronous iterator)
-                                            loop = asyncio.get_running_loop()
-                                            audio_iterator = self.tts_client.stream_audio(agent_response)
+                                            # Get audio stream from ElevenLabsTTS (which is a synchronous iterator);
+                                            # the session closes it if the client leaves mid-synthesis
+                                            audio_format = outbound.audio_format
+                                            tts_stream = session.tts_stream(
+                                                self.tts_client.stream_audio(spoken_response, output_format=audio_format))
+                                            first_audio_sent = False
+                                            audio_bytes = 0
 
                                             # Stream audio chunks to client
                                             while True:
-                                                audio_chunk_or_sentinel = await loop.run_in_executor(
-                                                    None, _get_next_chunk_sync, audio_iterator, _TTS_STREAM_DONE
+                                                # Other exceptions from the iterator will propagate
+                                                audio_chunk_or_sentinel = await session.run_in_thread(
+                                                    tts_stream.next_chunk, _TTS_STREAM_DONE
                                                 )
 
                                                 if audio_chunk_or_sentinel is _TTS_STREAM_DONE:
@@ -189,29 +399,46 @@ class AudioWebSocketServer:
 
                                                 # If not sentinel, it's an audio chunk
                                                 if audio_chunk_or_sentinel: # Ensure chunk has content
-                                                    await websocket.send(audio_chunk_or_sentinel)
+                                                    audio_bytes += len(audio_chunk_or_sentinel)
+                                                    if not first_audio_sent:
+                                                        first_audio_sent = True
+                                                        TRACER.mark(client_thread_id, "tts_first_byte")
+                                                        TRACER.observe_between(client_thread_id, "tts_first_byte", "tts_start", "tts_first_byte")
+                                                        TRACER.observe_between(client_thread_id, "time_to_first_audio", "stt_final", "tts_first_byte")
+                                                        self._first_audio(client_thread_id)
+                                                    # Waits here (pausing synthesis) while the client is behind
+                                                    if not await outbound.put_audio(audio_chunk_or_sentinel, audio_stream):
+                                                        break
 
-                                            await websocket.send(json.dumps({"status": "tts_finished", "transcript": transcript_segment}))
-                                            print(f"TTS streaming finished for transcript: '{transcript_segment}'")
+                                            session.release_tts(tts_stream)
+                                            SPEECH.record(agent_response, spoken_response, audio_bytes, audio_format)
+                                            TRACER.mark(client_thread_id, "tts_done")
+                                            TRACER.observe_between(client_thread_id, "tts", "tts_start", "tts_done")
+                                            outbound.send_media(json.dumps({"status": "tts_finished", "transcript": transcript_segment}))
+                                            logger.debug("TTS streaming finished for transcript: '%s'", transcript_segment)
                                         except Exception as e_tts:
-                                            # Catches errors from run_in_executor (if _get_next_chunk_sync itself fails, or underlying iterator fails)
-                                            # or from websocket.send()
-                                            print(f"ERROR: TTS streaming error for transcript '{transcript_segment}': {e_tts}")
+                                            # Catches errors from the executor (if tts_stream.next_chunk itself fails, or underlying iterator fails)
+                                            # or from queueing audio on the outbound scheduler
+                                            logger.error("TTS streaming error for transcript '%s': %s", transcript_segment, e_tts)
+                                            if tts_stream is not None:
+                                                session.release_tts(tts_stream)
                                             # No need to check for StopIteration here as it's handled by the sentinel
-                                            await websocket.send(json.dumps({
+                                            outbound.send_media(json.dumps({
                                                 "status": "tts_error",
                                                     "error": str(e_tts),
                                                     "transcript": transcript_segment
                                                 }))
                                     else:
-                                        print(f"Skipping TTS for transcript '{transcript_segment}' because TTS client is not available.")
+                                        logger.debug("Skipping TTS for transcript '%s' because TTS client is not available.", transcript_segment)
 
                                 except Exception as e:
-                                    print(f"ERROR: Exception processing with agent: {e}")
-                                    await websocket.send(json.dumps({
+                                    logger.error("Exception processing with agent: %s", e)
+                                    outbound.send(json.dumps({
                                         "error": f"Agent processing error: {str(e)}",
                                         "transcript": transcript_segment
                                     }))
+                                finally:
+                                    TRACER.end_turn(client_thread_id)
                             
                             transcript_queue.task_done()
                             
@@ -231,64 +458,225 @@ class AudioWebSocketServer:
                             continue
 
                 # Start consuming transcripts concurrently
-                consume_task = asyncio.create_task(consume_transcripts())
+                consume_task = session.create_task(consume_transcripts())
                 
                 # Wait for both the executor and consumer to complete
                 await asyncio.gather(executor_task, consume_task, return_exceptions=True)
                 
-                print("DEBUG: Both executor and consumer tasks completed")
+                logger.debug("Both executor and consumer tasks completed")
 
                 if processing_exception:
-                    print(f"ERROR: Final check: Speech processing encountered an error for ws_stream {id(ws_stream)}: {processing_exception}")
+                    logger.error("Final check: Speech processing encountered an error for ws_stream %s: %s", id(ws_stream), processing_exception)
 
             # Handle incoming audio chunks
             async for message in websocket:
                 if not message:
                     continue
 
+                if not frame_limiter.allow():
+                    if frame_limiter.abusive:
+                        logger.warning("Closing client %s: inbound frame rate limit exceeded", websocket.remote_address)
+                        await websocket.close(1008, "frame rate limit exceeded")
+                        break
+                    continue
+
+                if agent is None:
+                    # The store is fixed by the URL or by a hello frame sent before any audio
+                    hello = self._parse_hello(message) if isinstance(message, str) else None
+                    try:
+                        last_seq = self._check_hello(hello)
+                    except ProtocolError as e:
+                        logger.warning("Rejecting client %s: %s", websocket.remote_address, e)
+                        await websocket.send(json.dumps({"error": str(e)}))
+                        await websocket.close(1002, "protocol error")
+                        return
+                    if hello and hello.get("store"):
+                        store = str(hello["store"])
+                    if hello and hello.get("customer_id"):
+                        customer_id = str(hello["customer_id"])
+                    protocol = 2 if hello and hello.get("protocol") == 2 else 1
+                    replay_complete = True
+                    if protocol == 2:
+                        # A v2 client reconnecting after a drop gets its agent thread and unsent frames back
+                        resumed = await self.resumer.resume(hello.get("resume"), websocket, last_seq)
+                        if resumed:
+                            resumable, replay_complete = resumed
+                            store = resumable.store
+                            client_thread_id = resumable.thread_id
+                            session.thread_id = client_thread_id
+                            session_id.set(client_thread_id)
+                            outbound = resumable.outbound
+                    try:
+                        audio_spec = resumable.audio_format if resumable else (hello or {}).get("audio")
+                        audio_format = self._negotiate_audio(audio_spec, ws_stream)
+                        store = self.agents.resolve(store)
+                        agent = await self.agents.aacquire(store)
+                    except UnknownStoreError as e:
+                        logger.warning("Rejecting client %s: %s", websocket.remote_address, e)
+                        await websocket.send(json.dumps({"error": str(e)}))
+                        await websocket.close(1008, "unknown store")
+                        return
+                    except (ValueError, TypeError) as e:
+                        logger.warning("Rejecting client %s: %s", websocket.remote_address, e)
+                        await websocket.send(json.dumps({"error": str(e)}))
+                        await websocket.close(1003, "unsupported audio format")
+                        return
+
+                    # Flushed with the resume token (v2) or the session's first turn
+                    self.state.put_json(session_key(client_thread_id, SETTINGS),
+                                        {"store": store, "audio": audio_format, "protocol": protocol})
+
+                    # All sends for this session go through one writer task: control messages first,
+                    # audio bounded by WEPPO_OUTBOUND_MAX_BYTES with the WEPPO_OUTBOUND_POLICY for slow clients
+                    if resumable is not None:
+                        if outbound is None:
+                            # Adopted from another worker; its unsent frames didn't come along
+                            outbound = OutboundQueue(websocket, client_thread_id, encoder=FrameEncoder()).start()
+                            resumable.outbound = outbound
+                        outbound.send(SessionResumer.ready_message(resumable, True, replay_complete))
+                    elif protocol == 2:
+                        outbound = OutboundQueue(websocket, client_thread_id, encoder=FrameEncoder()).start()
+                        resumable = self.resumer.create(client_thread_id, store, audio_format, outbound)
+                        outbound.send(SessionResumer.ready_message(resumable, False))
+                    else:
+                        outbound = OutboundQueue(websocket, client_thread_id).start()
+                        outbound.send(json.dumps({"status": "ready", "store": store, "audio": audio_format}))
+
+                if isinstance(message, str):
+                    # Text frames are control messages; only binary frames carry audio
+                    continue
+
+                if resumable is not None:
+                    # Protocol v2: typed, sequenced binary frames
+                    try:
+                        frame_type, _, seq, _, payload = decode_frame(message)
+                    except ProtocolError as e:
+                        logger.warning("Closing client %s: %s", websocket.remote_address, e)
+                        await websocket.close(1002, "protocol error")
+                        break
+                    if frame_type == ACK:
+                        outbound.encoder.ack(seq)
+                        continue
+                    if frame_type != AUDIO or not resumable.accept_inbound(seq):
+                        continue
+                    message = payload
+
                 if process_task is None:
-                    print("First audio chunk received. Starting speech recognition task.")
-                    process_task = asyncio.create_task(process_audio())
+                    logger.debug("First audio chunk received. Starting speech recognition task.")
+                    process_task = session.create_task(process_audio())
 
-                ws_stream.put_audio(message)
-            
-            # Close the stream (signals generator to stop)
-            await ws_stream.__exit__(None, None, None)
+                TRACER.mark(client_thread_id, "audio_received", once=True)
 
-            # Wait for the processing task to complete, if it was started
-            if process_task:
-                await process_task
+                ws_stream.put_audio(message)
                 
         finally:
+            if session is not None:
+                # Ends recognition and releases the session's threads, streams and tasks, however the
+                # connection ended; a resumable client's in-flight turn may finish so it can be replayed
+                await session.close(drain=resumable is not None)
+            if resumable is not None:
+                # Kept for WEPPO_RESUME_WINDOW seconds so the client can pick up where it left off
+                self.resumer.detach(resumable, websocket)
+            elif outbound is not None:
+                await outbound.close()
             self.clients.remove(websocket)
+            if agent is not None:
+                self.agents.release(store)
+            if admitted:
+                self.admission.release()
+            TRACER.discard(client_thread_id)
+            session_id.reset(session_token)
 
-    async def process_with_agent(self, transcript: str, thread_id: str) -> str:
-        """Process transcript with the agent in a separate thread to avoid blocking."""
+    @staticmethod
+    def _first_audio(thread_id: str):
+        """Record perceived time to first audio: the filler's or, without one, the answer's."""
+        if TRACER.since(thread_id, "first_audio") is None:
+            TRACER.mark(thread_id, "first_audio")
+            TRACER.observe_between(thread_id, "perceived_time_to_first_audio", "stt_final", "first_audio")
+
+    async def play_filler(self, agent_run: asyncio.Future, outbound: OutboundQueue, resumable, thread_id: str,
+                          transcript: str) -> bool:
+        """
+        Queue a pre-synthesized acknowledgement if `agent_run` hasn't finished
+        within FILLERS.after seconds. Returns whether one was queued.
+        """
+        if not self.tts_client or not FILLERS.enabled:
+            return False
+        done, _ = await asyncio.wait({agent_run}, timeout=FILLERS.after)
+        if done:
+            FILLERS.played(False)
+            return False
+        clip = FILLERS.next_clip(outbound.audio_format)
+        if clip is None:
+            return False
+        phrase, audio = clip
+        audio_stream = resumable.next_audio_stream() if resumable else None
+        outbound.send_media(json.dumps({"status": "tts_starting", "filler": True, "text": phrase, "transcript": transcript}))
+        self._first_audio(thread_id)
+        await outbound.put_audio(audio, audio_stream)
+        outbound.send_media(json.dumps({"status": "tts_finished", "filler": True, "text": phrase, "transcript": transcript}))
+        FILLERS.played(True)
+        logger.debug("Played filler '%s' while the agent works on '%s'", phrase, transcript)
+        return True
+
+    async def process_with_agent(self, transcript: str, thread_id: str, agent=None, customer_id: Optional[str] = None,
+                                 session: Optional[VoiceSession] = None) -> str:
+        """
+        Process transcript with the agent in a separate thread to avoid blocking.
+        Timed as the turn's agent stage, which ends with the answer even while a filler is still queueing.
+        """
+        with TRACER.span(thread_id, "agent"):
+            return await self._run_agent(transcript, thread_id, agent, customer_id, session)
+
+    async def _run_agent(self, transcript: str, thread_id: str, agent, customer_id: Optional[str],
+                         session: Optional[VoiceSession]) -> str:
         loop = asyncio.get_running_loop()
-        print(f"TESTPRINT:")
+        if agent is None:
+            # Default store's agent; it stays pooled after this call
+            agent = await self.agents.aacquire()
+            self.agents.release()
         
         # Run the agent chat in an executor since it's synchronous
         def run_agent_chat():
             try:
-                return self.agent.chat(transcript, thread_id)
+                return agent.chat(transcript, thread_id, customer_id)
             except Exception as e:
-                print(f"ERROR: Agent chat error: {e}")
+                logger.error("Agent chat error: %s", e)
                 return f"I encountered an error processing your request: {str(e)}"
         
-        # Execute in thread pool
-        response = await loop.run_in_executor(None, run_agent_chat)
+        # Execute in thread pool, keeping the session context for logging; at most WEPPO_MAX_AGENT_RUNS at once
+        async with self.admission.agent_run():
+            if session is not None:
+                response = await session.run_in_thread(run_agent_chat)
+            else:
+                response = await loop.run_in_executor(None, contextvars.copy_context().run, run_agent_chat)
         return response   
 
     async def start(self):
         """Start the WebSocket server."""
-        server = await websockets.serve(
+        server = await serve(
             self.handler,
             self.host,
-            self.port
+            self.port,
+            process_request=self._process_request,
+            max_size=self.max_frame_bytes,  # larger frames close the connection with 1009
         )
         print(f"WebSocket server started at ws://{self.host}:{self.port}")
-        print(f"Agent initialized for store domain: www.allbirds.com")
-        await server.wait_closed()
+        print(f"Default store domain: {self.agents.default_store}")
+        eviction_task = asyncio.create_task(self.agents.run_idle_eviction())
+        # Catches catalog changes whose webhooks never arrived (WEPPO_CATALOG_DIGEST_URL)
+        reconcile_task = asyncio.create_task(CATALOG.run_reconciliation()) if CATALOG.digest_url else None
+        # Health checks are answered while warming up; /ready and sessions wait for it
+        if os.environ.get("WEPPO_WARMUP", "1") != "0":
+            await self.warm_up()
+        else:
+            self.readiness.mark_ready()
+        try:
+            await server.wait_closed()
+        finally:
+            eviction_task.cancel()
+            if reconcile_task:
+                reconcile_task.cancel()
 
 if __name__ == "__main__":
     server = AudioWebSocketServer()
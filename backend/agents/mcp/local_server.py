@@ -0,0 +1,307 @@
+"""
+Local stand-in for the Storefront MCP server.
+
+This module is responsible for:
+    - Serving `tools/call` / `search_shop_catalog` JSON-RPC requests over a fixture catalog.
+    - Injecting latency, errors, slow bodies and timeouts so the search path
+      can be load-tested and benchmarked without a live store.
+
+Point `ShopifyMCPServer` at it with `SHOPIFY_MCP_URL=http://127.0.0.1:8765/api/mcp`.
+
+Usage:
+    python -m backend.agents.mcp.local_server --port 8765 --latency lognormal:80,0.5 --error-rate 0.02
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "catalog.json")
+PAGE_SIZE = 10
+
+
+class LatencyModel:
+    """
+    Samples an artificial response delay in milliseconds.
+
+    Supported distributions: constant:<ms>, uniform:<lo>,<hi>, normal:<mean>,<stddev>,
+    lognormal:<median>,<sigma> and exponential:<mean>.
+    """
+
+    def __init__(self, spec: str = "constant:0", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self._rng = rng or random.Random()
+        kind, _, raw_params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in raw_params.split(",") if p.strip()]
+        expected = {"constant": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+        if self.kind not in expected:
+            raise ValueError(f"Unknown latency distribution: {self.kind}")
+        if len(self.params) != expected[self.kind]:
+            raise ValueError(f"Latency '{self.kind}' expects {expected[self.kind]} parameter(s), got '{raw_params}'")
+
+    def sample_ms(self) -> float:
+        p = self.params
+        if self.kind == "constant":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = self._rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = self._rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            # Parameterised by the median so specs read naturally ("lognormal:80,0.5")
+            value = self._rng.lognormvariate(0.0, p[1]) * p[0]
+        else:
+            value = self._rng.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+class FaultConfig:
+    """Fault injection settings for the stand-in server."""
+
+    def __init__(
+        self,
+        latency: str = "constant:0",
+        error_rate: float = 0.0,
+        rpc_error_rate: float = 0.0,
+        slow_body_rate: float = 0.0,
+        slow_body_chunk_delay_ms: float = 200.0,
+        timeout_rate: float = 0.0,
+        hang_seconds: float = 60.0,
+        seed: Optional[int] = None,
+    ):
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.error_rate = error_rate
+        self.rpc_error_rate = rpc_error_rate
+        self.slow_body_rate = slow_body_rate
+        self.slow_body_chunk_delay_ms = slow_body_chunk_delay_ms
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self._lock = threading.Lock()
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self.rng.random() < rate
+
+    def delay_seconds(self) -> float:
+        with self._lock:
+            return self.latency.sample_ms() / 1000.0
+
+
+class FixtureCatalog:
+    """Keyword search over a JSON fixture shaped like a `search_shop_catalog` payload."""
+
+    def __init__(self, path: str = DEFAULT_CATALOG):
+        with open(path) as f:
+            data = json.load(f)
+        self.products: List[Dict[str, Any]] = data.get("products", [])
+        self.filters: List[Dict[str, Any]] = data.get("available_filters", [])
+        self._documents = [self._document(p) for p in self.products]
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return re.findall(r"[a-z0-9]+", text.lower().replace("'s", ""))
+
+    def _document(self, product: Dict[str, Any]) -> set:
+        text = " ".join([
+            product.get("title", ""),
+            product.get("description", ""),
+            product.get("product_type", ""),
+            " ".join(product.get("tags", [])),
+        ])
+        return set(self._tokens(text))
+
+    def search(self, query: str, page: int = 1) -> Dict[str, Any]:
+        terms = [t for t in self._tokens(query) if len(t) > 1]
+        scored: List[Tuple[int, int]] = []
+        for index, document in enumerate(self._documents):
+            score = sum(1 for term in terms if term in document or term.rstrip("s") in document)
+            if score or not terms:
+                scored.append((score, index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        matches = [self.products[index] for _, index in scored]
+
+        max_pages = max(1, -(-len(matches) // PAGE_SIZE))
+        page = min(max(page, 1), max_pages)
+        start = (page - 1) * PAGE_SIZE
+        return {
+            "products": matches[start:start + PAGE_SIZE],
+            "pagination": {
+                "currentPage": page,
+                "maxPages": max_pages,
+                "hasNextPage": page < max_pages,
+            },
+            "available_filters": self.filters,
+        }
+
+
+class _MCPRequestHandler(BaseHTTPRequestHandler):
+    server_version = "WeppoLocalMCP/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def do_POST(self):
+        faults: FaultConfig = self.server.faults
+        catalog: FixtureCatalog = self.server.catalog
+
+        if self.path.rstrip("/") != "/api/mcp":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}})
+            return
+
+        self.server.count("requests")
+
+        # Timeout: hold the connection without answering, then drop it
+        if faults.roll(faults.timeout_rate):
+            self.server.count("timeouts")
+            time.sleep(faults.hang_seconds)
+            self.close_connection = True
+            return
+
+        time.sleep(faults.delay_seconds())
+
+        if faults.roll(faults.error_rate):
+            self.server.count("errors")
+            self._send_json(500, {"error": "injected server error"})
+            return
+
+        request_id = request.get("id")
+        if faults.roll(faults.rpc_error_rate):
+            self.server.count("errors")
+            self._send_json(200, {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32603, "message": "Injected internal error"},
+            })
+            return
+
+        self._send_json(200, self._dispatch(request, catalog), slow=faults.roll(faults.slow_body_rate))
+
+    def _dispatch(self, request: Dict[str, Any], catalog: FixtureCatalog) -> Dict[str, Any]:
+        request_id = request.get("id")
+        params = request.get("params") or {}
+        if request.get("method") != "tools/call":
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32601, "message": "Method not found"}}
+        if params.get("name") != "search_shop_catalog":
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32602, "message": f"Unknown tool: {params.get('name')}"}}
+
+        arguments = params.get("arguments") or {}
+        payload = catalog.search(str(arguments.get("query", "")), int(arguments.get("page", 1) or 1))
+        return {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "content": [{"type": "text", "text": json.dumps(payload)}],
+                "isError": False,
+            },
+        }
+
+    def _send_json(self, status: int, body: Dict[str, Any], slow: bool = False):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if not slow:
+            self.wfile.write(data)
+            return
+
+        # Slow body: trickle the payload out in small chunks
+        self.server.count("slow_bodies")
+        delay = self.server.faults.slow_body_chunk_delay_ms / 1000.0
+        step = max(1, len(data) // 8)
+        for start in range(0, len(data), step):
+            self.wfile.write(data[start:start + step])
+            self.wfile.flush()
+            time.sleep(delay)
+
+
+class LocalMCPServer(ThreadingHTTPServer):
+    """Threaded HTTP server exposing the fixture catalog at /api/mcp."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765,
+                 catalog_path: str = DEFAULT_CATALOG, faults: Optional[FaultConfig] = None):
+        super().__init__((host, port), _MCPRequestHandler)
+        self.catalog = FixtureCatalog(catalog_path)
+        self.faults = faults or FaultConfig()
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "slow_bodies": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/mcp"
+
+    def start_in_thread(self) -> threading.Thread:
+        """Serve from a daemon thread; call `shutdown()` to stop."""
+        thread = threading.Thread(target=self.serve_forever, name="local-mcp-server", daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local stand-in Shopify MCP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="Path to the fixture catalog JSON")
+    parser.add_argument("--latency", default="constant:0",
+                        help="constant:<ms> | uniform:<lo>,<hi> | normal:<mean>,<sd> | lognormal:<median>,<sigma> | exponential:<mean>")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--rpc-error-rate", type=float, default=0.0, help="Fraction of requests answered with a JSON-RPC error")
+    parser.add_argument("--slow-body-rate", type=float, default=0.0, help="Fraction of responses whose body is trickled out")
+    parser.add_argument("--slow-body-chunk-delay-ms", type=float, default=200.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that never get a response")
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    faults = FaultConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rpc_error_rate=args.rpc_error_rate,
+        slow_body_rate=args.slow_body_rate,
+        slow_body_chunk_delay_ms=args.slow_body_chunk_delay_ms,
+        timeout_rate=args.timeout_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed,
+    )
+    server = LocalMCPServer(args.host, args.port, args.catalog, faults)
+    logger.info(f"Local MCP server listening at {server.url} ({len(server.catalog.products)} products)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
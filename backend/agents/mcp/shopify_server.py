@@ -1,28 +1,91 @@
 """
 This module is responsible for:
-    - Connecting to the Shopify MCP server.
+    - Connecting to the Shopify MCP server, from blocking code (requests) and
+      from the event loop (httpx, imported on first async use).
 """
 
+import asyncio
 import requests
-from typing import Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional
 import logging
 import json
+import os
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ShopifyMCPServer:
     """
     Storefront MCP server
+
+    The endpoint defaults to `https://{domain}/api/mcp`. Set `SHOPIFY_MCP_URL`
+    (optionally containing a `{domain}` placeholder) to point every client at
+    another server, e.g. the local stand-in in `local_server.py`.
     """
-    def __init__(self, store_domain: str):
+    def __init__(self, store_domain: str, server_url: Optional[str] = None, timeout: Optional[float] = None):
         # Clean the domain - remove protocol and trailing slashes
         self.store_domain = store_domain.replace('https://', '').replace('http://', '').replace('www.', '').rstrip('/')
-        self.server_url = f"https://{self.store_domain}/api/mcp"
-        self.timeout = 30  # Request timeout in seconds
-        logger.info(f"Initialized Shopify MCP Server for domain: {self.store_domain}")
+        url_template = server_url or os.environ.get('SHOPIFY_MCP_URL') or "https://{domain}/api/mcp"
+        self.server_url = url_template.format(domain=self.store_domain)
+        # Request timeout in seconds
+        self.timeout = timeout if timeout is not None else float(os.environ.get('SHOPIFY_MCP_TIMEOUT') or 30)
+        # Bumped whenever the catalog is known to have changed; caches key on it
+        self.catalog_version = 0
+        # Keep-alive connection pool, sized for concurrent multi-query fan-out
+        pool_size = int(os.environ.get('SHOPIFY_MCP_POOL_SIZE', 8))
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.pool_size = pool_size
+        # httpx.AsyncClient for async searches, bound to the event loop it was created on
+        self._async_client = None
+        self._async_loop = None
+        logger.info(f"Initialized Shopify MCP Server for domain: {self.store_domain} ({self.server_url})")
     
+    def close(self):
+        """Close pooled connections."""
+        self.session.close()
+        client, self._async_client = self._async_client, None
+        self._close_async_client(client, self._async_loop)
+
+    def _close_async_client(self, client, loop: Optional[asyncio.AbstractEventLoop]):
+        """Close an httpx client from the loop that owns it; its connections can't be closed from another."""
+        if client is None:
+            return
+        if loop is not None and loop.is_running():
+            closing = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            closing.add_done_callback(
+                lambda f: f.cancelled() or f.exception() is None or logger.debug("Error closing async MCP client: %s",
+                                                                                 f.exception()))
+            return
+        # Its loop has stopped (e.g. a finished asyncio.run); the connections go when the client is collected
+        logger.debug("Dropping async MCP client for %s: its event loop is no longer running", self.store_domain)
+
+    async def aclose(self):
+        """Close pooled connections from the event loop."""
+        self.session.close()
+        client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.aclose()
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            import httpx
+            # A client from another loop can't be used here; close it before replacing it
+            self._close_async_client(self._async_client, self._async_loop)
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    def bump_catalog_version(self) -> int:
+        """Mark every cached view of the catalog as stale."""
+        self.catalog_version += 1
+        return self.catalog_version
+
     def get_products(self, query: str):
         """
           Get products from the Shopify store based on query.
@@ -35,48 +98,58 @@ class ShopifyMCPServer:
         
         """
         try:
-            logger.info(f"Making request to {self.server_url} with query: {query}")
-            response = requests.post(self.server_url,
-                headers={
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'jsonrpc': '2.0',
-                    'method': 'tools/call',
-                    'id': 1,
-                    'params': {
-                        'name': 'search_shop_catalog',
-                        'arguments': {
-                            'query': query,
-                            'context': 'retrieve only the products from the catalog'
-                        }
-                    }
-                },
-                timeout=self.timeout
-            )
+            logger.debug("Making request to %s with query: %s", self.server_url, query)
+            response = self.session.post(self.server_url, headers={'Content-Type': 'application/json'},
+                                         json=self._search_request(query), timeout=self.timeout)
             response.raise_for_status()  # Raise an exception for bad status codes
-            result = response.json()
-            
-
-            
-            # Log specific parts of the response
-            if 'result' in result:
-                if 'products' in result['result']:
-                    products = result['result']['products']
-                    print("==" * 30)
-                    logger.info(f"Number of products found: {len(products)}")
-                    print("==" * 30)
-                    if products:
-                        logger.info("First product structure:")
-                else:
-                    logger.warning("No 'products' key in result")
-            else:
-                logger.warning("No 'result' key in response")
-            
-            return result
+            return self._checked(response.json())
         except requests.exceptions.RequestException as e:
-            logger.error(f"Request failed: {str(e)}")
+            logger.error("Request failed: %s", e)
             return {"error": str(e)}
         except ValueError as e:
-            logger.error(f"Failed to parse JSON response: {str(e)}")
+            logger.error("Failed to parse JSON response: %s", e)
+            return {"error": "Invalid JSON response"}
+
+    async def aget_products(self, query: str) -> Dict[str, Any]:
+        """
+        Same as `get_products`, without blocking the event loop.
+        """
+        import httpx
+        try:
+            logger.debug("Making async request to %s with query: %s", self.server_url, query)
+            response = await self._get_async_client().post(
+                self.server_url, headers={'Content-Type': 'application/json'}, json=self._search_request(query)
+            )
+            response.raise_for_status()
+            return self._checked(response.json())
+        except httpx.HTTPError as e:
+            logger.error("Request failed: %s", e)
+            return {"error": str(e) or type(e).__name__}
+        except ValueError as e:
+            logger.error("Failed to parse JSON response: %s", e)
             return {"error": "Invalid JSON response"}
+
+    @staticmethod
+    def _search_request(query: str) -> Dict[str, Any]:
+        return {
+            'jsonrpc': '2.0',
+            'method': 'tools/call',
+            'id': 1,
+            'params': {
+                'name': 'search_shop_catalog',
+                'arguments': {
+                    'query': query,
+                    'context': 'retrieve only the products from the catalog'
+                }
+            }
+        }
+
+    @staticmethod
+    def _checked(result: Dict[str, Any]) -> Dict[str, Any]:
+        # Log specific parts of the response
+        if 'result' in result:
+            if 'products' in result['result']:
+                logger.debug("Number of products found: %d", len(result['result']['products']))
+        else:
+            logger.warning("No 'result' key in response")
+        return result
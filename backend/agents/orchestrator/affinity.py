@@ -0,0 +1,225 @@
+"""
+Per-customer affinity profiles for personalized result ordering.
+
+This module is responsible for:
+    - A compact profile per (store, customer): a float32 weight vector over
+      hashed catalog features (product type, material, gender and size, taken
+      from the cleaned tags and available variants). Profiles are stored as raw
+      bytes in the shared session state, so every worker reads the same one.
+    - Updating profiles incrementally from session events: what the shopper
+      asks for, and product events clients report (view, click, cart,
+      purchase). Older evidence decays with every update.
+    - Reranking search results with one matrix-vector product before they are
+      formatted for the prompt or the fast path, so results are personalized
+      without spending LLM tokens.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+from backend.agents.state.store import SessionStateStore, customer_key
+
+logger = logging.getLogger(__name__)
+
+AFFINITY = "affinity"
+FEATURE_KEYS = ("type", "material", "gender", "size")
+EVENT_WEIGHTS = {"query": 0.5, "view": 0.25, "click": 1.0, "cart": 2.0, "purchase": 3.0}
+
+_TOKEN = re.compile(r"[a-z0-9.]+")
+_SIZE = re.compile(r"\bsize\s+(\d{1,2}(?:\.5)?)\b")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_TOKEN.findall(str(text).lower().replace("'", "")))
+
+
+def feature_index(feature: str, dim: int) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % dim
+
+
+def _family_weights(features: Sequence[str]) -> List[float]:
+    """Each family (type, material, ...) gets equal mass, so seven available sizes don't outweigh one gender."""
+    counts: Dict[str, int] = {}
+    for feature in features:
+        family = feature.split(":", 1)[0]
+        counts[family] = counts.get(family, 0) + 1
+    return [1.0 / counts[feature.split(":", 1)[0]] for feature in features]
+
+
+def product_features(product: Dict[str, Any], clean_tags: Callable[[List[str]], List[str]]) -> List[str]:
+    """Features of a search-result product, e.g. ["type:shoes", "material:wool", "gender:mens", "size:9"]."""
+    if product.get("features") is not None:
+        # Remembered results carry their features precomputed
+        return list(product["features"])
+    features = []
+    if product.get("product_type"):
+        features.append("type:" + _normalize(product["product_type"]))
+    for tag in clean_tags(product.get("tags") or []):
+        key, sep, value = tag.partition(":")
+        key = key.strip().lower()
+        if sep and key in ("material", "gender") and value.strip():
+            features.append(f"{key}:{_normalize(value)}")
+    for variant in product.get("variants") or []:
+        if isinstance(variant, dict) and variant.get("available", False):
+            size = str(variant.get("title", "")).split(" ")[0]
+            if size and size[0].isdigit():
+                features.append("size:" + size)
+    return list(dict.fromkeys(features))
+
+
+class AffinityProfiles:
+    """
+    Affinity profiles for one store's customers.
+
+    Args:
+        state: Where profiles live (the shared session state).
+        store: Store domain; profiles are per store, since customer ids are.
+        dim: Length of the hashed feature vector (WEPPO_AFFINITY_DIM).
+        decay: Factor applied to a profile's weights at every update (WEPPO_AFFINITY_DECAY).
+        strength: How far affinity can move a product against the search
+            ranking (WEPPO_AFFINITY_STRENGTH); 0 keeps the search order.
+    """
+
+    def __init__(self, state: SessionStateStore, store: str, dim: int = None, decay: float = None,
+                 strength: float = None, registry: MetricsRegistry = REGISTRY):
+        self.state = state
+        self.store = store
+        self.dim = dim or int(os.environ.get("WEPPO_AFFINITY_DIM", 256))
+        self.decay = decay if decay is not None else float(os.environ.get("WEPPO_AFFINITY_DECAY", 0.95))
+        self.strength = strength if strength is not None else float(os.environ.get("WEPPO_AFFINITY_STRENGTH", 0.5))
+        # Feature values seen in results, so queries can be matched against them ("wool", "womens", ...)
+        self._values: Dict[str, Set[str]] = {key: set() for key in FEATURE_KEYS if key != "size"}
+        # product id -> (source fields, hashed feature columns, weights); feature extraction costs more than scoring
+        self._rows: "OrderedDict[str, Tuple[tuple, np.ndarray, np.ndarray]]" = OrderedDict()
+        self._max_rows = 4096
+        self._lock = threading.Lock()
+
+        self.updates = registry.counter("weppo_affinity_updates_total", "Affinity profile updates", ["event"])
+        self.rerank_seconds = registry.histogram(
+            "weppo_affinity_rerank_seconds", "Time to rerank one result list by customer affinity",
+            buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+
+    def _key(self, customer_id: str) -> str:
+        return customer_key(f"{self.store}:{customer_id}", AFFINITY)
+
+    def profile(self, customer_id: Optional[str]) -> Optional[np.ndarray]:
+        """The customer's weight vector (read-only), or None without one."""
+        if not customer_id:
+            return None
+        value = self.state.get(self._key(customer_id))
+        if value is None or len(value) != self.dim * 4:
+            return None
+        return np.frombuffer(value, dtype="<f4")
+
+    def has_profile(self, customer_id: Optional[str]) -> bool:
+        weights = self.profile(customer_id)
+        return weights is not None and bool(weights.any())
+
+    def _sparse(self, features: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        return (np.fromiter((feature_index(f, self.dim) for f in features), dtype=np.intp, count=len(features)),
+                np.asarray(_family_weights(features), dtype=np.float32))
+
+    def _matrix(self, rows: Sequence[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """Dense, L2-normalized matrix from sparse (columns, weights) rows."""
+        matrix = np.zeros((len(rows), self.dim), dtype=np.float32)
+        if rows:
+            lengths = [len(columns) for columns, _ in rows]
+            np.add.at(matrix, (np.repeat(np.arange(len(rows)), lengths),
+                               np.concatenate([columns for columns, _ in rows])),
+                      np.concatenate([weights for _, weights in rows]))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+    def _product_row(self, product: Any, clean_tags: Callable[[List[str]], List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        if not isinstance(product, dict):
+            return self._sparse([])
+        variants = product.get("variants") or []
+        source = (product.get("product_type"), tuple(product.get("tags") or ()), tuple(product.get("features") or ()),
+                  tuple(v.get("title") for v in variants if isinstance(v, dict) and v.get("available", False)))
+        key = str(product.get("product_id") or product.get("url") or product.get("title"))
+        with self._lock:
+            cached = self._rows.get(key)
+            if cached is not None and cached[0] == source:
+                self._rows.move_to_end(key)
+                return cached[1], cached[2]
+        features = product_features(product, clean_tags)
+        columns, weights = self._sparse(features)
+        with self._lock:
+            self._learn(features)
+            self._rows[key] = (source, columns, weights)
+            self._rows.move_to_end(key)
+            while len(self._rows) > self._max_rows:
+                self._rows.popitem(last=False)
+        return columns, weights
+
+    def _learn(self, features: Sequence[str]):
+        for feature in features:
+            key, _, value = feature.partition(":")
+            values = self._values.get(key)
+            if values is not None and len(values) < 512:
+                values.add(value)
+
+    def update(self, customer_id: Optional[str], features: Sequence[str], event: str = "click"):
+        """Decay the profile and add `features` with the event's weight; written on the next state flush."""
+        if not customer_id or not features:
+            return
+        delta = self._matrix([self._sparse(features)])[0] * EVENT_WEIGHTS.get(event, 1.0)
+        with self._lock:
+            weights = self.profile(customer_id)
+            weights = weights * self.decay + delta if weights is not None else delta
+            self.state.put(self._key(customer_id), weights.astype("<f4").tobytes())
+        self.updates.inc(event=event)
+
+    def query_features(self, text: str) -> List[str]:
+        """Features a shopper's request names, matched against values seen in results."""
+        normalized = f" {_normalize(text)} "
+        features = [f"{key}:{value}" for key, values in self._values.items() for value in list(values)
+                    if value and f" {value} " in normalized]
+        size = _SIZE.search(normalized)
+        if size:
+            features.append("size:" + size.group(1))
+        return features
+
+    def observe_query(self, customer_id: Optional[str], text: str):
+        self.update(customer_id, self.query_features(text), event="query")
+
+    def observe_product(self, customer_id: Optional[str], product: Dict[str, Any], event: str,
+                        clean_tags: Callable[[List[str]], List[str]]):
+        self.update(customer_id, product_features(product, clean_tags), event=event)
+
+    def rerank(self, customer_id: Optional[str], products: List[Dict[str, Any]],
+               clean_tags: Callable[[List[str]], List[str]]) -> List[Dict[str, Any]]:
+        """
+        Reorder `products` by search rank (1 / (rank + 1)) plus `strength` times
+        each product's affinity relative to the rest of the list (the cosine with
+        the customer's profile, standardized over the list). Products that are
+        all alike to the customer keep their search order.
+        """
+        if not products:
+            return products
+        # Also teaches query matching the values in these results
+        rows = [self._product_row(p, clean_tags) for p in products]
+        weights = self.profile(customer_id)
+        if weights is None or not self.strength:
+            return products
+        norm = float(np.linalg.norm(weights))
+        if not norm:
+            return products
+
+        started = time.perf_counter()
+        affinity = self._matrix(rows) @ (weights / norm)
+        # Most features are shared by every result; what reorders them is how they differ
+        spread = max(float(affinity.std()), 0.05)
+        scores = self.strength * (affinity - affinity.mean()) / spread + 1.0 / np.arange(1, len(products) + 1)
+        order = np.argsort(-scores, kind="stable")
+        self.rerank_seconds.observe(time.perf_counter() - started)
+        return [products[i] for i in order]
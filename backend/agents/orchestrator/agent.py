@@ -1,54 +1,87 @@
-from langchain_ollama import ChatOllama
-from langchain_core.tools import BaseTool
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage, AIMessage
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from ..mcp.shopify_server import ShopifyMCPServer
 from .prompt_template import promptTemplate
 from .product_search import ShopifySearchTool
-from langchain_xai import ChatXAI
+from .tracing import TurnTracingCallback
+from .router import IntentRouter
+from .response_cache import ResponseCache
+from .catalog_sync import CATALOG
+from .providers import load_chat_model
+from ..state.checkpoint import SessionCheckpointer
+from ..state.store import RESULTS, SessionStateStore, default_state_store, session_key
+import asyncio
+import contextvars
+import logging
 import os
+import time
 from dotenv import load_dotenv
 
-
-from backend.agents.input.speech_input import speech_to_text
+logger = logging.getLogger(__name__)
 
 load_dotenv()
-google_api_key: str = os.environ.get('GOOGLE_API_KEY')
-deepseek_api_key: str = "sk-4070045196d1492c8f5c98aea8526326"
-xai_api_key: str = os.environ.get('XAI_API_KEY')
 
 class PersonalShopperAgent:
     """
     A personal shopping assistant that helps customers find products and provides guidance.
     """
     
-    def __init__(self, store_domain: str):
+    def __init__(self, store_domain: str, fast_router: bool = None, response_cache: Optional[ResponseCache] = None,
+                 session_state: Optional[SessionStateStore] = None, llm: Optional[BaseChatModel] = None,
+                 mcp_server: Optional[ShopifyMCPServer] = None):
         # Initialize MCP server
-        self.mcp_server = ShopifyMCPServer(store_domain)
+        self.mcp_server = mcp_server or ShopifyMCPServer(store_domain)
         
-        # Initialize XAI with proper configuration
-        self.llm = ChatXAI(
-            model="grok-3-mini",
+        # Initialize the chat model; only the selected provider's SDK is imported (WEPPO_LLM_PROVIDER, default xai).
+        # With several WEPPO_LLM_PROVIDERS, calls are routed to the fastest healthy one and hedged.
+        self.llm = llm or load_chat_model(
             temperature=0.3,  # Lower temperature for more consistent responses
-            api_key=xai_api_key,
             max_tokens=1500,  # Increased token limit significantly
-            # Remove format="json" as it's not needed for conversational responses
         )
         
-        # Initialize memory
-        self.memory = MemorySaver()
+        # Initialize memory; conversations live in the shared session-state store (WEPPO_STATE_URL),
+        # so whichever worker a session lands on can continue its thread
+        self.session_state = session_state or default_state_store()
+        self.memory = SessionCheckpointer(self.session_state)
+        
+        # Searches are cached per store when WEPPO_SEARCH_CACHE=1; product webhooks keep the cache current
+        self.search_cache = CATALOG.cache_for(self.mcp_server.store_domain)
+        
+        # Results are reordered by each customer's affinity profile unless WEPPO_AFFINITY=0
+        self.affinity = None
+        if os.environ.get('WEPPO_AFFINITY', '1') != '0':
+            from .affinity import AffinityProfiles
+            self.affinity = AffinityProfiles(self.session_state, self.mcp_server.store_domain)
         
         # Initialize tools with proper BaseTool implementation
         self.tools = [
-            ShopifySearchTool(self.mcp_server)
+            ShopifySearchTool(self.mcp_server, session_state=self.session_state, search_cache=self.search_cache,
+                              affinity=self.affinity)
         ]
         
         # Initialize prompt template
         self.prompt = promptTemplate()
         
+        # Simple catalog lookups skip the LLM loop unless WEPPO_FAST_ROUTER=0
+        if fast_router is None:
+            fast_router = os.environ.get('WEPPO_FAST_ROUTER', '1') != '0'
+        self.router = IntentRouter(self.tools[0]) if fast_router else None
+        
+        # Optional cross-session cache of first-turn answers (WEPPO_RESPONSE_CACHE=1)
+        if response_cache is None and os.environ.get('WEPPO_RESPONSE_CACHE', '0') == '1':
+            response_cache = ResponseCache(
+                threshold=float(os.environ.get('WEPPO_RESPONSE_CACHE_THRESHOLD', 0.8)),
+                ttl=float(os.environ.get('WEPPO_RESPONSE_CACHE_TTL', 600)),
+                name=self.mcp_server.store_domain,
+            )
+        self.response_cache = response_cache
+        CATALOG.subscribe(self.mcp_server.store_domain, self.on_catalog_change)
+        
+        # Tool calls the model makes in one step run as parallel graph tasks, at most this many at a time
+        self.tool_concurrency = max(1, int(os.environ.get('WEPPO_TOOL_CONCURRENCY', 4)))
+        
         # Initialize agent executor
         self.agent_executor = create_react_agent(
             model=self.llm,
@@ -58,13 +91,24 @@ class PersonalShopperAgent:
             prompt=self.prompt
         )
     
-    def chat(self, user_query: str, thread_id: str = "default") -> str:
+    def chat(self, user_query: str, thread_id: str = "default", customer_id: Optional[str] = None) -> str:
         """
-        Process a user query and return a helpful response with product suggestions
+        Process a user query and return a helpful response with product suggestions.
+        With a customer_id, search results are ordered by that customer's affinity profile.
         """
+        shortcut_response, cacheable = self._answer_without_agent(user_query, thread_id, customer_id)
+        if shortcut_response is not None:
+            return shortcut_response
+        
+        started = time.perf_counter()
         try:
-            # Configure thread for memory
-            config = {"configurable": {"thread_id": thread_id}}
+            # Configure thread for memory; the callback times LLM and tool calls for this turn
+            config = {
+                "configurable": {"thread_id": thread_id, "customer_id": customer_id},
+                "callbacks": [TurnTracingCallback(thread_id)],
+                "max_concurrency": self.tool_concurrency,
+            }
+            catalog_version = self.mcp_server.catalog_version
             
             # Stream the agent's response
             messages = []
@@ -79,12 +123,172 @@ class PersonalShopperAgent:
             # Extract and clean the final response
             if messages:
                 last_message = messages[-1]
-                return self._extract_clean_response(last_message)
+                response = self._extract_clean_response(last_message)
+                if cacheable and isinstance(last_message, AIMessage) and last_message.content:
+                    self.response_cache.store(user_query, catalog_version, response)
+                return response
             else:
                 return "I'm sorry, I couldn't process your request. Please try again."
                 
         except Exception as e:
             return f"I encountered an error: {str(e)}. Please try rephrasing your question."
+        finally:
+            if self.router:
+                self.router.observe_llm_latency(time.perf_counter() - started)
+            # One batched write for every checkpoint of this turn
+            self.session_state.flush()
+    
+    def _answer_without_agent(self, user_query: str, thread_id: str,
+                              customer_id: Optional[str] = None) -> Tuple[Optional[str], bool]:
+        """
+        Answer from the fast-path router or the response cache when possible.
+        Returns (response or None, whether the agent's answer may be cached).
+        """
+        if self.router:
+            routed_response = self.router.route(user_query, thread_id, customer_id)
+            if routed_response is not None:
+                self._remember_exchange(thread_id, user_query, routed_response)
+                return routed_response, False
+        
+        # First turns carry no conversation context, so their answers can be shared across sessions,
+        # unless they are personalized for the customer asking
+        cacheable = self.response_cache is not None and self._is_first_turn(thread_id) \
+            and not (self.affinity and self.affinity.has_profile(customer_id))
+        if cacheable:
+            cached_response = self.response_cache.lookup(user_query, self.mcp_server.catalog_version)
+            if cached_response is not None:
+                self._remember_exchange(thread_id, user_query, cached_response)
+                return cached_response, False
+        return None, cacheable
+    
+    async def astream_chat(self, user_query: str, thread_id: str = "default",
+                           customer_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Async variant of `chat` for text clients. Yields events as they happen:
+        {"event": "token", "text"} for model output, {"event": "tool_start", "name", "input"}
+        and {"event": "tool_end", "name"} around tool calls, then one
+        {"event": "done", "response"} with the cleaned final answer.
+        """
+        loop = asyncio.get_running_loop()
+        # Blocking work runs on the default executor, keeping the caller's context for logging
+        def run_blocking(func, *args):
+            return loop.run_in_executor(None, contextvars.copy_context().run, func, *args)
+        
+        shortcut_response, cacheable = await run_blocking(self._answer_without_agent, user_query, thread_id, customer_id)
+        if shortcut_response is not None:
+            yield {"event": "token", "text": shortcut_response}
+            yield {"event": "done", "response": shortcut_response}
+            return
+        
+        started = time.perf_counter()
+        config = {
+            "configurable": {"thread_id": thread_id, "customer_id": customer_id},
+            "callbacks": [TurnTracingCallback(thread_id)],
+            "max_concurrency": self.tool_concurrency,
+        }
+        catalog_version = self.mcp_server.catalog_version
+        final_message = None
+        try:
+            async for event in self.agent_executor.astream_events(
+                {"messages": [HumanMessage(content=user_query)]}, config, version="v2",
+            ):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    text = event["data"]["chunk"].content
+                    if isinstance(text, str) and text:
+                        yield {"event": "token", "text": text}
+                elif kind == "on_tool_start":
+                    yield {"event": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+                elif kind == "on_tool_end":
+                    yield {"event": "tool_end", "name": event["name"]}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    messages = (event["data"].get("output") or {}).get("messages") or []
+                    final_message = messages[-1] if messages else None
+            
+            if final_message is None:
+                response = "I'm sorry, I couldn't process your request. Please try again."
+            else:
+                response = self._extract_clean_response(final_message)
+                if cacheable and isinstance(final_message, AIMessage) and final_message.content:
+                    self.response_cache.store(user_query, catalog_version, response)
+            yield {"event": "done", "response": response}
+        except Exception as e:
+            yield {"event": "done", "response": f"I encountered an error: {str(e)}. Please try rephrasing your question."}
+        finally:
+            if self.router:
+                self.router.observe_llm_latency(time.perf_counter() - started)
+            await run_blocking(self.session_state.flush)
+    
+    def invalidate_catalog(self):
+        """Call when the store's catalog changes so cached answers are not served again."""
+        self.mcp_server.bump_catalog_version()
+        if self.search_cache:
+            self.search_cache.clear()
+        if self.response_cache:
+            self.response_cache.invalidate()
+    
+    def on_catalog_change(self, changes):
+        """
+        Drop cached answers made stale by product changes. `changes` is a list of
+        catalog_sync.ProductChange, or None when the whole catalog may have changed.
+        """
+        if changes is None:
+            self.invalidate_catalog()
+            return
+        terms = [change.terms() for change in changes]
+        if not all(terms):
+            # A change we can't name (e.g. deleting a product never served here) could be in any answer
+            self.invalidate_catalog()
+        elif self.response_cache:
+            self.response_cache.invalidate_matching([term for change_terms in terms for term in change_terms])
+    
+    def close(self):
+        """Release per-store resources when the agent is evicted from the pool."""
+        CATALOG.unsubscribe(self.mcp_server.store_domain, self.on_catalog_change)
+        if self.response_cache:
+            self.response_cache.close()
+        self.mcp_server.close()
+    
+    def _is_first_turn(self, thread_id: str) -> bool:
+        try:
+            state = self.agent_executor.get_state({"configurable": {"thread_id": thread_id}})
+            return not state.values.get("messages")
+        except Exception:
+            return False
+    
+    def _remember_exchange(self, thread_id: str, user_query: str, response: str):
+        """Write a turn answered outside the agent loop into the thread's memory for follow-ups."""
+        try:
+            self.agent_executor.update_state(
+                {"configurable": {"thread_id": thread_id}},
+                {"messages": [HumanMessage(content=user_query), AIMessage(content=response)]},
+            )
+            self.session_state.flush()
+        except Exception as e:
+            logger.warning("Error recording fast-path turn in memory: %s", e, exc_info=True)
+    
+    def record_product_event(self, customer_id: str, event: str, product: Optional[Dict[str, Any]] = None,
+                             product_id: Optional[str] = None, thread_id: Optional[str] = None) -> bool:
+        """
+        Count a product event (view, click, cart, purchase) toward the customer's affinity
+        profile. The product is given in full, or by id from the session's latest results
+        or the search cache. Returns False when the product couldn't be resolved.
+        """
+        if self.affinity is None:
+            return False
+        if product is None and product_id:
+            remembered = (self.latest_results(thread_id) or {}).get('products', []) if thread_id else []
+            product = next((p for p in remembered if p.get('product_id') == product_id), None)
+            if product is None and self.search_cache is not None:
+                product = self.search_cache.cached_product(product_id)
+        if product is None:
+            return False
+        self.affinity.observe_product(customer_id, product, event, self.tools[0]._clean_tags)
+        return True
+    
+    def latest_results(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """The session's most recent search, as {"queries": [...], "products": [...]}, or None."""
+        return self.session_state.get_json(session_key(thread_id, RESULTS))
     
     def _extract_clean_response(self, message) -> str:
         """
@@ -115,7 +319,7 @@ class PersonalShopperAgent:
                 return str(message)
                 
         except Exception as e:
-            print(f"Error extracting response: {e}")
+            logger.warning("Error extracting response: %s", e, exc_info=True)
             return "I apologize, but I encountered an issue formatting my response. Please try asking again."
     
     def _clean_response_content(self, content: str) -> str:
@@ -138,15 +342,16 @@ class PersonalShopperAgent:
         
         return '\n'.join(cleaned_lines).strip()
     
-    def get_recommendations(self, user_query: str) -> List[Dict[str, Any]]:
+    def get_recommendations(self, user_query: str, customer_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Get product recommendations based on user query
         """
         try:
-            results = self.mcp_server.get_products(user_query)
-            return results.get('result', {}).get('products', [])
+            # Goes through the search tool so the store's search cache answers repeats
+            results = self.tools[0].search_products(user_query)
+            return self.tools[0].personalize(customer_id, user_query, results.get('products', []))
         except Exception as e:
-            print(f"Error getting recommendations: {e}")
+            logger.warning("Error getting recommendations: %s", e, exc_info=True)
             return []
 
 
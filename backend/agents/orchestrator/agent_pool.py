@@ -0,0 +1,197 @@
+"""
+Per-store agent pool.
+
+Each storefront gets its own PersonalShopperAgent (and with it its MCP client,
+router and caches). Agents are built lazily on first use, shared by every
+session of that store, and evicted least-recently-used once the pool is full
+or when they have been idle for longer than `idle_ttl`. Stores with live
+sessions are never evicted.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+_DOMAIN = re.compile(r"^[a-z0-9]([a-z0-9-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9-]*[a-z0-9])?)+$")
+
+
+def normalize_store(store_domain: str) -> str:
+    """Canonical pool key for a store: no scheme, no www., no path, lowercase."""
+    domain = store_domain.strip().lower()
+    domain = re.sub(r"^https?://", "", domain)
+    domain = domain.split("/", 1)[0]
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+
+def _build_agent(store_domain: str):
+    # Imported on first build so LangGraph and the LLM SDK stay off the server's import path
+    from .agent import PersonalShopperAgent
+    return PersonalShopperAgent(store_domain)
+
+
+class UnknownStoreError(ValueError):
+    """Raised for malformed store domains or stores outside the allow-list."""
+
+
+class _PoolEntry:
+    __slots__ = ("agent", "sessions", "last_used")
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.sessions = 0
+        self.last_used = time.monotonic()
+
+
+class AgentPool:
+    """
+    Lazily built, LRU-evicted map of store domain -> agent.
+
+    Args:
+        factory: Builds an agent for a store domain (PersonalShopperAgent by default).
+        default_store: Store used when a connection doesn't name one.
+        max_stores: Maximum number of agents kept in memory.
+        idle_ttl: Seconds after which an agent without sessions is evicted.
+        allowed_stores: Optional allow-list of store domains.
+    """
+
+    def __init__(self, factory: Optional[Callable[[str], object]] = None, default_store: str = "www.allbirds.com",
+                 max_stores: int = None, idle_ttl: float = None, allowed_stores=None,
+                 registry: MetricsRegistry = REGISTRY):
+        self.factory = factory or _build_agent
+        self.default_store = default_store
+        self.max_stores = max_stores or int(os.environ.get("WEPPO_MAX_STORES", 8))
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.environ.get("WEPPO_STORE_IDLE_TTL", 1800))
+        if allowed_stores is None:
+            allowed_stores = [s for s in os.environ.get("WEPPO_ALLOWED_STORES", "").split(",") if s.strip()]
+        self.allowed_stores = {normalize_store(s) for s in allowed_stores} or None
+
+        self._entries: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.builds = registry.counter("weppo_agent_pool_builds_total", "Per-store agents built")
+        self.evictions = registry.counter("weppo_agent_pool_evictions_total", "Per-store agents evicted", ["reason"])
+        entries = self._entries
+        registry.gauge("weppo_agent_pool_stores", "Per-store agents held in memory").set_function(lambda: len(entries))
+
+    def __contains__(self, store_domain: str) -> bool:
+        return normalize_store(store_domain) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def resolve(self, store_domain: Optional[str]) -> str:
+        """Validate a requested store and return its pool key."""
+        domain = normalize_store(store_domain or self.default_store)
+        if not _DOMAIN.match(domain):
+            raise UnknownStoreError(f"Invalid store domain: {store_domain!r}")
+        if self.allowed_stores is not None and domain not in self.allowed_stores:
+            raise UnknownStoreError(f"Store not served here: {domain}")
+        return domain
+
+    def acquire(self, store_domain: Optional[str] = None):
+        """Return the store's agent, building it on first use, and count a session against it."""
+        domain = self.resolve(store_domain)
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None:
+                entry.sessions += 1
+            else:
+                build_lock = self._build_locks.setdefault(domain, threading.Lock())
+
+        if entry is None:
+            # Build outside the pool lock so other stores aren't blocked; one build per store
+            with build_lock:
+                with self._lock:
+                    entry = self._entries.get(domain)
+                    if entry is not None:
+                        entry.sessions += 1
+                if entry is None:
+                    logger.info("Building agent for store %s", domain)
+                    agent = self.factory(domain)
+                    self.builds.inc()
+                    with self._lock:
+                        entry = self._entries.setdefault(domain, _PoolEntry(agent))
+                        entry.sessions += 1
+                        self._build_locks.pop(domain, None)
+
+        with self._lock:
+            entry.last_used = time.monotonic()
+            if domain in self._entries:
+                self._entries.move_to_end(domain)
+            evicted = self._evict_lru()
+        self._close(evicted, "lru")
+        return entry.agent
+
+    async def aacquire(self, store_domain: Optional[str] = None):
+        """`acquire` from the event loop; a first-time build runs in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.acquire, store_domain)
+
+    def release(self, store_domain: Optional[str] = None):
+        domain = normalize_store(store_domain or self.default_store)
+        with self._lock:
+            entry = self._entries.get(domain)
+            if entry is not None:
+                entry.sessions = max(0, entry.sessions - 1)
+                entry.last_used = time.monotonic()
+
+    def get(self, store_domain: Optional[str] = None):
+        """The store's agent if it is already built, without counting a session."""
+        entry = self._entries.get(normalize_store(store_domain or self.default_store))
+        return entry.agent if entry else None
+
+    def agents(self) -> Dict[str, object]:
+        with self._lock:
+            return {domain: entry.agent for domain, entry in self._entries.items()}
+
+    def _evict_lru(self):
+        """Pop least-recently-used idle entries beyond max_stores. Caller holds the lock."""
+        evicted = []
+        for domain in list(self._entries):
+            if len(self._entries) <= self.max_stores:
+                break
+            if self._entries[domain].sessions == 0:
+                evicted.append((domain, self._entries.pop(domain)))
+        return evicted
+
+    def evict_idle(self) -> int:
+        """Evict agents with no sessions that have been idle longer than idle_ttl."""
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            evicted = [
+                (domain, entry) for domain, entry in self._entries.items()
+                if entry.sessions == 0 and entry.last_used < cutoff
+            ]
+            for domain, _ in evicted:
+                del self._entries[domain]
+        self._close(evicted, "idle")
+        return len(evicted)
+
+    def _close(self, evicted, reason: str):
+        for domain, entry in evicted:
+            logger.info("Evicting agent for store %s (%s)", domain, reason)
+            self.evictions.inc(reason=reason)
+            close = getattr(entry.agent, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning("Error closing agent for %s: %s", domain, e)
+
+    async def run_idle_eviction(self, interval: float = 60.0):
+        """Background task: periodically evict idle stores."""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
@@ -0,0 +1,366 @@
+"""
+Offline bulk recommendations.
+
+This module is responsible for:
+    - Running product recommendations for large batches of (customer, query)
+      pairs, e.g. for email campaigns or page pre-rendering, without the LLM:
+      each pair is a catalog search, like `PersonalShopperAgent.get_recommendations`.
+    - Streaming input records from a JSONL or CSV file (or stdin), with at most
+      `concurrency` searches in flight and at most `rate` searches per second
+      per store.
+    - Reusing search results: identical queries for a store are searched once
+      per job (and shared with the store's search cache when WEPPO_SEARCH_CACHE=1).
+    - Writing results incrementally to JSONL, or to Parquet part files (needs
+      pyarrow). The output doubles as the checkpoint: a re-run with the same
+      output skips records already written, so a failed run resumes instead of
+      starting over. Records that failed are retried on the next run.
+    - Optionally (`personalize`) ordering each record's products by the
+      customer's affinity profile, the same way live sessions are.
+
+Input records: {"customer_id", "query", "store"?, "id"?}; `id` defaults to a hash
+of customer, store and query. Output records: {"id", "customer_id", "store",
+"query", "products": [...]} or the same with "error" instead of "products".
+
+Usage:
+    python -m backend.agents.orchestrator.bulk_recommendations queries.jsonl -o recs.jsonl --concurrency 16 --rate 10
+    python -m backend.agents.orchestrator.bulk_recommendations queries.csv -o recs.parquet --format parquet
+"""
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+from .agent_pool import normalize_store
+from .catalog_sync import CATALOG, SearchCache
+from .response_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Product fields kept per recommendation
+PRODUCT_FIELDS = ("product_id", "title", "url", "price_range", "product_type", "image_url")
+
+
+def record_id(customer_id: str, store: str, query: str) -> str:
+    text = f"{customer_id}\n{store}\n{query}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def read_records(path: str, default_store: str) -> Iterator[Dict[str, Any]]:
+    """Stream input records from a .jsonl/.csv file, or JSONL from stdin with "-"."""
+    if path == "-":
+        handle = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    else:
+        handle = open(path, newline="", encoding="utf-8")
+    with handle:
+        rows: Iterable[Dict[str, Any]]
+        if path.endswith(".csv"):
+            rows = csv.DictReader(handle)
+        else:
+            rows = (json.loads(line) for line in handle if line.strip())
+        for row in rows:
+            query = (row.get("query") or "").strip()
+            if not query:
+                continue
+            customer_id = str(row.get("customer_id") or "")
+            store = normalize_store(row.get("store") or default_store)
+            yield {
+                "id": str(row.get("id") or record_id(customer_id, store, query)),
+                "customer_id": customer_id,
+                "store": store,
+                "query": query,
+            }
+
+
+class JSONLSink:
+    """Appends one line per record; the lines already written are the checkpoint."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def completed(self) -> Set[str]:
+        done: Set[str] = set()
+        if not os.path.exists(self.path):
+            return done
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; everything after it is rewritten
+                    break
+                valid_bytes += len(line)
+                if "error" in record:
+                    done.discard(record["id"])
+                else:
+                    done.add(record["id"])
+        if valid_bytes < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return done
+
+    def open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Writes a directory of Parquet part files, one per `rows_per_part` records.
+    A part is renamed into place only once complete, so a crash loses at most
+    the records buffered for the next part.
+    """
+
+    def __init__(self, path: str, rows_per_part: int = 5000):
+        # Only parquet output needs pyarrow
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._rows: List[Dict[str, Any]] = []
+
+    def _parts(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.endswith(".parquet"))
+
+    def completed(self) -> Set[str]:
+        done: Set[str] = set()
+        for name in self._parts():
+            table = self._pq.read_table(os.path.join(self.path, name), columns=["id", "error"])
+            for record_key, error in zip(table.column("id").to_pylist(), table.column("error").to_pylist()):
+                if error:
+                    done.discard(record_key)
+                else:
+                    done.add(record_key)
+        return done
+
+    def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._next_part = len(self._parts())
+
+    def write(self, record: Dict[str, Any]):
+        self._rows.append({
+            "id": record["id"],
+            "customer_id": record["customer_id"],
+            "store": record["store"],
+            "query": record["query"],
+            "products": json.dumps(record.get("products", []), separators=(",", ":")),
+            "error": record.get("error"),
+        })
+        if len(self._rows) >= self.rows_per_part:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        name = os.path.join(self.path, f"part-{self._next_part:05d}.parquet")
+        self._pq.write_table(self._pa.Table.from_pylist(self._rows), name + ".tmp")
+        os.replace(name + ".tmp", name)
+        self._next_part += 1
+        self._rows = []
+
+    def close(self):
+        self._flush()
+
+
+class StoreRateLimiter:
+    """Token bucket per store: `rate` searches/s sustained, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float = None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._clock = clock
+        self._buckets: Dict[str, List[float]] = {}
+
+    async def acquire(self, store: str):
+        if not self.rate:
+            return
+        while True:
+            now = self._clock()
+            tokens, updated = self._buckets.get(store, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[store] = [tokens - 1, now]
+                return
+            self._buckets[store] = [tokens, now]
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+
+class BulkRecommendationJob:
+    """
+    One bulk run from an input file to an output file.
+
+    Args:
+        output: Output path; a .jsonl file, or a directory of part files for parquet.
+        output_format: "jsonl" or "parquet" (default: from the output extension).
+        concurrency: Searches in flight at once (WEPPO_BULK_CONCURRENCY).
+        rate: Searches per second per store, 0 for unlimited (WEPPO_BULK_RATE_PER_STORE).
+        top_k: Products kept per record.
+        default_store: Store for records that don't name one.
+        personalize: Rerank by customer affinity profiles (read only; the job doesn't update them).
+        search_factory: Builds a search tool for a store (ShopifySearchTool by default).
+    """
+
+    def __init__(self, output: str, output_format: str = None, concurrency: int = None, rate: float = None,
+                 top_k: int = 8, default_store: str = "www.allbirds.com", personalize: bool = False,
+                 search_factory=None, registry: MetricsRegistry = REGISTRY):
+        output_format = output_format or ("parquet" if output.endswith(".parquet") else "jsonl")
+        self.sink = ParquetSink(output) if output_format == "parquet" else JSONLSink(output)
+        self.concurrency = concurrency or int(os.environ.get("WEPPO_BULK_CONCURRENCY", 16))
+        self.limiter = StoreRateLimiter(
+            rate if rate is not None else float(os.environ.get("WEPPO_BULK_RATE_PER_STORE", 10)))
+        self.top_k = top_k
+        self.default_store = default_store
+        self.personalize = personalize
+        self.search_factory = search_factory or self._build_search
+        self._searchers: Dict[str, Any] = {}
+        self._searches: Dict[tuple, asyncio.Future] = {}
+        self._no_results: Set[tuple] = set()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk-recs")
+        self.stats = {"done": 0, "skipped": 0, "failed": 0, "searches": 0}
+
+        self.records = registry.counter("weppo_bulk_records_total", "Bulk recommendation records", ["result"])
+
+    def _build_search(self, store: str):
+        from ..mcp.shopify_server import ShopifyMCPServer
+        from .product_search import ShopifySearchTool
+        # The store's live search cache when one exists, else one for this job
+        cache = CATALOG.cache_for(store) or SearchCache(store, ttl=float("inf"), max_entries=100000)
+        affinity = None
+        if self.personalize:
+            from ..state.store import default_state_store
+            from .affinity import AffinityProfiles
+            affinity = AffinityProfiles(default_state_store(), store)
+        return ShopifySearchTool(ShopifyMCPServer(store), search_cache=cache, affinity=affinity)
+
+    def _searcher(self, store: str):
+        if store not in self._searchers:
+            self._searchers[store] = self.search_factory(store)
+        return self._searchers[store]
+
+    async def _search(self, store: str, query: str) -> Dict[str, Any]:
+        """
+        Records asking the same (normalized) question while its search is in
+        flight share that search; once it finishes, the search cache answers.
+        """
+        key = (store, normalize_query(query) or (query.lower(),))
+        if key in self._no_results:
+            return {"products": [], "pagination": {}, "filters": []}
+        future = self._searches.get(key)
+        if future is None:
+            future = self._searches[key] = asyncio.ensure_future(self._run_search(store, query))
+            future.add_done_callback(lambda _: self._searches.pop(key, None))
+        result = await asyncio.shield(future)
+        if "error" not in result and not result["products"]:
+            # Empty results aren't put in the search cache
+            self._no_results.add(key)
+        return result
+
+    async def _run_search(self, store: str, query: str) -> Dict[str, Any]:
+        searcher = self._searcher(store)
+        if searcher.search_cache is None or query not in searcher.search_cache:
+            # Only searches that reach the store count against its rate
+            await self.limiter.acquire(store)
+            self.stats["searches"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, searcher.search_products, query)
+
+    async def _process(self, record: Dict[str, Any]):
+        try:
+            result = await self._search(record["store"], record["query"])
+        except Exception as e:
+            result = {"error": str(e)}
+        output = {key: record[key] for key in ("id", "customer_id", "store", "query")}
+        if "error" in result:
+            output["error"] = result["error"]
+            self.stats["failed"] += 1
+            self.records.inc(result="failed")
+        else:
+            products = result["products"]
+            searcher = self._searcher(record["store"])
+            affinity = getattr(searcher, "affinity", None)
+            if affinity is not None and record["customer_id"]:
+                products = affinity.rerank(record["customer_id"], products, searcher._clean_tags)
+            output["products"] = [
+                {field: product.get(field) for field in PRODUCT_FIELDS}
+                for product in products[:self.top_k] if isinstance(product, dict)
+            ]
+            self.stats["done"] += 1
+            self.records.inc(result="done")
+        self.sink.write(output)
+
+    async def run(self, records: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """Process `records`, skipping ids already in the output; returns counts."""
+        completed = self.sink.completed()
+        if completed:
+            logger.info("Resuming: %d records already in the output", len(completed))
+        self.sink.open()
+        slots = asyncio.Semaphore(self.concurrency)
+        pending: Set[asyncio.Task] = set()
+
+        async def process(record):
+            try:
+                await self._process(record)
+            finally:
+                slots.release()
+
+        try:
+            for record in records:
+                if record["id"] in completed:
+                    self.stats["skipped"] += 1
+                    self.records.inc(result="skipped")
+                    continue
+                # Reading input waits for a free slot, so memory stays bounded however long the input is
+                await slots.acquire()
+                task = asyncio.create_task(process(record))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            self.sink.close()
+            self._executor.shutdown(wait=False)
+        return dict(self.stats)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk product recommendations for (customer, query) pairs")
+    parser.add_argument("input", help="JSONL or CSV with customer_id, query and optional store/id; '-' for stdin")
+    parser.add_argument("-o", "--output", required=True, help="Output .jsonl file or .parquet directory")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default=None)
+    parser.add_argument("--concurrency", type=int, default=None, help="Searches in flight at once")
+    parser.add_argument("--rate", type=float, default=None, help="Searches per second per store (0: unlimited)")
+    parser.add_argument("--top-k", type=int, default=8, help="Products kept per record")
+    parser.add_argument("--store", default="www.allbirds.com", help="Store for records without one")
+    parser.add_argument("--personalize", action="store_true", help="Order products by customer affinity profiles")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    job = BulkRecommendationJob(args.output, args.format, args.concurrency, args.rate, args.top_k, args.store,
+                                args.personalize)
+    started = time.perf_counter()
+    stats = asyncio.run(job.run(read_records(args.input, args.store)))
+    logger.info("Finished in %.1fs: %s", time.perf_counter() - started, stats)
+
+
+if __name__ == "__main__":
+    main()
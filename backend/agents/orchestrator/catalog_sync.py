@@ -0,0 +1,559 @@
+"""
+Catalog freshness for cached views of a store's products.
+
+This module is responsible for:
+    - A per-store cache of parsed search results (`SearchCache`, enabled with
+      WEPPO_SEARCH_CACHE=1), indexed by product so a change touches only the
+      cached searches it affects.
+    - Applying product create/update/delete events (Shopify webhooks relayed
+      by the shopify-integration app to POST /catalog/events): updates are
+      patched into cached results in place, deletes are removed, and searches a
+      new or renamed product might now match are dropped. Agents subscribe to
+      hear which products changed, so their response caches drop only the
+      answers that mention them.
+    - Periodic reconciliation for events that never arrived: the live catalog
+      is summarized as WEPPO_CATALOG_BUCKETS bucket hashes of (product id,
+      updated_at); only buckets whose hash moved are listed and diffed.
+
+Bucket layout (the digest endpoint must compute the same):
+    bucket(id) = int(sha1(id)[:8], 16) % buckets, id as "gid://shopify/Product/<n>"
+    digest     = sha1("\\n".join(f"{id} {updated_at}" for id in sorted(ids in bucket)))
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+from .agent_pool import normalize_store
+from .response_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+# Changed, but only its id is known (reconciliation); cached copies are dropped, not patched
+STALE = "stale"
+
+SIGNATURE_HEADER = "X-Weppo-Hmac-Sha256"
+_PRODUCT_GID = "gid://shopify/Product/"
+
+
+def product_gid(product_id) -> str:
+    product_id = str(product_id)
+    return product_id if product_id.startswith("gid://") else _PRODUCT_GID + product_id
+
+
+def bucket_of(product_id: str, buckets: int) -> int:
+    return int(hashlib.sha1(product_id.encode("utf-8")).hexdigest()[:8], 16) % buckets
+
+
+def bucket_digest(listing: Dict[str, Any]) -> str:
+    """Hash of one bucket's {product id: updated_at} listing."""
+    lines = "\n".join(f"{product_id} {listing[product_id]}" for product_id in sorted(listing))
+    return hashlib.sha1(lines.encode("utf-8")).hexdigest()
+
+
+def sign(body: bytes, secret: str) -> str:
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: Optional[str] = None) -> bool:
+    """Check an event batch's HMAC (WEPPO_CATALOG_WEBHOOK_SECRET); unsigned batches pass only without a secret."""
+    secret = secret if secret is not None else os.environ.get("WEPPO_CATALOG_WEBHOOK_SECRET", "")
+    if not secret:
+        return True
+    return bool(signature) and hmac.compare_digest(sign(body, secret), signature)
+
+
+def product_fingerprint(product: Dict[str, Any]) -> str:
+    """Hash of what the agent tells shoppers about a product; updates that don't change it are no-ops."""
+    variants = product.get("variants") or []
+    facts = [
+        product.get("title"),
+        product.get("url"),
+        product.get("product_type"),
+        (product.get("price_range") or {}).get("min"),
+        (product.get("price_range") or {}).get("max"),
+        sorted(product.get("tags") or []),
+        [(v.get("title"), v.get("price"), bool(v.get("available"))) for v in variants if isinstance(v, dict)],
+    ]
+    return hashlib.sha1(json.dumps(facts, default=str).encode("utf-8")).hexdigest()
+
+
+class ProductChange:
+    """One product's change, with the product in search-result shape when the event carried it."""
+
+    __slots__ = ("kind", "product_id", "product", "updated_at", "noop")
+
+    def __init__(self, kind: str, product_id: str, product: Optional[Dict[str, Any]] = None,
+                 updated_at: Optional[str] = None):
+        self.kind = kind
+        self.product_id = product_id
+        self.product = product
+        self.updated_at = updated_at
+        # Set when the cached copy already matched: nothing shoppers were told has changed
+        self.noop = False
+
+    def terms(self) -> List[str]:
+        """Strings an answer mentioning this product would contain (title, base name, URL)."""
+        if not self.product:
+            return []
+        terms = []
+        title = self.product.get("title")
+        if title:
+            terms.append(title)
+            base = title.split(" - ")[0].strip()
+            if base and base != title:
+                terms.append(base)
+        if self.product.get("url"):
+            terms.append(self.product["url"])
+        return terms
+
+    def __repr__(self) -> str:
+        return f"ProductChange({self.kind}, {self.product_id})"
+
+
+def _price(value) -> str:
+    return str(float(value)) if value not in (None, "") else ""
+
+
+def change_from_event(event: Dict[str, Any], store_domain: str) -> ProductChange:
+    """
+    Map a relayed webhook to a ProductChange. `event` is {"topic": "products/update",
+    "product": <Shopify product payload>} or {"topic": "products/delete", "id": ...}.
+    """
+    topic = str(event.get("topic", "")).lower().replace("_", "/")
+    payload = event.get("product") or {}
+    product_id = product_gid(payload.get("admin_graphql_api_id") or payload.get("id") or event.get("id"))
+    if topic.endswith("delete"):
+        return ProductChange(DELETE, product_id)
+    if payload.get("status", "active") != "active":
+        # Drafted or archived products leave the storefront like deleted ones
+        return ProductChange(DELETE, product_id)
+
+    variants = []
+    prices = []
+    for variant in payload.get("variants") or []:
+        price = _price(variant.get("price"))
+        if price:
+            prices.append(float(price))
+        quantity = variant.get("inventory_quantity")
+        available = variant.get("available")
+        if available is None:
+            available = quantity is None or quantity > 0 or variant.get("inventory_policy") == "continue"
+        variants.append({
+            "variant_id": product_gid(variant.get("id")).replace("Product/", "ProductVariant/"),
+            "title": variant.get("title"),
+            "price": price,
+            "available": bool(available),
+        })
+    tags = payload.get("tags") or []
+    if isinstance(tags, str):
+        tags = [tag.strip() for tag in tags.split(",") if tag.strip()]
+    product = {
+        "product_id": product_id,
+        "title": payload.get("title"),
+        "url": f"https://{event.get('url_domain') or store_domain}/products/{payload['handle']}"
+        if payload.get("handle") else None,
+        "product_type": payload.get("product_type"),
+        "tags": tags,
+        "variants": variants,
+        "price_range": {"min": str(min(prices)), "max": str(max(prices))} if prices else {},
+    }
+    kind = CREATE if topic.endswith("create") else UPDATE
+    return ProductChange(kind, product_id, product, payload.get("updated_at"))
+
+
+class _CachedSearch:
+    __slots__ = ("parsed", "created_at", "product_ids")
+
+    def __init__(self, parsed: Dict[str, Any], created_at: float, product_ids: Set[str]):
+        self.parsed = parsed
+        self.created_at = created_at
+        self.product_ids = product_ids
+
+
+class SearchCache:
+    """
+    TTL-bounded LRU cache of parsed search results for one store, with a
+    product id -> cached searches index for targeted invalidation.
+    """
+
+    def __init__(self, store: str, ttl: float = None, max_entries: int = None,
+                 registry: MetricsRegistry = REGISTRY, clock: Callable[[], float] = time.monotonic):
+        self.store = store
+        self.ttl = ttl if ttl is not None else float(os.environ.get("WEPPO_SEARCH_CACHE_TTL", 300))
+        self.max_entries = max_entries or int(os.environ.get("WEPPO_SEARCH_CACHE_SIZE", 512))
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, ...], _CachedSearch]" = OrderedDict()
+        self._by_product: Dict[str, Set[Tuple[str, ...]]] = {}
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        self.requests = registry.counter("weppo_search_cache_total", "Search cache lookups", ["result"])
+        self.invalidations = registry.counter(
+            "weppo_search_cache_invalidations_total", "Cached searches dropped or patched for catalog changes",
+            ["action"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: Tuple[str, ...]):
+        """Caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for product_id in entry.product_ids:
+            keys = self._by_product.get(product_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_product[product_id]
+                    self._products.pop(product_id, None)
+
+    def __contains__(self, query: str) -> bool:
+        """Whether `get(query)` would hit; not counted as a lookup and copies nothing."""
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self._clock() - entry.created_at <= self.ttl
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry.created_at > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.requests.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+            parsed = {**entry.parsed, "products": list(entry.parsed["products"])}
+        self.requests.inc(result="hit")
+        return parsed
+
+    def put(self, query: str, parsed: Dict[str, Any]):
+        key = normalize_query(query)
+        if not key or "error" in parsed:
+            return
+        products = [p for p in parsed.get("products", []) if isinstance(p, dict)]
+        product_ids = {product_gid(p["product_id"]) for p in products if p.get("product_id")}
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _CachedSearch({**parsed, "products": products}, self._clock(), product_ids)
+            for product in products:
+                if product.get("product_id"):
+                    product_id = product_gid(product["product_id"])
+                    self._by_product.setdefault(product_id, set()).add(key)
+                    self._products[product_id] = product
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def cached_product(self, product_id: str) -> Optional[Dict[str, Any]]:
+        return self._products.get(product_id)
+
+    def product_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._by_product)
+
+    @staticmethod
+    def _searchable(product: Dict[str, Any]) -> Set[str]:
+        text = " ".join(filter(None, [product.get("title"), product.get("product_type"),
+                                      " ".join(product.get("tags") or [])]))
+        return set(normalize_query(text))
+
+    def _patched(self, cached: Dict[str, Any], product: Dict[str, Any]) -> Dict[str, Any]:
+        patched = {**cached, **{k: v for k, v in product.items() if v not in (None, [], {})}}
+        # Webhooks carry neither the currency nor the storefront's own URL host; keep what search returned
+        if (cached.get("price_range") or {}).get("currency") and patched.get("price_range"):
+            patched["price_range"] = {**patched["price_range"], "currency": cached["price_range"]["currency"]}
+        if cached.get("url") and product.get("url") and \
+                cached["url"].rsplit("/products/", 1)[-1] == product["url"].rsplit("/products/", 1)[-1]:
+            patched["url"] = cached["url"]
+        return patched
+
+    def _replace(self, key: Tuple[str, ...], product_id: str, product: Optional[Dict[str, Any]]):
+        """Caller holds the lock. Swap (or, with None, remove) a product in one cached search."""
+        entry = self._entries[key]
+        products = []
+        for p in entry.parsed["products"]:
+            if p.get("product_id") and product_gid(p["product_id"]) == product_id:
+                if product is None:
+                    continue
+                p = product
+            products.append(p)
+        entry.parsed["products"] = products
+        if product is None:
+            entry.product_ids.discard(product_id)
+
+    def apply(self, change: ProductChange) -> int:
+        """
+        Apply one change; returns the number of cached searches patched or dropped.
+
+        Updates are patched into the searches that returned the product and
+        deletes removed from them. Searches a created or re-described product
+        might now match are dropped, since their result lists may be incomplete.
+        """
+        with self._lock:
+            keys = set(self._by_product.get(change.product_id, ()))
+            cached = self._products.get(change.product_id)
+            patched = rematch = 0
+            if change.kind == DELETE:
+                for key in keys:
+                    self._replace(key, change.product_id, None)
+                self._by_product.pop(change.product_id, None)
+                self._products.pop(change.product_id, None)
+                patched, keys = len(keys), set()
+            elif change.kind == UPDATE and cached is not None and change.product is not None:
+                product = self._patched(cached, change.product)
+                if product_fingerprint(product) == product_fingerprint(cached):
+                    change.noop = True
+                    self.invalidations.inc(action="unchanged")
+                    return 0
+                for key in keys:
+                    self._replace(key, change.product_id, product)
+                self._products[change.product_id] = product
+                patched, keys = len(keys), set()
+                rematch = self._searchable(product) != self._searchable(cached)
+            elif change.kind == CREATE or (change.kind == UPDATE and change.product is not None):
+                rematch = True
+
+            if rematch:
+                words = self._searchable(change.product)
+                returned = self._by_product.get(change.product_id, ())
+                keys |= {key for key in self._entries if key not in returned and words & set(key)}
+            for key in keys:
+                self._drop(key)
+            self.invalidations.inc(patched, action="patched")
+            self.invalidations.inc(len(keys), action="dropped")
+        return patched + len(keys)
+
+    def invalidate_bucket(self, bucket: int, buckets: int) -> List[str]:
+        """Drop cached searches containing any product of `bucket`; returns those product ids."""
+        with self._lock:
+            stale = [product_id for product_id in self._by_product if bucket_of(product_id, buckets) == bucket]
+            keys = set().union(*(self._by_product[product_id] for product_id in stale)) if stale else set()
+            for key in keys:
+                self._drop(key)
+            self.invalidations.inc(len(keys), action="dropped")
+        return stale
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_product.clear()
+            self._products.clear()
+
+
+Listener = Callable[[Optional[List[ProductChange]]], None]
+
+
+class _StoreCatalog:
+    __slots__ = ("cache", "listeners", "digests", "listings")
+
+    def __init__(self, cache: Optional[SearchCache]):
+        self.cache = cache
+        self.listeners: List[Listener] = []
+        self.digests: Optional[List[str]] = None
+        self.listings: Dict[int, Dict[str, Any]] = {}
+
+
+class CatalogSync:
+    """
+    Process-wide hub: per-store search caches, change listeners and reconciliation state.
+
+    Args:
+        search_cache: Build a SearchCache per store (WEPPO_SEARCH_CACHE=1).
+        digest_url: Template for the catalog digest endpoint, with a `{domain}`
+            placeholder (WEPPO_CATALOG_DIGEST_URL); reconciliation is off without it.
+        buckets: Number of digest buckets.
+    """
+
+    def __init__(self, search_cache: bool = None, digest_url: str = None, buckets: int = None,
+                 registry: MetricsRegistry = REGISTRY):
+        if search_cache is None:
+            search_cache = os.environ.get("WEPPO_SEARCH_CACHE", "0") == "1"
+        self.search_cache = search_cache
+        self.digest_url = digest_url if digest_url is not None else os.environ.get("WEPPO_CATALOG_DIGEST_URL", "")
+        self.buckets = buckets or int(os.environ.get("WEPPO_CATALOG_BUCKETS", 64))
+        self.registry = registry
+        self._stores: Dict[str, _StoreCatalog] = {}
+        self._lock = threading.Lock()
+        self._http = requests.Session()
+
+        self.events = registry.counter("weppo_catalog_events_total", "Product changes applied", ["kind", "source"])
+        self.reconciliations = registry.counter(
+            "weppo_catalog_reconciliations_total", "Reconciliation passes per store", ["result"])
+        self.buckets_fetched = registry.counter(
+            "weppo_catalog_buckets_fetched_total", "Digest buckets listed because their hash changed")
+
+    def _store(self, store_domain: str, create: bool = True) -> Optional[_StoreCatalog]:
+        domain = normalize_store(store_domain)
+        with self._lock:
+            store = self._stores.get(domain)
+            if store is None and create:
+                cache = SearchCache(domain, registry=self.registry) if self.search_cache else None
+                store = self._stores[domain] = _StoreCatalog(cache)
+            return store
+
+    def cache_for(self, store_domain: str) -> Optional[SearchCache]:
+        return self._store(store_domain).cache
+
+    def subscribe(self, store_domain: str, listener: Listener):
+        """`listener(changes)` is called after changes are applied; `None` means "assume everything changed"."""
+        store = self._store(store_domain)
+        with self._lock:
+            store.listeners.append(listener)
+
+    def unsubscribe(self, store_domain: str, listener: Listener):
+        domain = normalize_store(store_domain)
+        with self._lock:
+            store = self._stores.get(domain)
+            if store is None:
+                return
+            if listener in store.listeners:
+                store.listeners.remove(listener)
+            if not store.listeners:
+                # Nobody serves this store here any more
+                del self._stores[domain]
+
+    def stores(self) -> List[str]:
+        with self._lock:
+            return list(self._stores)
+
+    def apply_changes(self, store_domain: str, changes: List[ProductChange], source: str = "event") -> int:
+        store = self._store(store_domain, create=False)
+        if store is None or not changes:
+            return 0
+        touched = 0
+        for change in changes:
+            if change.product is None and store.cache is not None:
+                # Let listeners match answers by the title we last served
+                change.product = store.cache.cached_product(change.product_id)
+            if store.cache is not None:
+                touched += store.cache.apply(change)
+            self.events.inc(kind="unchanged" if change.noop else change.kind, source=source)
+        changes = [change for change in changes if not change.noop]
+        if changes:
+            self._notify(store, changes)
+        return touched
+
+    def invalidate_all(self, store_domain: str):
+        store = self._store(store_domain, create=False)
+        if store is None:
+            return
+        if store.cache is not None:
+            store.cache.clear()
+        self._notify(store, None)
+
+    def _notify(self, store: _StoreCatalog, changes: Optional[List[ProductChange]]):
+        with self._lock:
+            listeners = list(store.listeners)
+        for listener in listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.warning("Catalog change listener failed: %s", e)
+
+    def apply_events(self, events: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """Apply a batch of relayed product events; events for stores not served here are skipped."""
+        by_store: Dict[str, List[ProductChange]] = {}
+        skipped = 0
+        for event in events:
+            store_domain = event.get("store")
+            if not store_domain or self._store(store_domain, create=False) is None:
+                skipped += 1
+                continue
+            try:
+                change = change_from_event(event, normalize_store(store_domain))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("Ignoring malformed catalog event: %s", e)
+                skipped += 1
+                continue
+            by_store.setdefault(store_domain, []).append(change)
+        applied = touched = 0
+        for store_domain, changes in by_store.items():
+            touched += self.apply_changes(store_domain, changes)
+            applied += len(changes)
+        return {"applied": applied, "skipped": skipped, "touched": touched}
+
+    def _fetch(self, store_domain: str, **params) -> Dict[str, Any]:
+        headers = {}
+        secret = os.environ.get("WEPPO_CATALOG_WEBHOOK_SECRET", "")
+        if secret:
+            headers["Authorization"] = f"Bearer {secret}"
+        response = self._http.get(self.digest_url.format(domain=normalize_store(store_domain)),
+                                  params={"buckets": self.buckets, **params}, headers=headers, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def reconcile(self, store_domain: str) -> int:
+        """
+        Compare the store's bucket digests with the last ones seen and diff the
+        listings of buckets that changed. Returns the number of changes found.
+        """
+        store = self._store(store_domain, create=False)
+        if store is None or not self.digest_url:
+            return 0
+        digests = self._fetch(store_domain)["buckets"]
+        if store.digests is None or len(store.digests) != len(digests):
+            # First pass: a baseline to compare the next one against
+            store.digests = digests
+            self.reconciliations.inc(result="baseline")
+            return 0
+
+        changes: List[ProductChange] = []
+        for bucket, digest in enumerate(digests):
+            if digest == store.digests[bucket]:
+                continue
+            self.buckets_fetched.inc()
+            listing = self._fetch(store_domain, bucket=bucket)["products"]
+            previous = store.listings.get(bucket)
+            if previous is None:
+                # No listing to diff against: anything cached from this bucket may be stale
+                if store.cache is not None:
+                    changes.extend(ProductChange(STALE, product_id)
+                                   for product_id in store.cache.invalidate_bucket(bucket, self.buckets))
+            else:
+                for product_id, entry in listing.items():
+                    if product_id not in previous:
+                        changes.append(ProductChange(CREATE, product_id, {"title": entry.get("title")}))
+                    elif previous[product_id].get("updated_at") != entry.get("updated_at"):
+                        changes.append(ProductChange(STALE, product_id))
+                changes.extend(ProductChange(DELETE, product_id) for product_id in previous if product_id not in listing)
+            store.listings[bucket] = listing
+        store.digests = digests
+        self.reconciliations.inc(result="changed" if changes else "unchanged")
+        if changes:
+            logger.info("Reconciliation found %d missed catalog changes for %s", len(changes), store_domain)
+            self.apply_changes(store_domain, changes, source="reconcile")
+        return len(changes)
+
+    async def run_reconciliation(self, interval: float = None):
+        """Background task: reconcile every store served here every `interval` seconds."""
+        interval = interval or float(os.environ.get("WEPPO_CATALOG_RECONCILE_INTERVAL", 300))
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            for store_domain in self.stores():
+                try:
+                    await loop.run_in_executor(None, self.reconcile, store_domain)
+                except Exception as e:
+                    self.reconciliations.inc(result="error")
+                    logger.warning("Catalog reconciliation for %s failed: %s", store_domain, e)
+
+
+CATALOG = CatalogSync()
@@ -1,24 +1,49 @@
+import asyncio
+import contextvars
 import logging
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Type, List, Dict, Any
 from pydantic import BaseModel, Field
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import BaseTool
 from ..mcp.shopify_server import ShopifyMCPServer
+from ..state.store import RESULTS, session_key
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Upper bound on queries fanned out by one tool call
+MAX_BATCH_QUERIES = int(os.environ.get('WEPPO_SEARCH_MAX_QUERIES', 5))
+# Products kept per session as its latest results
+MAX_REMEMBERED_RESULTS = 10
+# Shared by every store's tool; concurrent searches reuse the MCP client's pooled connections
+_search_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('WEPPO_SEARCH_WORKERS', 16)), thread_name_prefix="product-search"
+)
+
 class ShopifySearchInput(BaseModel):
     """Input schema for Shopify search tool"""
-    query: str = Field(description="Search query for products")
+    query: str = Field(default="", description="Search query for products")
+    queries: Optional[List[str]] = Field(
+        default=None,
+        description="Several query variants to search at once, e.g. ['wool runners', 'wool runners women']. "
+                    "Results are merged, de-duplicated and ranked into one list.",
+    )
 
 class ShopifySearchTool(BaseTool):
     """Custom tool for Shopify product search that handles content string responses"""
     name: str = "product_search"
-    description: str = "Search for products in the store catalog. Input should be a search query string."
+    description: str = (
+        "Search for products in the store catalog. Input should be a search query string. "
+        "To try several phrasings or variants, pass them together as `queries` in a single call "
+        "instead of calling the tool repeatedly."
+    )
     args_schema: Type[BaseModel] = ShopifySearchInput
     mcp_server: ShopifyMCPServer = Field(description="MCP server instance")
+    session_state: Optional[Any] = Field(default=None, exclude=True, description="SessionStateStore for latest results")
+    search_cache: Optional[Any] = Field(default=None, exclude=True, description="SearchCache kept fresh by catalog events")
+    affinity: Optional[Any] = Field(default=None, exclude=True, description="AffinityProfiles for personalized ordering")
     
     def __init__(self, mcp_server: ShopifyMCPServer, **kwargs):
         super().__init__(mcp_server=mcp_server, **kwargs)
@@ -84,7 +109,7 @@ class ShopifySearchTool(BaseTool):
                 data = json.loads(text_content)
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse 'text' as JSON: {str(e)}")
-                logger.debug(f"Content[0]['text']: {text_content[:200]}...")
+                logger.debug("Content[0]['text']: %s...", text_content[:200])
                 return {"products": [], "pagination": {}, "filters": []}
             
             products = data.get('products', [])
@@ -94,91 +119,250 @@ class ShopifySearchTool(BaseTool):
             
         except Exception as e:
             logger.error(f"Error parsing content: {str(e)}")
-            logger.debug(f"Content structure: {content}")
+            logger.debug("Content structure: %s", content)
             return {"products": [], "pagination": {}, "filters": []}
     
-    def _run(self, query: str) -> str:
-        """Execute the tool synchronously"""
+    def search_products(self, query: str) -> Dict[str, Any]:
+        """
+        Search the store and return parsed results as
+        {"products": [...], "pagination": {...}, "filters": [...]}, or {"error": "..."}.
+        """
+        if self.search_cache is not None:
+            cached = self.search_cache.get(query)
+            if cached is not None:
+                return cached
         try:
-            logger.info(f"Searching products with query: {query}")
-            result = self.mcp_server.get_products(query)
-            
-            # Log the full response for debugging
-            logger.debug(f"Full API response: {json.dumps(result, indent=2)[:500]}...")
-            
-            # Check for error in response
+            logger.debug("Searching products with query: %s", query)
+            return self._parse_result(query, self.mcp_server.get_products(query))
+        except Exception as e:
+            logger.error("Error in product search: %s", e, exc_info=True)
+            return {"error": f"Error searching products: {str(e)}"}
+    
+    async def asearch_products(self, query: str) -> Dict[str, Any]:
+        """Same as `search_products`, without blocking the event loop."""
+        if self.search_cache is not None:
+            cached = self.search_cache.get(query)
+            if cached is not None:
+                return cached
+        try:
+            logger.debug("Searching products asynchronously with query: %s", query)
+            return self._parse_result(query, await self.mcp_server.aget_products(query))
+        except Exception as e:
+            logger.exception(f"Error in product search: {str(e)}")
+            return {"error": f"Error searching products: {str(e)}"}
+    
+    def _parse_result(self, query: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn an MCP response into parsed results (cached when non-empty), or {"error": "..."}."""
+        # Log the full response for debugging; serialising it is only worth it when DEBUG is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Full API response: %s...", json.dumps(result, indent=2)[:500])
+        
+        # Check for error in response
+        if 'error' in result:
+            logger.error(f"Error from MCP server: {result['error']}")
+            return {"error": f"Error searching products: {result['error']}"}
+        
+        if result.get('result', {}).get('isError', False):
+            logger.error("MCP server returned isError=True")
+            return {"error": "Error: MCP server reported an error"}
+        
+        # Extract content
+        content = None
+        if 'result' in result and 'content' in result['result']:
+            content = result['result']['content']
+        elif 'content' in result:
+            content = result['content']
+        else:
+            logger.error(f"No content found in response structure: {list(result.keys())}")
+            return {"error": "Error: No content found in server response"}
+        
+        # Parse content to extract products and metadata
+        parsed = self._parse_content(content)
+        if self.search_cache is not None and parsed['products']:
+            self.search_cache.put(query, parsed)
+        return parsed
+    
+    @staticmethod
+    def _product_key(product: Dict[str, Any]) -> str:
+        return str(product.get('product_id') or product.get('url') or product.get('title'))
+    
+    def search_many(self, queries: List[str]) -> Dict[str, Any]:
+        """
+        Run several queries concurrently and merge the results into one ranked,
+        de-duplicated list (reciprocal-rank fusion across the queries).
+        """
+        unique_queries = self._batch_queries(queries)
+        if not unique_queries:
+            return {"error": "Error searching products: no query given"}
+        if len(unique_queries) == 1:
+            return self.search_products(unique_queries[0])
+        return self._merge(unique_queries, list(_search_executor.map(self.search_products, unique_queries)))
+    
+    async def asearch_many(self, queries: List[str]) -> Dict[str, Any]:
+        """Same as `search_many`, with the queries awaited concurrently on the event loop."""
+        unique_queries = self._batch_queries(queries)
+        if not unique_queries:
+            return {"error": "Error searching products: no query given"}
+        if len(unique_queries) == 1:
+            return await self.asearch_products(unique_queries[0])
+        results = await asyncio.gather(*(self.asearch_products(q) for q in unique_queries))
+        return self._merge(unique_queries, list(results))
+    
+    @staticmethod
+    def _batch_queries(queries: List[str]) -> List[str]:
+        return list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))[:MAX_BATCH_QUERIES]
+    
+    def _merge(self, unique_queries: List[str], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        scores: Dict[str, float] = {}
+        merged: Dict[str, Dict[str, Any]] = {}
+        filters: Dict[str, Dict[str, Any]] = {}
+        errors = []
+        for result in results:
             if 'error' in result:
-                logger.error(f"Error from MCP server: {result['error']}")
-                return f"Error searching products: {result['error']}"
-            
-            if result.get('result', {}).get('isError', False):
-                logger.error("MCP server returned isError=True")
-                return "Error: MCP server reported an error"
+                errors.append(result['error'])
+                continue
+            for rank, product in enumerate(result['products']):
+                if not isinstance(product, dict):
+                    continue
+                key = self._product_key(product)
+                merged.setdefault(key, product)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (rank + 1)
+            for f in result['filters']:
+                filters.setdefault(f.get('label', 'Unknown'), f)
+        
+        if errors and not merged:
+            return {"error": errors[0]}
+        
+        # dict preserves first-seen order, so ties keep the earlier query's ranking
+        ranked = sorted(merged, key=lambda key: -scores[key])
+        logger.debug("Merged %d queries into %d products", len(unique_queries), len(ranked))
+        return {
+            "products": [merged[key] for key in ranked],
+            "pagination": {},
+            "filters": list(filters.values()),
+            "queries": unique_queries,
+        }
+    
+    def _format_results(self, parsed_data: Dict[str, Any]) -> str:
+        """Format parsed search results as the markdown the agent reads."""
+        products = parsed_data['products']
+        pagination = parsed_data['pagination']
+        filters = parsed_data['filters']
+        
+        # Format products as markdown
+        markdown = "# Allbirds Products\n\n"
+        for i, product in enumerate(products):  # Removed limit to show all products
+            try:
+                if not isinstance(product, dict):
+                    logger.warning(f"Product {i+1} is not a dict: {type(product)}")
+                    continue
+                markdown += self._format_product_to_markdown(product) + "\n"
+            except Exception as e:
+                logger.error(f"Error formatting product {i+1}: {str(e)}")
+                logger.debug("Product data: %s", product)
+                continue
+        
+        if not markdown.strip().endswith("Products"):
+            # Add pagination info
+            if pagination.get('hasNextPage', False):
+                markdown += f"\n**Pagination**: Showing page {pagination.get('currentPage', 1)} of {pagination.get('maxPages', 1)}. Would you like to see more results?\n"
             
-            # Extract content
-            content = None
-            if 'result' in result and 'content' in result['result']:
-                content = result['result']['content']
-            elif 'content' in result:
-                content = result['content']
+            # Add available filters
+            filter_labels = [f.get('label', 'Unknown') for f in filters]
+            markdown += f"\n**Available Filters**: {', '.join(filter_labels)}\n"
+        else:
+            markdown += "No valid products could be formatted.\n"
+        return markdown
+    
+    def remember_results(self, thread_id: Optional[str], queries: List[str], products: List[Dict[str, Any]]):
+        """Record a session's latest results in the shared session state, trimmed to what a follow-up needs."""
+        if self.session_state is None or not thread_id:
+            return
+        remembered = []
+        for product in products[:MAX_REMEMBERED_RESULTS]:
+            if not isinstance(product, dict):
+                continue
+            entry = {key: product.get(key) for key in ('product_id', 'title', 'url', 'price_range', 'product_type')}
+            if self.affinity is not None:
+                # Lets product events name a result by id alone
+                entry['features'] = self.affinity_features(product)
+            remembered.append(entry)
+        self.session_state.put_json(session_key(thread_id, RESULTS), {"queries": queries, "products": remembered})
+    
+    def affinity_features(self, product: Dict[str, Any]) -> List[str]:
+        from .affinity import product_features
+        return product_features(product, self._clean_tags)
+    
+    def personalize(self, customer_id: Optional[str], query: str, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rerank results by the customer's affinity profile and count the request toward it."""
+        if self.affinity is None or not customer_id:
+            return products
+        products = self.affinity.rerank(customer_id, products, self._clean_tags)
+        self.affinity.observe_query(customer_id, query)
+        return products
+    
+    def _run(self, query: str = "", queries: Optional[List[str]] = None, config: RunnableConfig = None) -> str:
+        """Execute the tool synchronously"""
+        try:
+            if queries:
+                parsed_data = self.search_many([query] + list(queries) if query else list(queries))
             else:
-                logger.error(f"No content found in response structure: {list(result.keys())}")
-                return "Error: No content found in server response"
-            
-            # Parse content to extract products and metadata
-            parsed_data = self._parse_content(content)
-            products = parsed_data['products']
-            pagination = parsed_data['pagination']
-            filters = parsed_data['filters']
+                parsed_data = self.search_products(query)
+            return self._respond(parsed_data, query, queries, config)
             
-            if not products:
-                logger.warning("No products found in content")
-                return "No products found matching your search criteria."
-            
-            
-            # Format products as markdown
-            markdown = "# Allbirds Products\n\n"
-            for i, product in enumerate(products):  # Removed limit to show all products
-                try:
-                    if not isinstance(product, dict):
-                        logger.warning(f"Product {i+1} is not a dict: {type(product)}")
-                        continue
-                    markdown += self._format_product_to_markdown(product) + "\n"
-                except Exception as e:
-                    logger.error(f"Error formatting product {i+1}: {str(e)}")
-                    logger.debug(f"Product data: {product}")
-                    continue
-            
-            if not markdown.strip().endswith("Products"):
-                # Add pagination info
-                if pagination.get('hasNextPage', False):
-                    markdown += f"\n**Pagination**: Showing page {pagination.get('currentPage', 1)} of {pagination.get('maxPages', 1)}. Would you like to see more results?\n"
-                
-                # Add available filters
-                filter_labels = [f.get('label', 'Unknown') for f in filters]
-                markdown += f"\n**Available Filters**: {', '.join(filter_labels)}\n"
+        except Exception as e:
+            logger.error("Error in product search: %s", e, exc_info=True)
+            return f"Error searching products: {str(e)}"
+    
+    async def _arun(self, query: str = "", queries: Optional[List[str]] = None, config: RunnableConfig = None) -> str:
+        """Execute the tool asynchronously; searches are awaited on the event loop instead of holding a thread"""
+        try:
+            if queries:
+                parsed_data = await self.asearch_many([query] + list(queries) if query else list(queries))
             else:
-                markdown += "No valid products could be formatted.\n"
+                parsed_data = await self.asearch_products(query)
+            configurable = (config or {}).get('configurable', {})
+            if self.affinity is not None and configurable.get('customer_id') and 'error' not in parsed_data:
+                # Reading the customer's profile can go to the state backend
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    None, contextvars.copy_context().run, self._respond, parsed_data, query, queries, config
+                )
+            return self._respond(parsed_data, query, queries, config)
             
-            # Save to file
+        except Exception as e:
+            logger.exception(f"Error in product search: {str(e)}")
+            return f"Error searching products: {str(e)}"
+    
+    def _respond(self, parsed_data: Dict[str, Any], query: str, queries: Optional[List[str]],
+                 config: Optional[RunnableConfig]) -> str:
+        """Personalize, remember and format search results into the markdown the agent reads."""
+        if 'error' in parsed_data:
+            return parsed_data['error']
+        
+        if not parsed_data['products']:
+            logger.warning("No products found in content")
+            return "No products found matching your search criteria."
+        
+        configurable = (config or {}).get('configurable', {})
+        thread_id = configurable.get('thread_id')
+        parsed_data['products'] = self.personalize(
+            configurable.get('customer_id'), " ".join([query] + list(queries or [])), parsed_data['products']
+        )
+        self.remember_results(thread_id, parsed_data.get('queries') or [query], parsed_data['products'])
+        
+        markdown = self._format_results(parsed_data)
+        
+        # Save to file for inspection; a synchronous write per search is debug-only
+        if logger.isEnabledFor(logging.DEBUG):
             try:
                 with open('products.md', 'w') as f:
                     f.write(markdown)
-                logger.info("Saved formatted output to 'products.md'")
+                logger.debug("Saved formatted output to 'products.md'")
             except Exception as e:
                 logger.error(f"Error saving markdown file: {str(e)}")
-            
-            return markdown
-            
-        except Exception as e:
-            logger.error(f"Error in product search: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return f"Error searching products: {str(e)}"
-    
-    async def _arun(self, query: str) -> str:
-        """Execute the tool asynchronously"""
-        return self._run(query)
+        
+        return markdown
     
     class Config:
         """Pydantic config to allow arbitrary types"""
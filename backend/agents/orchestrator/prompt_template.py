@@ -34,6 +34,7 @@ def promptTemplate():
             
             "## TOOL USAGE:\n"
             "You MUST use the product_search tool to find products. NEVER make recommendations without first searching the catalog.\n"
+            "When you want to try several search terms or variants, pass them all in ONE product_search call using `queries` instead of calling the tool repeatedly.\n"
             "If the search returns no results, explain that and ask for different criteria.\n\n"
             
             "## IMPORTANT:\n"
@@ -0,0 +1,351 @@
+"""
+Chat model providers, imported only when selected.
+
+Each provider's LangChain integration is imported inside its factory, so the
+server only pays for the SDK it actually uses.
+
+This module is responsible for:
+    - Building a single chat model by provider name (WEPPO_LLM_PROVIDER).
+    - A registry of several providers (WEPPO_LLM_PROVIDERS) that keeps rolling
+      latency and error statistics, routes each request to the fastest healthy
+      provider, fails over on errors and optionally hedges slow calls: when the
+      chosen provider hasn't answered within its own p95 latency, the next one
+      is asked too and the first answer wins.
+"""
+
+import contextvars
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field, PrivateAttr
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = "xai"
+
+
+def _xai(model: str = "grok-3-mini", **kwargs: Any):
+    from langchain_xai import ChatXAI
+    return ChatXAI(model=model, api_key=os.environ.get('XAI_API_KEY'), **kwargs)
+
+
+def _gemini(model: str = "gemini-2.0-flash", **kwargs: Any):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=model, google_api_key=os.environ.get('GOOGLE_API_KEY'), **kwargs)
+
+
+def _ollama(model: str = None, **kwargs: Any):
+    from langchain_ollama import ChatOllama
+    # max_tokens is called num_predict in Ollama
+    if "max_tokens" in kwargs:
+        kwargs["num_predict"] = kwargs.pop("max_tokens")
+    return ChatOllama(model=model or os.environ.get('LOCAL_MISTRAL') or "mistral", **kwargs)
+
+
+PROVIDER_FACTORIES: Dict[str, Callable[..., Any]] = {
+    "xai": _xai,
+    "gemini": _gemini,
+    "ollama": _ollama,
+}
+
+
+def _build_provider(spec: str, **kwargs: Any):
+    """Build a model from a "provider" or "provider:model" spec."""
+    name, _, model = spec.strip().partition(":")
+    name = name.lower()
+    if name not in PROVIDER_FACTORIES:
+        raise ValueError(f"Unknown LLM provider '{name}'. Available: {', '.join(sorted(PROVIDER_FACTORIES))}")
+    if model and "model" not in kwargs:
+        kwargs["model"] = model
+    return PROVIDER_FACTORIES[name](**kwargs)
+
+
+class _ProviderStats:
+    __slots__ = ("latencies", "outcomes", "unhealthy_until")
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.unhealthy_until = 0.0
+
+
+class ProviderRegistry:
+    """
+    Named chat model providers with latency-aware routing and hedged calls.
+
+    Args:
+        window: Number of recent calls the latency and error statistics cover.
+        min_samples: Calls needed before a provider's error rate can mark it
+            unhealthy or its p95 is used as the hedge delay.
+        max_error_rate: Error rate over the window above which a provider is
+            skipped for `cooldown` seconds.
+        hedge: Send a second request when the first is slower than its p95.
+        hedge_min_delay: Lower bound on the hedge delay, so fast providers
+            aren't hedged on noise.
+        hedge_default_delay: Hedge delay before a provider has enough samples.
+        max_attempts: Providers tried per request, hedges and failovers included.
+    """
+
+    def __init__(self, window: int = 50, min_samples: int = 5, max_error_rate: float = 0.5,
+                 cooldown: float = 30.0, hedge: bool = True, hedge_min_delay: float = 0.5,
+                 hedge_default_delay: float = 3.0, max_attempts: int = 2, max_workers: int = 16,
+                 registry: MetricsRegistry = REGISTRY, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.max_attempts = max_attempts
+        self._clock = clock
+
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._stats: Dict[str, _ProviderStats] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-provider")
+
+        self._metrics = registry
+        self.requests = registry.counter(
+            "weppo_llm_requests_total", "Chat model calls per provider and outcome", ["provider", "outcome"])
+        self.latency = registry.histogram(
+            "weppo_llm_call_seconds", "Latency of successful chat model calls per provider", ["provider"])
+        self.hedges = registry.counter(
+            "weppo_llm_hedges_total", "Hedged chat model requests by which call answered first", ["winner"])
+        self._healthy = registry.gauge(
+            "weppo_llm_provider_healthy", "1 while the provider is eligible for routing", ["provider"])
+
+    @classmethod
+    def from_specs(cls, specs: Sequence[str], model_kwargs: Dict[str, Any] = None, **kwargs: Any) -> "ProviderRegistry":
+        """Registry of "provider" / "provider:model" specs, each built with `model_kwargs`."""
+        registry = cls(**kwargs)
+        for spec in specs:
+            registry.register(spec.strip(), lambda spec=spec: _build_provider(spec, **(model_kwargs or {})))
+        return registry
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Add a provider; `factory` builds its chat model on first use."""
+        stats = _ProviderStats(self.window)
+        with self._lock:
+            self._factories[name] = factory
+            self._stats[name] = stats
+        clock = self._clock
+        self._healthy.set_function(lambda: float(stats.unhealthy_until <= clock()), provider=name)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def model(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._models[name] = self._factories[name]()
+        return model
+
+    def median_latency(self, name: str) -> Optional[float]:
+        latencies = list(self._stats[name].latencies)
+        return statistics.median(latencies) if latencies else None
+
+    def p95_latency(self, name: str) -> Optional[float]:
+        latencies = sorted(self._stats[name].latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def error_rate(self, name: str) -> float:
+        outcomes = list(self._stats[name].outcomes)
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def healthy(self, name: str) -> bool:
+        return self._stats[name].unhealthy_until <= self._clock()
+
+    def rank(self) -> List[str]:
+        """
+        Healthy providers, fastest median first. Providers without samples rank
+        first (in registration order) so each one gets measured. If every
+        provider is cooling down, the one that recovers soonest is returned.
+        """
+        names = self.names
+        healthy = [name for name in names if self.healthy(name)]
+        if not healthy:
+            return sorted(names, key=lambda name: self._stats[name].unhealthy_until)[:1]
+
+        def key(name):
+            median = self.median_latency(name)
+            return (median if median is not None else 0.0, names.index(name))
+        return sorted(healthy, key=key)
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.p95_latency(name)
+        return max(self.hedge_min_delay, p95 if p95 is not None else self.hedge_default_delay)
+
+    def record(self, name: str, seconds: float, ok: bool):
+        stats = self._stats[name]
+        with self._lock:
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(seconds)
+            elif (len(stats.outcomes) >= self.min_samples
+                  and stats.outcomes.count(False) / len(stats.outcomes) > self.max_error_rate
+                  and stats.unhealthy_until <= self._clock()):
+                stats.unhealthy_until = self._clock() + self.cooldown
+                # Forget the failures so the provider gets a fresh start once it cools down
+                stats.outcomes.clear()
+                logger.warning("LLM provider %s marked unhealthy for %.0fs", name, self.cooldown)
+        if ok:
+            self.latency.observe(seconds, provider=name)
+        self.requests.inc(provider=name, outcome="ok" if ok else "error")
+
+    def _timed(self, call: Callable[[str], Any], name: str):
+        started = time.perf_counter()
+        try:
+            result = call(name)
+        except Exception as e:
+            self.record(name, time.perf_counter() - started, ok=False)
+            logger.warning("LLM provider %s failed: %s", name, e)
+            raise
+        self.record(name, time.perf_counter() - started, ok=True)
+        return result
+
+    def invoke(self, call: Callable[[str], Any]):
+        """
+        Run `call(provider_name)` on the best provider and return its result.
+
+        Errors fail over to the next provider. With hedging on, a call still
+        running after the provider's hedge delay gets a second call on the next
+        provider; whichever succeeds first is returned and the other is left to
+        finish in the background (its timing still feeds the statistics).
+        """
+        candidates = self.rank()[:self.max_attempts]
+        if not self.hedge or len(candidates) < 2:
+            error = None
+            for name in candidates:
+                try:
+                    return self._timed(call, name)
+                except Exception as e:
+                    error = e
+            raise error
+
+        primary = candidates[0]
+        pending = {}
+        error = None
+
+        def launch():
+            name = candidates.pop(0)
+            # Each call gets its own context copy so log/session context follows it
+            pending[self._executor.submit(contextvars.copy_context().run, self._timed, call, name)] = name
+
+        launch()
+        timeout = self.hedge_delay(primary)
+        hedged = False
+        while pending:
+            done, _ = wait(pending, timeout=timeout if candidates else None, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.debug("Hedging LLM call: %s slower than %.2fs", primary, timeout)
+                hedged = True
+                launch()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if hedged:
+                    self.hedges.inc(winner="primary" if name == primary else "hedge")
+                return result
+            if not pending and candidates:
+                launch()
+        raise error
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for name in self.names:
+            self._healthy.remove(provider=name)
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that sends each request through a ProviderRegistry.
+
+    Tool binding is applied to every provider's model, so the ReAct agent can
+    use it like any other chat model. Responses are not streamed token by token.
+    """
+
+    registry: Any
+    tools: Optional[List[Any]] = None
+    tool_kwargs: Dict[str, Any] = Field(default_factory=dict)
+    _bound: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "weppo-routed"
+
+    def bind_tools(self, tools, **kwargs: Any) -> "RoutedChatModel":
+        return RoutedChatModel(registry=self.registry, tools=list(tools), tool_kwargs=kwargs)
+
+    def _provider_model(self, name: str):
+        model = self._bound.get(name)
+        if model is None:
+            model = self.registry.model(name)
+            if self.tools is not None:
+                model = model.bind_tools(self.tools, **self.tool_kwargs)
+            self._bound[name] = model
+        return model
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message = self.registry.invoke(lambda name: self._provider_model(name).invoke(messages, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+_default_registry: Optional[ProviderRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry(specs: Sequence[str], model_kwargs: Dict[str, Any]) -> ProviderRegistry:
+    """Process-wide registry, so every store's agent shares the provider statistics."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ProviderRegistry.from_specs(
+                specs,
+                model_kwargs,
+                hedge=os.environ.get('WEPPO_LLM_HEDGE', '1') != '0',
+                hedge_min_delay=float(os.environ.get('WEPPO_LLM_HEDGE_MIN_DELAY', 0.5)),
+                max_error_rate=float(os.environ.get('WEPPO_LLM_MAX_ERROR_RATE', 0.5)),
+                cooldown=float(os.environ.get('WEPPO_LLM_COOLDOWN', 30)),
+            )
+        return _default_registry
+
+
+def load_chat_model(name: str = None, **kwargs: Any):
+    """
+    Build the chat model for provider `name` (default: WEPPO_LLM_PROVIDER, then xai).
+    WEPPO_LLM_MODEL overrides the provider's default model.
+
+    When WEPPO_LLM_PROVIDERS lists several providers ("xai,gemini:gemini-2.0-flash")
+    and no `name` is given, a RoutedChatModel over the shared registry is returned.
+    """
+    specs = [spec.strip() for spec in os.environ.get('WEPPO_LLM_PROVIDERS', '').split(',') if spec.strip()]
+    if name is None and len(specs) > 1:
+        return RoutedChatModel(registry=default_registry(specs, kwargs))
+
+    name = (name or (specs[0] if specs else None) or os.environ.get('WEPPO_LLM_PROVIDER') or DEFAULT_PROVIDER)
+    if os.environ.get('WEPPO_LLM_MODEL') and "model" not in kwargs and ":" not in name:
+        kwargs["model"] = os.environ['WEPPO_LLM_MODEL']
+    return _build_provider(name, **kwargs)
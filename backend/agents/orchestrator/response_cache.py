@@ -0,0 +1,195 @@
+"""
+Cross-session response cache for context-free first turns.
+
+Different shoppers open with near-identical questions ("what's your most popular
+shoe?"). Answers to first turns don't depend on conversation history, so they can
+be reused across sessions as long as the catalog hasn't changed. Queries are
+matched on a normalized token form (or on embeddings when an `embed` function is
+given) against a similarity threshold; entries expire after a TTL and are dropped
+when the catalog version moves on. Numbers, gender, size and price words must
+match exactly before similarity counts: "mens ... size 9" and "womens ... size 9"
+are close as token sets but want different answers.
+"""
+
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Optional, Sequence, Tuple
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+_STOPWORDS = frozenset("""
+a an and any are as at be can could do does for from have hey hi i i'm im in is it me my of on or please
+show tell that the this to want what what's whats which would you your you've alex ok okay so um uh
+""".split())
+
+
+# Normalized tokens that change what the right answer is; digits always do
+_CONSTRAINT_WORDS = frozenset("""
+men man male women woman female unisex kid boy girl baby toddler size small medium large xs xl xxl wide narrow
+under over below above less more than cheap cheaper cheapest expensive most least max min
+""".split())
+
+
+def normalize_query(text: str) -> Tuple[str, ...]:
+    """Lowercase, drop punctuation, stopwords and plural 's', and sort the remaining tokens."""
+    tokens = re.findall(r"[a-z0-9']+", text.lower())
+    normalized = set()
+    for token in tokens:
+        token = token.strip("'")
+        if token.endswith("'s"):
+            token = token[:-2]
+        if not token or token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        normalized.add(token)
+    return tuple(sorted(normalized))
+
+
+def query_constraints(key: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Tokens of a normalized query that another query must share exactly to reuse its answer."""
+    return tuple(token for token in key if token in _CONSTRAINT_WORDS or any(c.isdigit() for c in token))
+
+
+def _jaccard(a: Tuple[str, ...], b: Tuple[str, ...]) -> float:
+    if not a and not b:
+        return 1.0
+    sa, sb = set(a), set(b)
+    return len(sa & sb) / len(sa | sb)
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class _Entry:
+    __slots__ = ("key", "constraints", "vector", "catalog_version", "response", "created_at")
+
+    def __init__(self, key, vector, catalog_version, response, created_at):
+        self.key = key
+        self.constraints = query_constraints(key)
+        self.vector = vector
+        self.catalog_version = catalog_version
+        self.response = response
+        self.created_at = created_at
+
+
+class ResponseCache:
+    """
+    Similarity-matched, TTL-bounded LRU cache of agent answers.
+
+    Args:
+        threshold: Minimum similarity (Jaccard on normalized tokens, or cosine
+            on embeddings) for a cached answer to be reused; only entries with
+            the same constraint tokens (see `query_constraints`) are compared.
+        ttl: Seconds an answer stays valid.
+        max_entries: LRU bound; the similarity scan is linear in this.
+        embed: Optional text -> vector function used instead of token overlap.
+        name: Label for the per-cache gauges, usually the store domain.
+    """
+
+    def __init__(self, threshold: float = 0.8, ttl: float = 600.0, max_entries: int = 512,
+                 embed: Optional[Callable[[str], Sequence[float]]] = None, name: str = "default",
+                 registry: MetricsRegistry = REGISTRY, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self.name = name
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, ...], _Entry]" = OrderedDict()
+        self._recent_hits: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+        self.requests = registry.counter(
+            "weppo_response_cache_requests_total", "Response cache lookups for first turns", ["result"])
+        self.llm_calls_saved = registry.counter(
+            "weppo_response_cache_llm_calls_saved_total", "Agent runs avoided by serving a cached answer")
+        self._saved_per_hour = registry.gauge(
+            "weppo_response_cache_llm_calls_saved_per_hour", "Agent runs avoided by the response cache over the last hour",
+            ["store"])
+        self._saved_per_hour.set_function(self.saved_last_hour, store=name)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, entry: _Entry, now: float, catalog_version) -> bool:
+        return entry.catalog_version != catalog_version or now - entry.created_at > self.ttl
+
+    def lookup(self, query: str, catalog_version) -> Optional[str]:
+        key = normalize_query(query)
+        constraints = query_constraints(key)
+        vector = self.embed(query) if self.embed else None
+        now = self._clock()
+        best: Optional[_Entry] = None
+
+        with self._lock:
+            exact = self._entries.get(key)
+            if exact is not None and not self._expired(exact, now, catalog_version) and self.embed is None:
+                best = exact
+            else:
+                best_score = self.threshold
+                for entry_key, entry in list(self._entries.items()):
+                    if self._expired(entry, now, catalog_version):
+                        del self._entries[entry_key]
+                        continue
+                    if entry.constraints != constraints:
+                        continue
+                    score = _cosine(vector, entry.vector) if vector is not None else _jaccard(key, entry.key)
+                    if score >= best_score:
+                        best, best_score = entry, score
+
+            if best is None:
+                self.requests.inc(result="miss")
+                return None
+            self._entries.move_to_end(best.key)
+            self._recent_hits.append(now)
+
+        self.requests.inc(result="hit")
+        self.llm_calls_saved.inc()
+        return best.response
+
+    def store(self, query: str, catalog_version, response: str):
+        key = normalize_query(query)
+        if not key:
+            return
+        vector = self.embed(query) if self.embed else None
+        with self._lock:
+            self._entries[key] = _Entry(key, vector, catalog_version, response, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. when the catalog changes."""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_matching(self, terms: Sequence[str]) -> int:
+        """Drop cached answers that mention any of `terms` (e.g. a changed product's title or URL)."""
+        needles = [term.lower() for term in terms if term]
+        if not needles:
+            return 0
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if any(needle in entry.response.lower() for needle in needles)]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def close(self):
+        """Drop entries and stop reporting this cache's gauge."""
+        self.invalidate()
+        self._saved_per_hour.remove(store=self.name)
+
+    def saved_last_hour(self) -> float:
+        cutoff = self._clock() - 3600.0
+        with self._lock:
+            while self._recent_hits and self._recent_hits[0] < cutoff:
+                self._recent_hits.popleft()
+            return float(len(self._recent_hits))
@@ -0,0 +1,186 @@
+"""
+Fast-path intent router in front of the ReAct agent.
+
+Plain catalog lookups ("show me women's wool runners in size 8") are answered by
+calling the search tool directly and rendering a templated response, skipping
+the two or more LLM round trips of the agent loop. Anything open-ended, any
+follow-up that depends on earlier turns, and any lookup that finds nothing falls
+back to the LLM.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.agents.outils.metrics import REGISTRY, TRACER, MetricsRegistry
+from .product_search import ShopifySearchTool
+
+logger = logging.getLogger(__name__)
+
+_FILLER = r"(?:(?:hey|hi|hello|ok|okay|so|um|uh|well|please|alex)[,!.]?\s+)*"
+_POLITE = r"(?:(?:can|could|would|will) you\s+)?(?:please\s+)?"
+_LEAD = re.compile(
+    r"^" + _FILLER + _POLITE +
+    r"(?:show me|find me|find|search for|search|look for|i'?m looking for|i am looking for|looking for|"
+    r"do you have|do you sell|do you carry|have you got|i want|i'?d like|i would like|i need|get me|give me|list)"
+    r"\s+(?:some|any|a|an|the|your)?\s*",
+    re.I,
+)
+_PRODUCT_NOUN = re.compile(
+    r"\b(shoes?|sneakers?|runners?|trainers?|loungers?|dashers?|breezers?|pipers?|mizzles?|slip[- ]ons?|flats?|"
+    r"boots?|sandals?|slippers?|socks?|joggers?|pants|shorts|jackets?|hoodies?|sweaters?|tees?|t-shirts?|shirts?|apparel)\b",
+    re.I,
+)
+# Questions that need reasoning, comparison or advice go to the LLM
+_OPEN_ENDED = re.compile(
+    r"\b(why|how|which|what|should|recommend|suggest|compare|comparison|versus|vs|better|best|difference|"
+    r"advice|opinion|think|help me|gift|good for|worth|return|returns|shipping|refund|order|discount)\b",
+    re.I,
+)
+# Price limits and superlatives the fast path can't apply to plain search order
+_PRICE_LIMIT = re.compile(
+    r"\b(?:under|over|below|above|less than|more than|up to|between|within|max|maximum|budget|affordable|"
+    r"cheap|cheapest|priciest|expensive|most expensive|least expensive|lowest|highest|price[ds]?)\b|"
+    r"[$€£]\s?\d|\b\d+\s*(?:dollars?|bucks|usd|euros?|eur|pounds?|gbp)\b",
+    re.I,
+)
+# References to earlier turns need the conversation context the LLM holds
+_ANAPHORA = re.compile(r"\b(it|its|them|they|those|these|that|this one|ones|same|more|other|another|else|instead|cheaper)\b", re.I)
+_SIZE = re.compile(r"\b(?:in\s+)?(?:a\s+)?size\s+(\d{1,2}(?:\.5)?)\b", re.I)
+_TRAILING = re.compile(r"(?:\s+(?:please|for me|thanks|thank you|today|now))+$", re.I)
+
+MAX_QUERY_WORDS = 8
+
+
+def _routed_fraction(decisions) -> float:
+    fast = decisions.value(route="fast")
+    total = fast + decisions.value(route="llm")
+    return fast / total if total else 0.0
+
+
+class IntentRouter:
+    """
+    Rule-based classifier for simple search/filter intents.
+
+    `route()` returns a rendered response when the request was served on the
+    fast path and None when it should go through the LLM agent.
+    """
+
+    def __init__(self, search_tool: ShopifySearchTool, max_products: int = 3,
+                 registry: MetricsRegistry = REGISTRY):
+        self.search_tool = search_tool
+        self.max_products = max_products
+        self._llm_latency_ema: Optional[float] = None
+        self._lock = threading.Lock()
+
+        self.decisions = registry.counter(
+            "weppo_router_decisions_total", "Requests handled by the fast path or sent to the LLM agent", ["route"])
+        self.latency_saved = registry.counter(
+            "weppo_router_latency_saved_seconds_total",
+            "Estimated agent latency avoided by the fast path (LLM-path average minus fast-path time)")
+        # Counters are shared by every store's router; the gauge must not pin this instance
+        decisions = self.decisions
+        registry.gauge(
+            "weppo_router_routed_fraction", "Fraction of requests served by the fast path"
+        ).set_function(lambda: _routed_fraction(decisions))
+
+    def routed_fraction(self) -> float:
+        return _routed_fraction(self.decisions)
+
+    def classify(self, text: str) -> Optional[Dict[str, Any]]:
+        """Return {"query": ..., "size": ...} for a simple catalog lookup, otherwise None."""
+        utterance = text.strip().rstrip("?.!").strip()
+        if (not utterance or _OPEN_ENDED.search(utterance) or _ANAPHORA.search(utterance)
+                or _PRICE_LIMIT.search(utterance)):
+            return None
+
+        lead = _LEAD.match(utterance)
+        remainder = utterance[lead.end():] if lead else utterance
+        # Without a lead-in ("show me", "do you have") only accept a bare product phrase
+        if not _PRODUCT_NOUN.search(remainder) or (not lead and len(remainder.split()) > 5):
+            return None
+
+        size = None
+        size_match = _SIZE.search(remainder)
+        if size_match:
+            size = size_match.group(1)
+            remainder = _SIZE.sub(" ", remainder)
+
+        query = _TRAILING.sub("", re.sub(r"\s+", " ", remainder)).strip(" ,")
+        if not query or len(query.split()) > MAX_QUERY_WORDS:
+            return None
+        return {"query": query, "size": size}
+
+    def route(self, text: str, thread_id: Optional[str] = None, customer_id: Optional[str] = None) -> Optional[str]:
+        started = time.perf_counter()
+        intent = self.classify(text)
+        if intent is None:
+            self.decisions.inc(route="llm")
+            return None
+
+        results = self.search_tool.search_products(intent["query"])
+        products = [p for p in results.get("products", []) if isinstance(p, dict)]
+        if intent["size"]:
+            products = [p for p in products if self._has_size(p, intent["size"])]
+        if "error" in results or not products:
+            # Let the agent explain the miss and suggest alternatives
+            logger.debug("Fast path found nothing for %r, falling back to the agent", intent["query"])
+            self.decisions.inc(route="llm")
+            return None
+
+        products = self.search_tool.personalize(customer_id, text, products)
+        self.search_tool.remember_results(thread_id, [intent["query"]], products)
+        response = self.render(intent, products[:self.max_products], len(products))
+        elapsed = time.perf_counter() - started
+        self.decisions.inc(route="fast")
+        TRACER.record("fast_path", elapsed)
+        with self._lock:
+            baseline = self._llm_latency_ema
+        if baseline is not None:
+            self.latency_saved.inc(max(0.0, baseline - elapsed))
+        logger.debug("Fast path served %r in %.3fs", intent["query"], elapsed)
+        return response
+
+    def observe_llm_latency(self, seconds: float, alpha: float = 0.2):
+        """Feed the duration of an LLM-path turn into the baseline used to estimate savings."""
+        with self._lock:
+            if self._llm_latency_ema is None:
+                self._llm_latency_ema = seconds
+            else:
+                self._llm_latency_ema += alpha * (seconds - self._llm_latency_ema)
+
+    @staticmethod
+    def _has_size(product: Dict[str, Any], size: str) -> bool:
+        return any(
+            variant.get("available", False) and str(variant.get("title", "")).split(" ")[0] == size
+            for variant in product.get("variants", [])
+        )
+
+    def render(self, intent: Dict[str, Any], products: List[Dict[str, Any]], total: int) -> str:
+        """Templated answer in the agent's response format."""
+        subject = intent["query"] + (f" in size {intent['size']}" if intent["size"] else "")
+        lines = [f"Here {'is' if total == 1 else 'are'} what I found in our catalog for {subject}:", ""]
+
+        for product in products:
+            price_range = product.get("price_range", {})
+            variants = product.get("variants", [])
+            sizes = [v.get("title", "Unknown") for v in variants if v.get("available", False)]
+            features = [
+                tag for tag in self.search_tool._clean_tags(product.get("tags", []))
+                if any(key in tag.lower() for key in ["material", "style", "gender", "edition"])
+            ]
+            lines.append(f"### [{product.get('title', 'Unknown Product')}]({product.get('url', '')})")
+            lines.append(f"- **Price**: {price_range.get('min', 'Price not available')} {price_range.get('currency', '')}".rstrip())
+            lines.append(f"- **Availability**: {'In stock' if sizes else 'Out of stock'}")
+            if features:
+                lines.append(f"- **Key Features**: {', '.join(features[:3])}")
+            if sizes:
+                lines.append(f"- **Available Sizes**: {', '.join(sizes)}")
+            lines.append("")
+
+        if total > len(products):
+            lines.append(f"I found {total} matches in total and picked the top {len(products)}.")
+        lines.append("Would you like more details on any of these, or should I narrow the search down further?")
+        return "\n".join(lines)
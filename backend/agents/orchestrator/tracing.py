@@ -0,0 +1,52 @@
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from backend.agents.outils.metrics import TRACER, TurnTracer
+
+
+class TurnTracingCallback(BaseCallbackHandler):
+    """
+    Records LLM generation and tool call durations of one agent run as turn stages.
+
+    Tool calls are recorded under the tool name (e.g. `product_search`),
+    model calls under `llm`.
+    """
+
+    def __init__(self, thread_id: str, tracer: TurnTracer = TRACER):
+        self.thread_id = thread_id
+        self.tracer = tracer
+        self._started: Dict[UUID, tuple] = {}
+
+    def _start(self, run_id: UUID, stage: str):
+        self._started[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        started = self._started.pop(run_id, None)
+        if started:
+            stage, start = started
+            self.tracer.record(stage, time.perf_counter() - start)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "llm")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      name: Optional[str] = None, **kwargs: Any):
+        self._start(run_id, name or (serialized or {}).get("name") or "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
@@ -0,0 +1,54 @@
+"""
+Worker readiness.
+
+This module is responsible for:
+    - Recording the outcome and duration of each warm-up step.
+    - Reporting the worker as ready only once warm-up has finished, so load
+      balancers polling /ready never route a session to a cold worker.
+"""
+
+import threading
+import time
+from typing import Any, Dict
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+
+class Readiness:
+    """Warm-up progress of this worker, shared by the websocket and API servers."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self._ready = False
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.warmup_seconds = registry.histogram(
+            "weppo_warmup_step_seconds", "Duration of each startup warm-up step", ["step"])
+        registry.gauge("weppo_ready", "1 once warm-up has finished and the worker takes traffic").set_function(
+            lambda: float(self._ready))
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def record_step(self, step: str, seconds: float, error: Exception = None):
+        self.warmup_seconds.observe(seconds, step=step)
+        with self._lock:
+            self._steps[step] = {"ok": error is None, "seconds": round(seconds, 3)}
+            if error is not None:
+                self._steps[step]["error"] = str(error)
+
+    def mark_ready(self):
+        self._ready = True
+
+    def mark_not_ready(self):
+        """E.g. while draining before shutdown."""
+        self._ready = False
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {step: dict(info) for step, info in self._steps.items()}
+        return {"ready": self._ready, "uptime_seconds": round(time.time() - self.started_at, 1), "warmup": steps}
+
+
+READINESS = Readiness()
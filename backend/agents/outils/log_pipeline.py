@@ -0,0 +1,132 @@
+"""
+Asynchronous, level-gated logging pipeline.
+
+This module is responsible for:
+    - Handing log records to a background writer thread through a bounded queue,
+      so the event loop and executor threads never block on stdout/stderr.
+    - Attaching the current session (websocket thread id) to every record.
+    - Sampling high-frequency events such as interim transcripts.
+
+Hot paths log with %-style arguments (never f-strings) so a disabled level costs
+a single `isEnabledFor` check. Mark high-frequency records with
+`extra={"sample": "<key>"}` to keep only one in `WEPPO_LOG_SAMPLE_EVERY` of them.
+
+Configuration (environment):
+    WEPPO_LOG_LEVEL         Root level, default INFO
+    WEPPO_LOG_SAMPLE_EVERY  Keep 1 in N sampled records, default 20 (0 drops them all)
+    WEPPO_LOG_QUEUE_SIZE    Records buffered before new ones are dropped, default 10000
+"""
+
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from backend.agents.outils.metrics import REGISTRY
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(session)s] %(message)s"
+
+session_id: contextvars.ContextVar = contextvars.ContextVar("session_id", default="-")
+
+_dropped = REGISTRY.counter("weppo_log_records_dropped_total", "Log records dropped because the log queue was full")
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+@contextmanager
+def bind_session(thread_id: str) -> Iterator[None]:
+    """Attach `thread_id` to every record logged from the current context."""
+    token = session_id.set(thread_id)
+    try:
+        yield
+    finally:
+        session_id.reset(token)
+
+
+class SessionContextFilter(logging.Filter):
+    """Stamps records with the session bound in the current context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "session"):
+            record.session = session_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in `every` records that carry a `sample` key; other records pass untouched."""
+
+    def __init__(self, every: int = 20):
+        super().__init__()
+        self.every = every
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        if self.every <= 0:
+            return False
+        with self._lock:
+            count = self._seen.get(key, 0)
+            self._seen[key] = count + 1
+        return count % self.every == 0
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped.inc()
+
+
+def configure_logging(level: Optional[str] = None, sample_every: Optional[int] = None,
+                      queue_size: Optional[int] = None, stream=None) -> logging.handlers.QueueListener:
+    """
+    Route the root logger through a background writer. Safe to call more than once;
+    later calls replace the previous pipeline.
+    """
+    global _listener
+
+    level = (level or os.environ.get("WEPPO_LOG_LEVEL", "INFO")).upper()
+    sample_every = sample_every if sample_every is not None else int(os.environ.get("WEPPO_LOG_SAMPLE_EVERY", 20))
+    queue_size = queue_size if queue_size is not None else int(os.environ.get("WEPPO_LOG_QUEUE_SIZE", 10000))
+
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+
+        writer = logging.StreamHandler(stream or sys.stderr)
+        writer.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        # Filters run in the calling thread, before the record is queued
+        handler.addFilter(SamplingFilter(sample_every))
+        handler.addFilter(SessionContextFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,296 @@
+"""
+In-process metrics and per-turn latency tracing.
+
+This module is responsible for:
+    - Counters, gauges and histograms that can be updated from the event loop
+      and from executor threads.
+    - Span-based timing of each conversational turn, keyed by the session thread id.
+    - Rendering everything in the Prometheus text exposition format.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from fast cache hits up to slow LLM turns
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Evaluate `function` on every scrape instead of storing a value."""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+            self._functions.pop(key, None)
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return float(function()) if function else self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = float(function())
+            except Exception:
+                continue
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, as scraped by Prometheus."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket containing it."""
+        counts = self._counts.get(self._key(labels))
+        if not counts:
+            return None
+        target = q * sum(counts)
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            snapshot = {key: (list(counts), self._sums[key]) for key, counts in self._counts.items()}
+        for key, (counts, total) in sorted(snapshot.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds named metrics; asking twice for the same name returns the same metric."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class TurnTracer:
+    """
+    Times the stages of each conversational turn, keyed by session thread id.
+
+    A turn starts with the first audio received after the previous turn ended
+    and ends once the response has been spoken. Stage durations are aggregated
+    into `weppo_turn_stage_seconds{stage=...}`; per-session data is dropped when
+    the turn ends so the label set stays bounded.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.stage_seconds = registry.histogram(
+            "weppo_turn_stage_seconds", "Duration of each stage of a conversational turn", ["stage"])
+        self.turn_seconds = registry.histogram(
+            "weppo_turn_seconds", "Time from final transcript to the end of the spoken response")
+        self.turns_total = registry.counter("weppo_turns_total", "Completed conversational turns")
+        self._marks: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, thread_id: str, event: str, once: bool = False) -> float:
+        """Record the time of `event` in the current turn; with once=True keep the first occurrence."""
+        now = time.perf_counter()
+        with self._lock:
+            marks = self._marks.setdefault(thread_id, {})
+            if once and event in marks:
+                return marks[event]
+            marks[event] = now
+        return now
+
+    def since(self, thread_id: str, event: str) -> Optional[float]:
+        marks = self._marks.get(thread_id, {})
+        return time.perf_counter() - marks[event] if event in marks else None
+
+    def observe_between(self, thread_id: str, stage: str, start_event: str, end_event: str):
+        marks = self._marks.get(thread_id, {})
+        if start_event in marks and end_event in marks:
+            self.stage_seconds.observe(marks[end_event] - marks[start_event], stage=stage)
+
+    def record(self, stage: str, seconds: float):
+        self.stage_seconds.observe(seconds, stage=stage)
+
+    @contextmanager
+    def span(self, thread_id: str, stage: str) -> Iterator[None]:
+        """Time a block as `stage`, marking `<stage>_start` / `<stage>_end` on the turn."""
+        start = self.mark(thread_id, f"{stage}_start")
+        try:
+            yield
+        finally:
+            end = self.mark(thread_id, f"{stage}_end")
+            self.stage_seconds.observe(end - start, stage=stage)
+
+    def end_turn(self, thread_id: str):
+        with self._lock:
+            marks = self._marks.pop(thread_id, {})
+        if "stt_final" in marks:
+            self.turn_seconds.observe(time.perf_counter() - marks["stt_final"])
+            self.turns_total.inc()
+
+    def discard(self, thread_id: str):
+        with self._lock:
+            self._marks.pop(thread_id, None)
+
+
+# Process-wide registry served by the FastAPI app at /metrics
+REGISTRY = MetricsRegistry()
+TRACER = TurnTracer(REGISTRY)
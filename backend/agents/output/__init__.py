@@ -0,0 +1,3 @@
+"""
+Weppo output processing package
+"""
@@ -0,0 +1,111 @@
+"""
+Latency-masking filler audio.
+
+This module is responsible for:
+    - A rotating set of short acknowledgements ("Let me check the catalog...")
+      synthesized once and kept on local disk (WEPPO_FILLER_DIR), so playing one
+      never waits on the TTS API.
+    - Deciding per turn whether one plays: only when the agent hasn't answered
+      within WEPPO_FILLER_AFTER seconds of the final transcript.
+    - Counting fillers played and skipped (weppo_filler_total).
+
+The server sends a filler as a complete clip of its own, and the answer's audio
+only starts after it, so the two never interleave.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PHRASES = (
+    "Let me check the catalog.|"
+    "One moment, I'm looking that up.|"
+    "Sure, let me find some options for you.|"
+    "Give me a second to search the store."
+)
+DEFAULT_DIRECTORY = Path(__file__).parent / "fillers"
+
+
+def filler_path(directory: Path, phrase: str, voice_id: str, model_id: str, output_format: str) -> Path:
+    """Where a phrase's audio is stored; the name changes with anything that changes the audio."""
+    digest = hashlib.sha1("|".join((phrase, voice_id, model_id)).encode("utf-8")).hexdigest()[:16]
+    return directory / f"{digest}_{output_format}.{output_format.split('_')[0]}"
+
+
+class FillerAudio:
+    """
+    Pre-synthesized acknowledgements, handed out in rotation.
+
+    Args:
+        phrases: What may be said (WEPPO_FILLER_PHRASES, separated by "|").
+        directory: Where synthesized phrases are stored between runs (WEPPO_FILLER_DIR).
+        after: Seconds the agent may take before a filler plays (WEPPO_FILLER_AFTER).
+        enabled: WEPPO_FILLER=0 turns fillers off.
+    """
+
+    def __init__(self, phrases: Optional[List[str]] = None, directory: Optional[str] = None, after: float = None,
+                 enabled: bool = None, registry: MetricsRegistry = REGISTRY):
+        self.phrases = phrases if phrases is not None else [
+            phrase.strip() for phrase in (os.environ.get("WEPPO_FILLER_PHRASES") or DEFAULT_PHRASES).split("|")
+            if phrase.strip()]
+        self.directory = Path(directory or os.environ.get("WEPPO_FILLER_DIR") or DEFAULT_DIRECTORY)
+        self.after = after if after is not None else float(os.environ.get("WEPPO_FILLER_AFTER", 0.8))
+        self.enabled = enabled if enabled is not None else os.environ.get("WEPPO_FILLER", "1") != "0"
+        # output_format -> [(phrase, audio)], in rotation order
+        self._clips: Dict[str, List[Tuple[str, bytes]]] = {}
+        self._next = 0
+
+        self.fillers = registry.counter(
+            "weppo_filler_total", "Turns that played a filler or answered before one was needed", ["result"])
+
+    def load(self, tts_client, output_formats: Iterable[str], voice_id: str = "JBFqnCBsd6RMkjVDRZzb",
+             model_id: str = "eleven_multilingual_v2") -> int:
+        """
+        Read each phrase's audio from `directory`, synthesizing (and storing)
+        the ones not there yet. Returns the number of clips available.
+        """
+        if not self.enabled:
+            return 0
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning("Filler directory %s is not writable: %s", self.directory, e)
+        loaded = 0
+        for output_format in output_formats:
+            clips = []
+            for phrase in self.phrases:
+                path = filler_path(self.directory, phrase, voice_id, model_id, output_format)
+                if path.exists():
+                    audio = path.read_bytes()
+                else:
+                    audio = b"".join(tts_client.stream_audio(phrase, voice_id, model_id, output_format))
+                    try:
+                        path.write_bytes(audio)
+                    except OSError as e:
+                        logger.debug("Could not store filler audio at %s: %s", path, e)
+                if audio:
+                    clips.append((phrase, audio))
+            self._clips[output_format] = clips
+            loaded += len(clips)
+        return loaded
+
+    def next_clip(self, output_format: str) -> Optional[Tuple[str, bytes]]:
+        """The next (phrase, audio) in rotation, or None without clips in `output_format`."""
+        clips = self._clips.get(output_format)
+        if not self.enabled or not clips:
+            return None
+        clip = clips[self._next % len(clips)]
+        self._next += 1
+        return clip
+
+    def played(self, was_played: bool):
+        self.fillers.inc(result="played" if was_played else "skipped")
+
+
+FILLERS = FillerAudio()
@@ -0,0 +1,192 @@
+"""
+Spoken rendition of agent responses.
+
+This module is responsible for:
+    - Turning an agent response (markdown in the prompt template's response
+      format: headings, bold labels, product links, bullet lists) into a short
+      conversational summary for text-to-speech: the opening line, the top
+      products with their prices, and the closing question. Links, URLs and
+      markup are never spoken; the full markdown still goes to the screen.
+    - Estimating how long synthesized audio lasts from its size and format.
+    - Tracking characters synthesized and audio duration per turn
+      (weppo_tts_characters, weppo_tts_audio_seconds).
+
+Rule-based on purpose: it runs between the agent and TTS on every turn, so it
+must cost microseconds, not another model call.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+
+# Products read out; the rest are left to the screen
+MAX_SPOKEN_ITEMS = int(os.environ.get("WEPPO_SPOKEN_MAX_ITEMS", 3))
+# Upper bound on a rendition built from unstructured text
+MAX_SPOKEN_CHARS = int(os.environ.get("WEPPO_SPOKEN_MAX_CHARS", 400))
+
+CURRENCY_WORDS = {"USD": "dollars", "EUR": "euros", "GBP": "pounds", "CAD": "Canadian dollars",
+                  "AUD": "Australian dollars", "JPY": "yen"}
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+
+_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_URL = re.compile(r"(?:https?://|www\.)\S+")
+_EMPHASIS = re.compile(r"(\*\*|__|\*|`|~~)")
+_LIST_PREFIX = re.compile(r"^\s*(?:[-*+•]|\d+[.)])\s+")
+_HEADING = re.compile(r"^\s*#{1,6}\s*")
+# Labels from the prompt template's response format, e.g. "**Next Steps**: ..."
+_SECTION_LABEL = re.compile(r"^(?:introduction|search results|additional options|next steps)\s*:\s*", re.I)
+# Amounts with grouping commas ("1,299.99") or a decimal comma ("49,90")
+_AMOUNT = r"\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2}|,\d{2}(?!\d))?"
+_PRICE = re.compile(rf"(?:([$€£¥])\s?({_AMOUNT}))|(?:({_AMOUNT})\s?(USD|EUR|GBP|CAD|AUD|JPY)\b)")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _plain(text: str) -> str:
+    """Markdown line to plain text: link text kept, URLs and markup dropped."""
+    text = _LINK.sub(r"\1", text)
+    text = _URL.sub("", text)
+    text = _HEADING.sub("", text)
+    text = _LIST_PREFIX.sub("", text)
+    text = _EMPHASIS.sub("", text)
+    text = _SECTION_LABEL.sub("", text.strip())
+    return re.sub(r"\s+", " ", text).strip(" -|")
+
+
+def spoken_price(match: "re.Match") -> str:
+    symbol, amount, bare_amount, code = match.groups()
+    amount = amount or bare_amount
+    code = code or CURRENCY_SYMBOLS.get(symbol, "")
+    if re.fullmatch(r"\d+,\d{2}", amount):
+        # Decimal comma: "49,90" is 49.90
+        amount = amount.replace(",", ".")
+    else:
+        amount = amount.replace(",", "")
+    if "." in amount and float(amount) == int(float(amount)):
+        amount = str(int(float(amount)))
+    return f"{amount} {CURRENCY_WORDS.get(code, code)}".strip()
+
+
+def _product_title(line: str) -> Optional[str]:
+    """Title of a product entry: a linked heading or list item, or a numbered item opening in bold."""
+    stripped = line.strip()
+    link = _LINK.search(stripped)
+    if link and link.group(1).strip() and (
+            stripped.startswith(("#", "[", "**[")) or _LIST_PREFIX.match(stripped)):
+        return _plain(link.group(1))
+    bold = re.match(r"^\d+[.)]\s+\*\*([^*]+)\*\*", stripped)
+    if bold and not _SECTION_LABEL.match(bold.group(1).rstrip(":") + ":"):
+        return _plain(bold.group(1)).rstrip(":")
+    return None
+
+
+def _join(items: List[str]) -> str:
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _clip(text: str, limit: int) -> str:
+    """At most `limit` characters, cut at a sentence end where possible."""
+    if len(text) <= limit:
+        return text
+    kept = ""
+    for sentence in _SENTENCE.split(text):
+        if len(kept) + len(sentence) + 1 > limit:
+            break
+        kept = f"{kept} {sentence}".strip()
+    return kept or text[:limit].rsplit(" ", 1)[0] + "..."
+
+
+def _sentence(text: str) -> str:
+    return text if not text or text[-1] in ".!?:" else text + "."
+
+
+def spoken_rendition(markdown: str, max_items: int = None, max_chars: int = None) -> str:
+    """
+    A short, speakable summary of an agent response.
+
+    A response listing products ("### [Wool Runner](https://...)" followed by a
+    "- **Price**: 98.0 USD" bullet, ...) is read as its opening line, the first
+    `max_items` titles with prices ("Wool Runner for 98 dollars") and its closing
+    question. Text without products is only cleaned of markup (and clipped to
+    `max_chars`), so pre-synthesized phrases still match.
+    """
+    max_items = max_items or MAX_SPOKEN_ITEMS
+    max_chars = max_chars or MAX_SPOKEN_CHARS
+
+    intro: List[str] = []
+    products: List[Dict[str, str]] = []
+    after: List[str] = []
+    for line in (markdown or "").splitlines():
+        if not line.strip():
+            continue
+        title = _product_title(line)
+        if title:
+            # Colorways in parentheses ("Wool Runner (Light Grey Sole)") are for the screen
+            products.append({"title": re.sub(r"\s*\([^)]*\)", "", title), "price": ""})
+            after = []
+        elif not products:
+            # Bare headings ("# Allbirds Products") and section labels aren't worth saying
+            plain = "" if line.lstrip().startswith("#") else _plain(line)
+            if plain:
+                intro.append(plain)
+            continue
+        elif not (_LIST_PREFIX.match(line) or line[0] in " \t") or _SECTION_LABEL.match(
+                _EMPHASIS.sub("", _LIST_PREFIX.sub("", line.strip()))):
+            # Detail lines (bullets, indented) belong to the product; others may close the answer
+            after.append(_plain(line))
+        price = _PRICE.search(_LINK.sub(r"\1", line))
+        if price and not products[-1]["price"]:
+            products[-1]["price"] = spoken_price(price)
+
+    if not products:
+        return _clip(" ".join(_sentence(part) for part in intro), max_chars)
+
+    opening = _sentence(intro[0]) if intro else "Here is what I found:"
+    named = _join([f"{p['title']} for {p['price']}" if p["price"] else p["title"] for p in products[:max_items]])
+    spoken = [f"{opening} {_sentence(named)}"]
+    if len(products) > max_items:
+        more = len(products) - max_items
+        spoken.append(f"There {'is' if more == 1 else 'are'} {more} more on your screen.")
+    # The whole closing line, so "Would you like other colors? Or sizes?" keeps both questions
+    questions = [part for part in after if "?" in part]
+    if questions:
+        spoken.append(questions[-1])
+    return " ".join(spoken)
+
+
+def audio_seconds(byte_count: int, output_format: str) -> float:
+    """Duration of `byte_count` bytes of synthesized audio in an ElevenLabs `output_format` (mp3_44100_128, pcm_16000, ulaw_8000)."""
+    parts = output_format.split("_")
+    codec = parts[0]
+    if codec == "mp3" and len(parts) >= 3:
+        return byte_count * 8 / (int(parts[2]) * 1000)
+    if codec == "pcm" and len(parts) >= 2:
+        return byte_count / (2 * int(parts[1]))
+    if codec in ("ulaw", "alaw") and len(parts) >= 2:
+        return byte_count / int(parts[1])
+    return 0.0
+
+
+class SpeechAccounting:
+    """Characters synthesized and audio produced per turn, against what the full response would have cost."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY):
+        self.characters = registry.histogram(
+            "weppo_tts_characters", "Characters sent to text-to-speech per turn", ["text"],
+            buckets=(25, 50, 100, 200, 400, 800, 1600, 3200))
+        self.audio_seconds = registry.histogram(
+            "weppo_tts_audio_seconds", "Seconds of audio synthesized per turn",
+            buckets=(1, 2, 5, 10, 20, 40, 80))
+
+    def record(self, full_text: str, spoken_text: str, audio_bytes: int, output_format: str):
+        self.characters.observe(len(spoken_text), text="spoken")
+        # What synthesizing the on-screen response would have cost, for comparison
+        self.characters.observe(len(full_text), text="full")
+        if audio_bytes:
+            self.audio_seconds.observe(audio_seconds(audio_bytes, output_format))
+
+
+SPEECH = SpeechAccounting()
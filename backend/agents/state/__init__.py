@@ -0,0 +1,3 @@
+"""
+Weppo shared session state package
+"""
@@ -0,0 +1,320 @@
+"""
+Key-value backends for shared session state.
+
+This module is responsible for:
+    - The small interface the session-state store batches onto: read many keys
+      at once, and write/delete many keys at once (values are bytes).
+    - An in-process backend (one worker, the default), a SQLite backend
+      (workers on one host share a file) and a Redis-protocol backend (any
+      worker on any node), picked with WEPPO_STATE_URL:
+          memory://
+          sqlite:///var/lib/weppo/state.db
+          redis://[:password@]host:6379/0
+    - A dependency-free RESP client with a small connection pool; each batch is
+      sent as one pipeline, so it costs a single round trip.
+"""
+
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """Batched key-value operations. `None` as a value in `write_many` deletes the key."""
+
+    def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        raise NotImplementedError
+
+    def write_many(self, items: Dict[str, Optional[bytes]], ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Process-local dict; state is lost on restart and not visible to other workers."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self._data[key]
+                    entry = None
+                values.append(entry[0] if entry else None)
+        return values
+
+    def write_many(self, items: Dict[str, Optional[bytes]], ttl: Optional[float] = None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in items.items():
+                if value is None:
+                    self._data.pop(key, None)
+                else:
+                    self._data[key] = (value, expires_at)
+
+
+class SQLiteBackend(StateBackend):
+    """
+    One table in a SQLite file, in WAL mode so several worker processes on the
+    same host can read while one writes. A batch is one transaction.
+    """
+
+    MAX_VARIABLES = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_state (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+        self._writes = 0
+
+    def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found: Dict[str, bytes] = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), self.MAX_VARIABLES):
+                chunk = list(keys[start:start + self.MAX_VARIABLES])
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM session_state WHERE key IN ({','.join('?' * len(chunk))}) "
+                    "AND (expires_at IS NULL OR expires_at > ?)", chunk + [now])
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def write_many(self, items: Dict[str, Optional[bytes]], ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        upserts = [(key, value, expires_at) for key, value in items.items() if value is not None]
+        deletes = [(key,) for key, value in items.items() if value is None]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO session_state (key, value, expires_at) VALUES (?, ?, ?)", upserts)
+                if deletes:
+                    self._conn.executemany("DELETE FROM session_state WHERE key = ?", deletes)
+                self._writes += 1
+                if self._writes % 1000 == 0:
+                    self._conn.execute("DELETE FROM session_state WHERE expires_at <= ?", (time.time(),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+def encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode("utf-8")
+        elif not isinstance(arg, (bytes, bytearray)):
+            arg = str(arg).encode("ascii")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+class _RespConnection:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            return RespError(body.decode("utf-8"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by server")
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply type {kind!r}")
+
+    def pipeline(self, commands: Sequence[Sequence]) -> list:
+        """Send every command, then read every reply: one round trip for the batch."""
+        self.sock.sendall(b"".join(encode_command(*command) for command in commands))
+        return [self._read_reply() for _ in commands]
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """
+    Minimal Redis-protocol client: pipelined commands over a small pool of
+    connections, so concurrent sessions don't serialize on one socket.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, password: Optional[str] = None,
+                 timeout: float = 5.0, pool_size: int = 8):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: "queue.LifoQueue[_RespConnection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> _RespConnection:
+        conn = _RespConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in conn.pipeline(setup):
+                if isinstance(reply, RespError):
+                    conn.close()
+                    raise reply
+        return conn
+
+    def _acquire(self) -> _RespConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get(timeout=self.timeout)
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, conn: _RespConnection):
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    def pipeline(self, commands: Sequence[Sequence]) -> list:
+        """
+        Run `commands` in one round trip and return their replies. Every command
+        used here is idempotent, so a batch that hit a dropped connection is retried once.
+        """
+        for attempt in range(2):
+            conn = self._acquire()
+            try:
+                replies = conn.pipeline(commands)
+            except (OSError, ConnectionError):
+                self._discard(conn)
+                if attempt:
+                    raise
+                continue
+            self._idle.put(conn)
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    raise reply
+            return replies
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class RedisBackend(StateBackend):
+    """Redis (or any RESP server): MGET for reads, one pipeline of SET/DEL for writes."""
+
+    def __init__(self, client: RespClient):
+        self.client = client
+
+    def read_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return self.client.execute("MGET", *keys)
+
+    def write_many(self, items: Dict[str, Optional[bytes]], ttl: Optional[float] = None):
+        commands = []
+        expiry = ("PX", int(ttl * 1000)) if ttl else ()
+        for key, value in items.items():
+            if value is not None:
+                commands.append(("SET", key, value) + expiry)
+        deletes = [key for key, value in items.items() if value is None]
+        if deletes:
+            commands.append(("DEL",) + tuple(deletes))
+        if commands:
+            self.client.pipeline(commands)
+
+    def close(self):
+        self.client.close()
+
+
+def load_backend(url: Optional[str] = None) -> StateBackend:
+    """Backend for `url` (default: WEPPO_STATE_URL, then memory://)."""
+    url = url or os.environ.get("WEPPO_STATE_URL", "memory://")
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme == "sqlite":
+        # sqlite:///abs/path.db or sqlite://relative/path.db
+        path = url[len("sqlite://"):]
+        if not path or path == "/":
+            raise ValueError("WEPPO_STATE_URL for sqlite needs a file path, e.g. sqlite:///var/lib/weppo/state.db")
+        return SQLiteBackend(path)
+    if scheme in ("redis", "resp"):
+        db = parsed.path.strip("/")
+        return RedisBackend(RespClient(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=unquote(parsed.password) if parsed.password else None,
+            pool_size=int(os.environ.get("WEPPO_STATE_POOL_SIZE", 8)),
+        ))
+    raise ValueError(f"Unknown session state backend '{url}'. Use memory://, sqlite:///path or redis://host:port/db")
@@ -0,0 +1,184 @@
+"""
+LangGraph checkpointer on the shared session-state store.
+
+This module is responsible for:
+    - Saving each thread's recent checkpoints and their pending writes as one
+      record (`session:<thread_id>:checkpoint`), so loading a conversation on
+      any worker is a single read.
+    - Keeping only the last WEPPO_CHECKPOINT_HISTORY checkpoints per thread;
+      the agent only ever resumes from the latest one.
+
+Writes go through the store's write-back cache; the agent flushes once per turn.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import TASKS
+
+from backend.agents.state.store import CHECKPOINT, SessionStateStore, session_key
+
+
+class SessionCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpoint saver backed by a SessionStateStore.
+
+    The record for a thread is {"namespaces": {ns: [entry, ...]}}, oldest first,
+    where each entry holds the checkpoint id, parent id, checkpoint, metadata and
+    writes as [task_id, idx, channel, value, task_path] lists.
+    """
+
+    def __init__(self, store: SessionStateStore, history: int = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.store = store
+        self.history = history or int(os.environ.get("WEPPO_CHECKPOINT_HISTORY", 4))
+        # put/put_writes read, modify and write the whole record; parallel tasks of one step call them concurrently
+        self._lock = threading.RLock()
+
+    def _load(self, thread_id: str) -> Dict[str, Any]:
+        value = self.store.get(session_key(thread_id, CHECKPOINT))
+        if value is None:
+            return {"namespaces": {}}
+        type_, _, data = value.partition(b"\n")
+        return self.serde.loads_typed((type_.decode("ascii"), data))
+
+    def _save(self, thread_id: str, record: Dict[str, Any]):
+        type_, data = self.serde.dumps_typed(record)
+        self.store.put(session_key(thread_id, CHECKPOINT), type_.encode("ascii") + b"\n" + data)
+
+    def _tuple(self, thread_id: str, ns: str, entries: List[Dict[str, Any]], index: int) -> CheckpointTuple:
+        entry = entries[index]
+        parent = entries[index - 1] if index > 0 and entries[index - 1]["id"] == entry["parent"] else None
+        # Sends scheduled by the parent step are replayed into this checkpoint
+        sends = sorted((w for w in parent["writes"] if w[2] == TASKS), key=lambda w: (w[4], w[0], w[1])) \
+            if parent else []
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": entry["id"]}},
+            checkpoint={**entry["checkpoint"], "pending_sends": [w[3] for w in sends]},
+            metadata=entry["metadata"],
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns,
+                                            "checkpoint_id": entry["parent"]}} if entry["parent"] else None,
+            pending_writes=[(w[0], w[2], w[3]) for w in entry["writes"]],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        entries = self._load(thread_id)["namespaces"].get(ns)
+        if not entries:
+            return None
+        checkpoint_id = get_checkpoint_id(config)
+        if not checkpoint_id:
+            return self._tuple(thread_id, ns, entries, len(entries) - 1)
+        for index, entry in enumerate(entries):
+            if entry["id"] == checkpoint_id:
+                return self._tuple(thread_id, ns, entries, index)
+        return None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        # State is keyed by thread, so listing needs one
+        if not config:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        ns_filter = config["configurable"].get("checkpoint_ns")
+        checkpoint_id = get_checkpoint_id(config)
+        before_id = get_checkpoint_id(before) if before else None
+        for ns, entries in self._load(thread_id)["namespaces"].items():
+            if ns_filter is not None and ns != ns_filter:
+                continue
+            for index in range(len(entries) - 1, -1, -1):
+                entry = entries[index]
+                if checkpoint_id and entry["id"] != checkpoint_id:
+                    continue
+                if before_id and entry["id"] >= before_id:
+                    continue
+                if filter and not all(entry["metadata"].get(k) == v for k, v in filter.items()):
+                    continue
+                if limit is not None:
+                    if limit <= 0:
+                        return
+                    limit -= 1
+                yield self._tuple(thread_id, ns, entries, index)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        saved = checkpoint.copy()
+        saved.pop("pending_sends", None)
+        with self._lock:
+            record = self._load(thread_id)
+            entries = record["namespaces"].setdefault(ns, [])
+            entries[:] = [e for e in entries if e["id"] != checkpoint["id"]]
+            entries.append({
+                "id": checkpoint["id"],
+                "parent": config["configurable"].get("checkpoint_id"),
+                "checkpoint": saved,
+                "metadata": get_checkpoint_metadata(config, metadata),
+                "writes": [],
+            })
+            del entries[:-self.history]
+            self._save(thread_id, record)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            record = self._load(thread_id)
+            entry = next((e for e in record["namespaces"].get(ns, []) if e["id"] == checkpoint_id), None)
+            if entry is None:
+                return
+            existing = {(w[0], w[1]) for w in entry["writes"]}
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                if (task_id, idx) in existing:
+                    if idx >= 0:
+                        continue
+                    entry["writes"] = [w for w in entry["writes"] if (w[0], w[1]) != (task_id, idx)]
+                entry["writes"].append([task_id, idx, channel, value, task_path])
+            self._save(thread_id, record)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.store.delete(session_key(thread_id, CHECKPOINT), flush=True)
+
+    # The store does blocking I/O, so the async variants run on the default executor
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None
+                    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in tuples:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.delete_thread, thread_id)
@@ -0,0 +1,266 @@
+"""
+Local stand-in for a Redis server.
+
+This module is responsible for:
+    - Speaking enough of the Redis protocol (RESP) for the session-state
+      backend: PING, GET, MGET, SET (EX/PX), MSET, DEL, EXISTS, EXPIRE, TTL,
+      SELECT, AUTH, DBSIZE, FLUSHDB and FLUSHALL.
+    - Injecting a per-round-trip latency, so the cost of unbatched calls (and
+      what pipelining saves) shows up locally the way it does across a network.
+
+Point the voice server at it with `WEPPO_STATE_URL=redis://127.0.0.1:6380/0`.
+Several workers pointed at the same stand-in share sessions as they would with Redis.
+
+Usage:
+    python -m backend.agents.state.resp_server --port 6380 --latency-ms 1
+"""
+
+import argparse
+import logging
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Keyspace:
+    """Databases of key -> (value, expires_at), shared by every connection."""
+
+    def __init__(self):
+        self.dbs: Dict[int, Dict[bytes, Tuple[bytes, Optional[float]]]] = {}
+        self.lock = threading.Lock()
+
+    def db(self, index: int) -> Dict[bytes, Tuple[bytes, Optional[float]]]:
+        return self.dbs.setdefault(index, {})
+
+    @staticmethod
+    def live(db, key: bytes):
+        entry = db.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del db[key]
+            return None
+        return entry
+
+
+def _simple(text: str) -> bytes:
+    return b"+" + text.encode() + b"\r\n"
+
+
+def _error(text: str) -> bytes:
+    return b"-" + text.encode() + b"\r\n"
+
+
+def _integer(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(values: List[Optional[bytes]]) -> bytes:
+    return b"*%d\r\n" % len(values) + b"".join(_bulk(v) for v in values)
+
+
+def parse_commands(buffer: bytearray) -> List[List[bytes]]:
+    """Remove and return every complete command in `buffer` (RESP arrays or inline commands)."""
+    commands = []
+    while buffer:
+        if buffer[:1] != b"*":
+            end = buffer.find(b"\r\n")
+            if end < 0:
+                break
+            line = bytes(buffer[:end])
+            del buffer[:end + 2]
+            if line.strip():
+                commands.append(line.split())
+            continue
+        end = buffer.find(b"\r\n")
+        if end < 0:
+            break
+        count = int(buffer[1:end])
+        position = end + 2
+        args = []
+        for _ in range(count):
+            end = buffer.find(b"\r\n", position)
+            if end < 0 or buffer[position:position + 1] != b"$":
+                break
+            length = int(buffer[position + 1:end])
+            start = end + 2
+            if len(buffer) < start + length + 2:
+                break
+            args.append(bytes(buffer[start:start + length]))
+            position = start + length + 2
+        if len(args) < count:
+            break
+        del buffer[:position]
+        commands.append(args)
+    return commands
+
+
+class _RespHandler(socketserver.BaseRequestHandler):
+    server: "LocalRespServer"
+
+    def setup(self):
+        self.db_index = 0
+        self.authenticated = self.server.password is None
+
+    def handle(self):
+        buffer = bytearray()
+        while True:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer.extend(data)
+            commands = parse_commands(buffer)
+            if not commands:
+                continue
+            # Latency is paid once per batch of commands read together, i.e. per round trip
+            if self.server.latency_ms:
+                time.sleep(self.server.latency_ms / 1000)
+            self.server.count("round_trips")
+            self.server.count("commands", len(commands))
+            replies = []
+            for args in commands:
+                if args and args[0].upper() == b"QUIT":
+                    self.request.sendall(b"".join(replies) + _simple("OK"))
+                    return
+                replies.append(self.execute(args))
+            try:
+                self.request.sendall(b"".join(replies))
+            except OSError:
+                return
+
+    def execute(self, args: List[bytes]) -> bytes:
+        if not args:
+            return _error("ERR empty command")
+        name = args[0].upper().decode("ascii", "replace")
+        if name == "AUTH":
+            if self.server.password is None or args[-1].decode() == self.server.password:
+                self.authenticated = True
+                return _simple("OK")
+            return _error("WRONGPASS invalid password")
+        if not self.authenticated:
+            return _error("NOAUTH Authentication required.")
+        keyspace = self.server.keyspace
+        with keyspace.lock:
+            db = keyspace.db(self.db_index)
+            try:
+                return self._dispatch(name, args[1:], db, keyspace)
+            except (IndexError, ValueError):
+                return _error(f"ERR wrong arguments for '{name.lower()}' command")
+
+    def _dispatch(self, name: str, args: List[bytes], db, keyspace: _Keyspace) -> bytes:
+        now = time.monotonic()
+        if name == "PING":
+            return _bulk(args[0]) if args else _simple("PONG")
+        if name == "SELECT":
+            self.db_index = int(args[0])
+            return _simple("OK")
+        if name == "GET":
+            entry = keyspace.live(db, args[0])
+            return _bulk(entry[0] if entry else None)
+        if name == "MGET":
+            return _array([(entry[0] if entry else None) for entry in (keyspace.live(db, k) for k in args)])
+        if name == "SET":
+            expires_at = None
+            options = [a.upper() for a in args[2:]]
+            if b"EX" in options:
+                expires_at = now + float(args[2 + options.index(b"EX") + 1])
+            elif b"PX" in options:
+                expires_at = now + float(args[2 + options.index(b"PX") + 1]) / 1000
+            if b"NX" in options and keyspace.live(db, args[0]):
+                return _bulk(None)
+            db[args[0]] = (args[1], expires_at)
+            return _simple("OK")
+        if name == "MSET":
+            if len(args) % 2:
+                raise ValueError
+            for i in range(0, len(args), 2):
+                db[args[i]] = (args[i + 1], None)
+            return _simple("OK")
+        if name == "DEL":
+            return _integer(sum(1 for k in args if keyspace.live(db, k) and db.pop(k, None)))
+        if name == "EXISTS":
+            return _integer(sum(1 for k in args if keyspace.live(db, k)))
+        if name in ("EXPIRE", "PEXPIRE"):
+            entry = keyspace.live(db, args[0])
+            if not entry:
+                return _integer(0)
+            seconds = float(args[1]) / (1000 if name == "PEXPIRE" else 1)
+            db[args[0]] = (entry[0], now + seconds)
+            return _integer(1)
+        if name == "TTL":
+            entry = keyspace.live(db, args[0])
+            if not entry:
+                return _integer(-2)
+            return _integer(-1 if entry[1] is None else int(entry[1] - now))
+        if name == "DBSIZE":
+            return _integer(sum(1 for k in list(db) if keyspace.live(db, k)))
+        if name == "FLUSHDB":
+            db.clear()
+            return _simple("OK")
+        if name == "FLUSHALL":
+            keyspace.dbs.clear()
+            return _simple("OK")
+        return _error(f"ERR unknown command '{name.lower()}'")
+
+
+class LocalRespServer(socketserver.ThreadingTCPServer):
+    """Threaded in-memory RESP server."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6380, latency_ms: float = 0.0,
+                 password: Optional[str] = None):
+        super().__init__((host, port), _RespHandler)
+        self.keyspace = _Keyspace()
+        self.latency_ms = latency_ms
+        self.password = password
+        self.stats = {"round_trips": 0, "commands": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start_in_thread(self) -> threading.Thread:
+        """Serve from a daemon thread; call `shutdown()` to stop."""
+        thread = threading.Thread(target=self.serve_forever, name="local-resp-server", daemon=True)
+        thread.start()
+        return thread
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Local stand-in Redis server for session state")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every round trip")
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = LocalRespServer(args.host, args.port, args.latency_ms, args.password)
+    logger.info(f"Local RESP server listening at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Stats: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Session state shared across workers.
+
+This module is responsible for:
+    - One store for everything a session needs to continue on another worker:
+      its LangGraph checkpoints, its latest search results, its settings
+      (store, audio format, protocol) and its resume token; and per-customer
+      state that outlives sessions.
+    - A bounded local read-through cache (LRU), so a turn reads the backend at
+      most once per key.
+    - Write-back batching: writes land in the cache and go to the backend in
+      one pipelined batch when the turn calls `flush()`, or as soon as
+      `batch_size` keys are pending. Several checkpoints written during one
+      agent turn therefore cost a single round trip.
+
+A worker that takes over a session calls `forget(thread_id)` first, so it reads
+the latest state instead of anything it cached while it last served that session.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+from backend.agents.outils.metrics import REGISTRY, MetricsRegistry
+from backend.agents.state.backends import StateBackend, load_backend
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = "checkpoint"
+RESULTS = "results"
+SETTINGS = "settings"
+SESSION_FIELDS = (CHECKPOINT, RESULTS, SETTINGS)
+
+_MISSING = object()
+
+
+def session_key(thread_id: str, field: str) -> str:
+    return f"session:{thread_id}:{field}"
+
+
+def resume_key(token: str) -> str:
+    return f"resume:{token}"
+
+
+def customer_key(customer_id: str, field: str) -> str:
+    """State that follows a shopper across sessions, e.g. their affinity profile."""
+    return f"customer:{customer_id}:{field}"
+
+
+class SessionStateStore:
+    """
+    Cached, write-back view of a StateBackend.
+
+    Args:
+        backend: Where state lives (WEPPO_STATE_URL by default).
+        cache_size: Keys kept in the local cache.
+        ttl: Seconds state is kept in the backend after its last write.
+        batch_size: Pending writes that trigger a flush without waiting for the turn to end.
+        prefix: Namespace for every key in the backend.
+    """
+
+    def __init__(self, backend: Optional[StateBackend] = None, cache_size: int = None, ttl: float = None,
+                 batch_size: int = None, prefix: str = "weppo:", registry: MetricsRegistry = REGISTRY):
+        self.backend = backend or load_backend()
+        self.cache_size = cache_size or int(os.environ.get("WEPPO_STATE_CACHE_SIZE", 1024))
+        self.ttl = ttl if ttl is not None else float(os.environ.get("WEPPO_STATE_TTL", 86400))
+        self.batch_size = batch_size or int(os.environ.get("WEPPO_STATE_BATCH_SIZE", 32))
+        self.prefix = prefix
+
+        # None is cached too: "known missing" saves a round trip on a session's first turn
+        self._cache: "OrderedDict[str, Optional[bytes]]" = OrderedDict()
+        self._pending: Dict[str, Optional[bytes]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self.lookups = registry.counter(
+            "weppo_state_cache_total", "Session state reads, by whether the local cache answered", ["result"])
+        self.round_trips = registry.histogram(
+            "weppo_state_backend_seconds", "Session state backend round trips", ["op"],
+            buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+        registry.gauge("weppo_state_pending_writes", "Session state writes waiting for the next flush").set_function(
+            lambda: len(self._pending))
+
+    def _remember(self, key: str, value: Optional[bytes]):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Optional[bytes]]:
+        """Values for `keys` (None when missing), with one backend read for the keys not cached."""
+        found: Dict[str, Optional[bytes]] = {}
+        misses = []
+        with self._lock:
+            for key in keys:
+                value = self._pending.get(key, _MISSING)
+                if value is _MISSING:
+                    value = self._cache.get(key, _MISSING)
+                    if value is not _MISSING:
+                        self._cache.move_to_end(key)
+                if value is _MISSING:
+                    misses.append(key)
+                else:
+                    found[key] = value
+        if found:
+            self.lookups.inc(len(found), result="hit")
+        if misses:
+            self.lookups.inc(len(misses), result="miss")
+            started = time.perf_counter()
+            values = self.backend.read_many([self.prefix + key for key in misses])
+            self.round_trips.observe(time.perf_counter() - started, op="read")
+            with self._lock:
+                for key, value in zip(misses, values):
+                    # A write made while we were reading wins over what we read
+                    value = self._pending.get(key, value)
+                    self._remember(key, value)
+                    found[key] = value
+        return found
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key])[key]
+
+    def put(self, key: str, value: Optional[bytes], flush: bool = False):
+        """Write (or, with None, delete) `key`; it reaches the backend on the next flush."""
+        with self._lock:
+            self._pending[key] = value
+            self._remember(key, value)
+            full = len(self._pending) >= self.batch_size
+        if flush or full:
+            self.flush()
+
+    def delete(self, *keys: str, flush: bool = False):
+        for key in keys:
+            self.put(key, None)
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Send every pending write to the backend in one batch."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                self.backend.write_many({self.prefix + key: value for key, value in batch.items()}, self.ttl)
+            except Exception as e:
+                with self._lock:
+                    # Keep the writes for the next flush unless they were overwritten meanwhile
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                logger.warning("Session state flush of %d keys failed: %s", len(batch), e)
+                return
+            self.round_trips.observe(time.perf_counter() - started, op="write")
+
+    def invalidate(self, *keys: str):
+        """Drop cached values (not pending writes) so the next read of `keys` goes to the backend."""
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def forget(self, thread_id: str):
+        """Invalidate everything cached for a session."""
+        self.invalidate(*(session_key(thread_id, field) for field in SESSION_FIELDS))
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def put_json(self, key: str, value: Any, flush: bool = False):
+        self.put(key, json.dumps(value, separators=(",", ":")).encode("utf-8"), flush=flush)
+
+    def close(self):
+        self.flush()
+        self.backend.close()
+
+
+_default_store: Optional[SessionStateStore] = None
+_default_store_lock = threading.Lock()
+
+
+def default_state_store() -> SessionStateStore:
+    """Process-wide store on WEPPO_STATE_URL, shared by every store's agent and the voice server."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SessionStateStore()
+        return _default_store
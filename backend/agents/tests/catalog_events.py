@@ -0,0 +1,91 @@
+"""
+Catalog event check against the local MCP stand-in.
+
+Fills a store's search cache with a set of queries, then applies relayed
+product webhooks the way POST /catalog/events does and checks that:
+  1. A price update is patched into every cached search that returned the
+     product, without another request to the store.
+  2. A delete removes the product from cached searches.
+  3. A new product drops only the cached searches it might now appear in.
+  4. A repeated update that changes nothing is ignored.
+Finally prints how many searches had to be re-fetched compared with clearing
+the whole cache on every change.
+
+Usage:
+    python backend/agents/tests/catalog_events.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.mcp.local_server import LocalMCPServer
+from backend.agents.mcp.shopify_server import ShopifyMCPServer
+from backend.agents.orchestrator.catalog_sync import CatalogSync
+from backend.agents.orchestrator.product_search import ShopifySearchTool
+from backend.agents.outils.metrics import MetricsRegistry
+
+STORE = "allbirds.com"
+QUERIES = ["wool runners", "tree dashers", "mens shoes", "womens shoes", "socks", "running shoes", "slippers"]
+
+
+def product_event(topic: str, product_id: int, **fields):
+    return {"store": STORE, "topic": topic, "product": {"id": product_id, "status": "active", **fields}}
+
+
+def prices(tool: ShopifySearchTool, query: str, product_id: str):
+    return [p["price_range"].get("min") for p in tool.search_products(query)["products"] if p["product_id"] == product_id]
+
+
+def main():
+    server = LocalMCPServer(port=0)
+    server.start_in_thread()
+    catalog = CatalogSync(search_cache=True, registry=MetricsRegistry())
+    tool = ShopifySearchTool(ShopifyMCPServer(STORE, server_url=server.url), search_cache=catalog.cache_for(STORE))
+    catalog.subscribe(STORE, lambda changes: None)
+
+    for query in QUERIES:
+        tool.search_products(query)
+    fetched = server.stats["requests"]
+    print(f"Cached {len(tool.search_cache)} searches with {fetched} requests")
+
+    runner = server.catalog.products[0]
+    runner_id = runner["product_id"]
+    numeric_id = int(runner_id.rsplit("/", 1)[-1])
+    handle = runner["url"].rsplit("/", 1)[-1]
+    variants = [{"id": 1, "title": v.get("title"), "price": "79.00", "available": v.get("available", True)}
+                for v in runner.get("variants", [])] or [{"id": 1, "title": "Default", "price": "79.00"}]
+    update = product_event("products/update", numeric_id, title=runner["title"], handle=handle,
+                           product_type=runner.get("product_type"), tags=", ".join(runner.get("tags", [])),
+                           variants=variants)
+    summary = catalog.apply_events([update])
+    patched = prices(tool, "wool runners", runner_id)
+    print(f"Update: {summary}, cached price now {patched}")
+    assert patched == ["79.0"] and server.stats["requests"] == fetched
+
+    summary = catalog.apply_events([update])
+    print(f"Repeated update: {summary}")
+    assert summary["touched"] == 0
+
+    summary = catalog.apply_events([product_event("products/create", 9100, title="Wool Slipper", handle="wool-slipper",
+                                                  product_type="Slippers", tags="wool", variants=[])])
+    print(f"Create: {summary}, {len(tool.search_cache)} searches still cached")
+
+    catalog.apply_events([{"store": STORE, "topic": "products/delete", "product": {"id": numeric_id}}])
+    remaining = [p["product_id"] for query in QUERIES for p in (tool.search_cache.get(query) or {}).get("products", [])]
+    print(f"Delete: product left in cached searches: {runner_id in remaining}")
+    assert runner_id not in remaining
+
+    before = server.stats["requests"]
+    for query in QUERIES:
+        tool.search_products(query)
+    print(f"Re-fetched {server.stats['requests'] - before} of {len(QUERIES)} searches after 4 events "
+          f"(clearing on every change would re-fetch {len(QUERIES)} after each)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Filler latency check.
+
+Runs one voice turn through AudioWebSocketServer with a scripted recognizer,
+an agent slower than WEPPO_FILLER_AFTER and a stand-in TTS, then checks the
+turn's stages in TRACER:
+  - a filler plays, so perceived_time_to_first_audio (the filler's) comes
+    before time_to_first_audio (the answer's), and the two differ;
+  - the agent stage covers the agent run only, not the filler's queueing.
+
+Usage:
+    python backend/agents/tests/filler_latency.py --agent-seconds 0.5 --filler-after 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.input import websocket_server
+from backend.agents.input.websocket_server import AudioWebSocketServer
+from backend.agents.orchestrator.agent_pool import AgentPool
+from backend.agents.output.filler import FILLERS
+from backend.agents.outils.metrics import TRACER
+
+TRANSCRIPT = "do you have wool runners in size 9"
+
+
+class ScriptedAgent:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def chat(self, message, thread_id, customer_id=None):
+        time.sleep(self.seconds)
+        return "Here are the Wool Runners in size 9."
+
+
+class StandInTTS:
+    """Audio after a fixed synthesis delay, in a few chunks."""
+
+    def __init__(self, first_byte_seconds: float):
+        self.first_byte_seconds = first_byte_seconds
+
+    def stream_audio(self, text, voice_id=None, model_id=None, output_format=None):
+        time.sleep(self.first_byte_seconds)
+        for _ in range(4):
+            yield b"\xff" * 1024
+
+
+def scripted_speech_to_text(stream):
+    """One final transcript as soon as audio arrives."""
+    for _ in stream.generator():
+        yield TRANSCRIPT
+        return
+
+
+async def run_turn(server: AudioWebSocketServer) -> list:
+    async with serve(server.handler, "127.0.0.1", 0) as listener:
+        port = listener.sockets[0].getsockname()[1]
+        async with connect(f"ws://127.0.0.1:{port}") as client:
+            await client.send(json.dumps({"store": "www.allbirds.com"}))
+            await client.send(b"\x00" * 3200)
+            statuses = []
+            async for message in client:
+                if isinstance(message, bytes):
+                    continue
+                data = json.loads(message)
+                if data.get("status", "").startswith("tts_"):
+                    statuses.append((data["status"], bool(data.get("filler"))))
+                if data.get("status") in ("tts_finished", "tts_error") and not data.get("filler"):
+                    return statuses
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent-seconds", type=float, default=0.5, help="How long the agent takes to answer")
+    parser.add_argument("--filler-after", type=float, default=0.1, help="WEPPO_FILLER_AFTER for the run")
+    parser.add_argument("--tts-seconds", type=float, default=0.05, help="Stand-in TTS time to first byte")
+    args = parser.parse_args()
+
+    websocket_server.speech_to_text = scripted_speech_to_text
+    tts = StandInTTS(args.tts_seconds)
+    FILLERS.directory = Path(tempfile.mkdtemp())
+    FILLERS.after = args.filler_after
+    FILLERS.enabled = True
+    server = AudioWebSocketServer(agent_pool=AgentPool(factory=lambda store: ScriptedAgent(args.agent_seconds)))
+    server.tts_client = tts
+    FILLERS.load(tts, [websocket_server.DEFAULT_AUDIO_FORMAT])
+    server.readiness.mark_ready()
+
+    statuses = asyncio.run(run_turn(server))
+    # One turn, so each stage's sum is its duration
+    stages = {stage: TRACER.stage_seconds.sum(stage=stage) if TRACER.stage_seconds.count(stage=stage) else None
+              for stage in ("agent", "perceived_time_to_first_audio", "time_to_first_audio")}
+    for stage, seconds in stages.items():
+        print(f"  {stage:<32} {'-' if seconds is None else f'{seconds * 1000:.1f} ms'}")
+
+    perceived, answer, agent = (stages["perceived_time_to_first_audio"], stages["time_to_first_audio"],
+                                stages["agent"])
+    checks = [
+        ("filler played before the answer",
+         statuses[:3] == [("tts_starting", True), ("tts_finished", True), ("tts_starting", False)]),
+        ("both first-audio stages recorded", perceived is not None and answer is not None),
+        ("filler reached the caller before the answer",
+         perceived is not None and answer is not None and perceived < answer),
+        ("answer's first audio waits for the agent",
+         answer is not None and answer >= args.agent_seconds),
+        ("agent stage excludes the filler",
+         agent is not None and args.agent_seconds <= agent < args.agent_seconds + args.tts_seconds),
+    ]
+    failures = []
+    for name, passed in checks:
+        print(f"  {'ok' if passed else 'FAIL':<4} {name}")
+        if not passed:
+            failures.append(name)
+
+    if failures:
+        print(f"FAIL: {', '.join(failures)}")
+        return 1
+    print("Filler latency ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Startup import-time benchmark for run_websocket_server.py.
+
+Runs `python -X importtime -c "import run_websocket_server"` in fresh
+interpreters, takes the median cumulative import time and the slowest modules,
+and checks that:
+    - no device-only or unselected-provider module is imported on the server path
+    - the median total hasn't regressed past the tracked baseline
+      (import_time_baseline.json, committed next to this script, with its
+      tolerance and the Python version and CPU it was measured on; re-record it
+      with --update-baseline where the check runs). A check without a baseline fails.
+
+Usage:
+    python backend/agents/tests/import_time.py                    # report + check
+    python backend/agents/tests/import_time.py --update-baseline  # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+project_root = Path(__file__).parent.parent.parent.parent
+BASELINE_PATH = Path(__file__).parent / "import_time_baseline.json"
+
+# Modules that must stay off the server's import path
+FORBIDDEN_MODULES = [
+    "pyaudio",
+    "langchain_ollama",
+    "langchain_google_genai",
+    "langchain_xai",
+    "langgraph",
+    "elevenlabs",
+    "backend.agents.input.microphone_stream",
+]
+
+
+def cpu_name() -> str:
+    """CPU model the imports were timed on ("model name" in /proc/cpuinfo on Linux)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def measure_once(target: str) -> Tuple[float, Dict[str, int], Dict[str, int]]:
+    """Return (total seconds, self us per module, cumulative us per module) for one cold import."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=project_root,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{completed.stderr[-2000:]}")
+
+    self_us: Dict[str, int] = {}
+    cumulative_us: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_part, cumulative_part, name = line[len("import time:"):].split("|", 2)
+        module = name.strip()
+        self_us[module] = int(self_part)
+        cumulative_us[module] = int(cumulative_part)
+
+    total = cumulative_us.get(target, sum(self_us.values())) / 1e6
+    return total, self_us, cumulative_us
+
+
+def run(target: str, repeat: int) -> Dict:
+    totals: List[float] = []
+    self_runs: Dict[str, List[int]] = {}
+    imported = set()
+    for _ in range(repeat):
+        total, self_us, _ = measure_once(target)
+        totals.append(total)
+        imported.update(self_us)
+        for module, value in self_us.items():
+            self_runs.setdefault(module, []).append(value)
+
+    slowest = sorted(
+        ((module, statistics.median(values)) for module, values in self_runs.items()),
+        key=lambda item: -item[1],
+    )[:15]
+    # Reported by forbidden package, not by each of its submodules
+    forbidden = sorted(
+        f for f in FORBIDDEN_MODULES
+        if any(module == f or module.startswith(f + ".") for module in imported)
+    )
+    return {
+        "target": target,
+        "repeat": repeat,
+        "median_seconds": statistics.median(totals),
+        "min_seconds": min(totals),
+        "max_seconds": max(totals),
+        "modules_imported": len(imported),
+        "slowest_self_us": [{"module": m, "self_us": int(v)} for m, v in slowest],
+        "forbidden_imported": forbidden,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark for the websocket server")
+    parser.add_argument("--target", default="run_websocket_server")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Allowed relative regression over the baseline median (default: the baseline's, else 0.25)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.target, args.repeat)
+    print(f"{args.target}: median {report['median_seconds'] * 1000:.1f} ms over {args.repeat} cold imports "
+          f"({report['modules_imported']} modules)")
+    for entry in report["slowest_self_us"]:
+        print(f"  {entry['self_us'] / 1000:8.1f} ms  {entry['module']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baseline = {
+            "target": args.target,
+            "median_seconds": report["median_seconds"],
+            "tolerance": args.tolerance if args.tolerance is not None else 0.25,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": cpu_name(),
+            "cpus": os.cpu_count(),
+        }
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+
+    failed = False
+    if report["forbidden_imported"]:
+        print(f"FAIL: server import path pulls in {', '.join(report['forbidden_imported'])}")
+        failed = True
+
+    if BASELINE_PATH.exists():
+        tracked = json.loads(BASELINE_PATH.read_text())
+        baseline = tracked["median_seconds"]
+        tolerance = args.tolerance if args.tolerance is not None else tracked.get("tolerance", 0.25)
+        limit = baseline * (1 + tolerance)
+        status = "FAIL" if report["median_seconds"] > limit else "ok"
+        print(f"{status}: median {report['median_seconds'] * 1000:.1f} ms vs baseline {baseline * 1000:.1f} ms "
+              f"(limit {limit * 1000:.1f} ms; Python {tracked.get('python')} on {tracked.get('processor', '?')})")
+        failed = failed or status == "FAIL"
+    else:
+        print(f"FAIL: no baseline at {BASELINE_PATH}; run with --update-baseline to record one.")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
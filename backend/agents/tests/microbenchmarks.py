@@ -0,0 +1,301 @@
+"""
+Microbenchmarks for the agent and search hot paths.
+
+Runs each benchmark over the recorded fixture catalog (mcp/fixtures) with
+fixed inputs and operation counts, so runs are comparable:
+    - parse_content:        ShopifySearchTool._parse_content on a full MCP response
+    - format_product:       ShopifySearchTool._format_product_to_markdown per product
+    - clean_tags:           ShopifySearchTool._clean_tags per product
+    - clean_response:       PersonalShopperAgent._clean_response_content on a recorded reply
+    - spoken_rendition:     output.spoken.spoken_rendition on the same reply
+    - websocket_stream:     WebSocketStream.generator draining 100 ms LINEAR16 frames
+                            fed from another thread
+    - chat_turn:            a full PersonalShopperAgent.chat turn (model step, product
+                            search, model step) with a scripted LLM and an in-process store
+
+Each benchmark is timed `--repeat` times; the median ns per operation is the
+tracked metric. Results are written as JSON with sorted keys and checked against
+the tracked baseline (microbenchmarks_baseline.json, committed next to this
+script): a benchmark fails when its median exceeds the baseline by more than its
+tolerance (per benchmark in the baseline file, or --tolerance). A check without
+a baseline fails too. The baseline records the Python version, machine and CPU
+it was measured on; absolute timings only compare on similar hardware, so
+re-record it with --update-baseline where the check runs (e.g. the CI runner).
+
+Usage:
+    python backend/agents/tests/microbenchmarks.py                         # report + check
+    python backend/agents/tests/microbenchmarks.py --only parse_content clean_tags
+    python backend/agents/tests/microbenchmarks.py --output results.json
+    python backend/agents/tests/microbenchmarks.py --update-baseline       # record a new baseline
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.mcp.local_server import FixtureCatalog
+from backend.agents.mcp.shopify_server import ShopifyMCPServer
+from backend.agents.outils.metrics import MetricsRegistry
+from backend.agents.state.backends import load_backend
+from backend.agents.state.store import SessionStateStore
+
+BASELINE_PATH = Path(__file__).parent / "microbenchmarks_baseline.json"
+STORE = "allbirds.com"
+QUERY = "wool runners"
+
+# name -> (operations per timed run, default tolerance); agent turns vary more run to run
+BENCHMARKS: Dict[str, Tuple[int, float]] = {
+    "parse_content": (200, 0.25),
+    "format_product": (2000, 0.25),
+    "clean_tags": (5000, 0.25),
+    "clean_response": (5000, 0.25),
+    "spoken_rendition": (2000, 0.25),
+    "websocket_stream": (2000, 0.5),
+    "chat_turn": (20, 0.5),
+}
+
+RECORDED_REPLY = """[agent] step 2
+messages -> 3
+Here are a few options from the catalog:
+
+1. **Men's Wool Runners** - $98. Soft merino wool, machine washable, sizes 8 to 12 in stock.
+2. **Women's Wool Runners** - $98. Same cushioned sole, sizes 6 to 10 in stock.
+checkpoint saved
+3. **Men's Tree Dashers** - $135. Breathable eucalyptus upper built for running.
+
+State at the end of the turn
+Would you like me to check a particular size or colour?
+"""
+
+
+def cpu_name() -> str:
+    """CPU model the benchmarks ran on ("model name" in /proc/cpuinfo on Linux)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def mcp_response(catalog: FixtureCatalog, query: str) -> Dict[str, Any]:
+    """The JSON-RPC envelope the store returns for `query`."""
+    return {"jsonrpc": "2.0", "id": 1,
+            "result": {"content": [{"type": "text", "text": json.dumps(catalog.search(query))}], "isError": False}}
+
+
+class FixtureStore(ShopifyMCPServer):
+    """In-process store answering from recorded responses, so a turn measures the agent and not the network."""
+
+    def __init__(self, catalog: FixtureCatalog):
+        super().__init__(STORE, server_url="http://127.0.0.1:9/api/mcp")
+        self.catalog = catalog
+        self.responses: Dict[str, Dict[str, Any]] = {}
+
+    def get_products(self, query: str):
+        if query not in self.responses:
+            self.responses[query] = mcp_response(self.catalog, query)
+        return self.responses[query]
+
+    async def aget_products(self, query: str):
+        # _arun / astream_chat search through here; never the network
+        return self.get_products(query)
+
+
+class ScriptedModel(BaseChatModel):
+    """Searches once, then answers with the recorded reply."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if isinstance(messages[-1], HumanMessage):
+            message = AIMessage(content="", tool_calls=[{"name": "product_search", "args": {"query": QUERY}, "id": "call_0"}])
+        else:
+            message = AIMessage(content=RECORDED_REPLY)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def build_agent(catalog: FixtureCatalog):
+    from backend.agents.orchestrator.agent import PersonalShopperAgent
+    state = SessionStateStore(load_backend("memory://"), registry=MetricsRegistry())
+    return PersonalShopperAgent(STORE, fast_router=False, session_state=state, llm=ScriptedModel(),
+                                mcp_server=FixtureStore(catalog))
+
+
+def websocket_stream_run(frames: int, frame: bytes) -> Callable[[], None]:
+    """Drain `frames` frames through WebSocketStream.generator while a thread feeds them, as the server does."""
+    from backend.agents.input.speech_input import WebSocketStream
+
+    def run():
+        expected = frames * len(frame)
+        with WebSocketStream() as stream:
+            def feed():
+                for _ in range(frames):
+                    stream.put_audio(frame)
+            feeder = threading.Thread(target=feed)
+            feeder.start()
+            received = 0
+            for data in stream.generator():
+                received += len(data)
+                if received >= expected:
+                    break
+            feeder.join()
+    return run
+
+
+def setup(name: str, ops: int, catalog: FixtureCatalog) -> Callable[[], None]:
+    """A function running `ops` operations of benchmark `name`."""
+    from backend.agents.orchestrator.product_search import ShopifySearchTool
+    tool = ShopifySearchTool(FixtureStore(catalog))
+    products = catalog.products
+    content = mcp_response(catalog, "")["result"]["content"]
+
+    if name == "parse_content":
+        return lambda: [tool._parse_content(content) for _ in range(ops)]
+    if name == "format_product":
+        return lambda: [tool._format_product_to_markdown(products[i % len(products)]) for i in range(ops)]
+    if name == "clean_tags":
+        return lambda: [tool._clean_tags(products[i % len(products)].get("tags", [])) for i in range(ops)]
+    if name == "clean_response":
+        from backend.agents.orchestrator.agent import PersonalShopperAgent
+        return lambda: [PersonalShopperAgent._clean_response_content(None, RECORDED_REPLY) for _ in range(ops)]
+    if name == "spoken_rendition":
+        from backend.agents.output.spoken import spoken_rendition
+        return lambda: [spoken_rendition(RECORDED_REPLY) for _ in range(ops)]
+    if name == "websocket_stream":
+        # 100 ms of 16 kHz LINEAR16
+        return websocket_stream_run(ops, bytes(3200))
+    if name == "chat_turn":
+        agent = build_agent(catalog)
+        turns = iter(range(10 ** 9))
+
+        def run():
+            for _ in range(ops):
+                # A fresh thread per turn, so every turn carries the same history
+                response = agent.chat("show me wool runners", thread_id=f"bench-{next(turns)}")
+                assert response.startswith("Here are"), response
+        return run
+    raise ValueError(f"Unknown benchmark: {name}")
+
+
+def measure(name: str, repeat: int, catalog: FixtureCatalog) -> Dict[str, Any]:
+    ops = BENCHMARKS[name][0]
+    run = setup(name, ops, catalog)
+    run()  # warm-up: caches, lazy imports, first-call compilation
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            run()
+            timings.append((time.perf_counter_ns() - started) / ops)
+            gc.collect()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "ops": ops,
+        "median_ns": int(statistics.median(timings)),
+        "min_ns": int(min(timings)),
+        "stdev_ns": int(statistics.stdev(timings)) if len(timings) > 1 else 0,
+    }
+
+
+def check(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: Optional[float]) -> List[str]:
+    """Print each tracked metric against the baseline and return the regressed benchmark names."""
+    regressed = []
+    for name, result in sorted(results.items()):
+        tracked = baseline.get("benchmarks", {}).get(name)
+        if tracked is None:
+            print(f"  {name:<18} not in baseline")
+            continue
+        allowed = tolerance if tolerance is not None else tracked.get("tolerance", BENCHMARKS[name][1])
+        limit = tracked["median_ns"] * (1 + allowed)
+        status = "FAIL" if result["median_ns"] > limit else "ok"
+        change = result["median_ns"] / tracked["median_ns"] - 1
+        print(f"  {status:<4} {name:<18} {result['median_ns']:>12,} ns vs {tracked['median_ns']:>12,} ns "
+              f"({change:+.1%}, limit +{allowed:.0%})")
+        if status == "FAIL":
+            regressed.append(name)
+    return regressed
+
+
+def main(argv: Any = None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the agent and search hot paths")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Allowed relative regression for every benchmark (default: per benchmark)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    catalog = FixtureCatalog()
+    results = {}
+    for name in args.only or BENCHMARKS:
+        results[name] = measure(name, args.repeat, catalog)
+        print(f"{name:<18} {results[name]['median_ns']:>12,} ns/op (min {results[name]['min_ns']:,}, "
+              f"stdev {results[name]['stdev_ns']:,}, {results[name]['ops']} ops x {args.repeat})")
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": cpu_name(),
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "benchmarks": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {"benchmarks": {}}
+        for name, result in results.items():
+            tracked = baseline["benchmarks"].get(name, {})
+            baseline["benchmarks"][name] = {"median_ns": result["median_ns"],
+                                            "tolerance": tracked.get("tolerance", BENCHMARKS[name][1])}
+        baseline.update({key: report[key] for key in ("python", "machine", "processor", "cpus")})
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+
+    if not BASELINE_PATH.exists():
+        print(f"FAIL: no baseline at {BASELINE_PATH}; run with --update-baseline to record one.")
+        return 1
+    baseline = json.loads(BASELINE_PATH.read_text())
+    print(f"Baseline: Python {baseline.get('python')} on {baseline.get('processor', baseline.get('machine'))} "
+          f"({baseline.get('cpus', '?')} CPUs)")
+    regressed = check(results, baseline, args.tolerance)
+    if regressed:
+        print(f"FAIL: {', '.join(regressed)} regressed past the tolerated threshold")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Provider routing and hedging check with scripted fake chat models.
+
+Registers local chat models whose latency and failures follow a script, runs a
+batch of requests through ProviderRegistry and prints which provider answered,
+how often calls were hedged and the end-to-end latency percentiles next to
+what the single "primary" provider alone would have given.
+
+Usage:
+    python backend/agents/tests/provider_routing.py --requests 200 --concurrency 8
+    python backend/agents/tests/provider_routing.py --no-hedge
+"""
+
+import argparse
+import itertools
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.orchestrator.providers import ProviderRegistry, RoutedChatModel
+from backend.agents.outils.metrics import MetricsRegistry
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Fake chat model: the n-th call sleeps `latencies[n % len]` seconds and
+    raises if `failures[n % len]` is true. Tool binding is a no-op.
+    """
+
+    name: str = "scripted"
+    latencies: List[float] = [0.1]
+    failures: List[bool] = [False]
+    _calls: Any = PrivateAttr(default_factory=itertools.count)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs: Any) -> "ScriptedChatModel":
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        with self._lock:
+            n = next(self._calls)
+        time.sleep(self.latencies[n % len(self.latencies)])
+        if self.failures[n % len(self.failures)]:
+            raise RuntimeError(f"{self.name}: scripted failure on call {n}")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.name))])
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+SPIKY_LATENCIES = [0.15] * 24 + [2.0]
+
+
+def build_registry(hedge: bool) -> ProviderRegistry:
+    registry = ProviderRegistry(hedge=hedge, hedge_min_delay=0.2, hedge_default_delay=0.6,
+                                cooldown=2.0, registry=MetricsRegistry())
+    # Usually fastest, but every 25th call stalls: a tail spike above its p95
+    registry.register("spiky", lambda: ScriptedChatModel(name="spiky", latencies=SPIKY_LATENCIES))
+    # Slower but steady
+    registry.register("steady", lambda: ScriptedChatModel(name="steady", latencies=[0.35, 0.4, 0.45]))
+    # Fast when it works; fails most calls and should be taken out of rotation
+    registry.register("flaky", lambda: ScriptedChatModel(name="flaky", latencies=[0.05],
+                                                         failures=[True, True, False]))
+    return registry
+
+
+def run(registry: ProviderRegistry, requests: int, concurrency: int):
+    model = RoutedChatModel(registry=registry)
+    latencies: List[float] = []
+    winners: Counter = Counter()
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            reply = model.invoke([HumanMessage(content="wool runners")])
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            winners[reply.content] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies, winners, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provider routing/hedging check with scripted fake models")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-hedge", action="store_true")
+    args = parser.parse_args()
+
+    registry = build_registry(hedge=not args.no_hedge)
+    latencies, winners, errors = run(registry, args.requests, args.concurrency)
+
+    baseline = [SPIKY_LATENCIES[i % len(SPIKY_LATENCIES)] for i in range(args.requests)]
+    print(f"Requests: {args.requests}  errors: {errors}  hedging: {'off' if args.no_hedge else 'on'}")
+    print(f"Answered by: {dict(winners)}")
+    print(f"Hedges won by primary/hedge: {registry.hedges.value(winner='primary'):.0f}/"
+          f"{registry.hedges.value(winner='hedge'):.0f}")
+    for name in registry.names:
+        median = registry.median_latency(name)
+        print(f"  {name:<7} healthy={registry.healthy(name)!s:<5} error_rate={registry.error_rate(name):.2f} "
+              f"median={median if median is not None else float('nan'):.3f}s p95={registry.p95_latency(name)}")
+    print(f"Routed   p50={percentile(latencies, 0.5):.3f}s p95={percentile(latencies, 0.95):.3f}s "
+          f"p99={percentile(latencies, 0.99):.3f}s")
+    print(f"'spiky' alone p50={percentile(baseline, 0.5):.3f}s p95={percentile(baseline, 0.95):.3f}s "
+          f"p99={percentile(baseline, 0.99):.3f}s")
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Response cache matching check.
+
+Stores one first-turn answer, then looks up:
+  - paraphrases that should reuse it (stopwords, plurals, one extra word), and
+  - near misses that differ only in gender, size or a price limit, which must
+    not be served another shopper's answer even though their token overlap
+    is above the similarity threshold.
+
+Usage:
+    python backend/agents/tests/response_cache.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.orchestrator.response_cache import ResponseCache
+from backend.agents.outils.metrics import MetricsRegistry
+
+STORED = "do you have mens wool runners in black under 100 dollars in size 9"
+HITS = [
+    "Do you have men's wool runners in black under 100 dollars, in size 9?",
+    "hi, do you have mens wool runners in black color under 100 dollars in size 9",
+]
+MISSES = [
+    "do you have womens wool runners in black under 100 dollars in size 9",
+    "do you have mens wool runners in black under 100 dollars in size 12",
+    "do you have mens wool runners in black under 200 dollars in size 9",
+    "do you have mens wool runners in black over 100 dollars in size 9",
+    "do you have mens wool runners in black under 100 dollars",
+]
+
+
+def main():
+    cache = ResponseCache(registry=MetricsRegistry())
+    cache.store(STORED, 1, "cached answer")
+    failures = []
+    for query, expected in [(query, True) for query in HITS] + [(query, False) for query in MISSES]:
+        hit = cache.lookup(query, 1) is not None
+        status = "ok" if hit == expected else "FAIL"
+        print(f"  {status:<4} {'hit' if hit else 'miss':<4} {query}")
+        if status == "FAIL":
+            failures.append(query)
+
+    if failures:
+        print(f"FAIL: {len(failures)} lookup(s) matched wrongly")
+        return 1
+    print("All lookups ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Session state check against the local RESP stand-in.
+
+Starts `LocalRespServer` with an artificial round-trip latency, then:
+  1. Runs turns for several sessions the way the agent does (one checkpoint
+     read, several checkpoint writes, one results write per turn), once with a
+     flush after every write and once batched per turn, and prints round trips
+     and turn overhead for both.
+  2. Hands a session to a second "worker" (a separate store on the same
+     backend) and checks it sees the latest state after `forget`.
+
+Usage:
+    python backend/agents/tests/session_state.py --sessions 20 --turns 5 --latency-ms 1
+    python backend/agents/tests/session_state.py --url sqlite:////tmp/weppo-state.db
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.outils.metrics import MetricsRegistry
+from backend.agents.state.backends import load_backend
+from backend.agents.state.resp_server import LocalRespServer
+from backend.agents.state.store import CHECKPOINT, RESULTS, SessionStateStore, session_key
+
+# A ReAct turn with one tool call writes about this many checkpoints
+CHECKPOINTS_PER_TURN = 5
+
+
+def run_turns(store: SessionStateStore, sessions: int, turns: int, batched: bool, payload: bytes):
+    durations = []
+    for turn in range(turns):
+        for n in range(sessions):
+            thread_id = f"bench-{batched}-{n}"
+            started = time.perf_counter()
+            store.get(session_key(thread_id, CHECKPOINT))
+            for step in range(CHECKPOINTS_PER_TURN):
+                store.put(session_key(thread_id, CHECKPOINT), payload + b"%d:%d" % (turn, step), flush=not batched)
+            store.put_json(session_key(thread_id, RESULTS), {"queries": ["wool runners"], "turn": turn},
+                           flush=not batched)
+            if batched:
+                store.flush()
+            durations.append(time.perf_counter() - started)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session state batching and hand-off check")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="Round-trip latency of the stand-in")
+    parser.add_argument("--payload-bytes", type=int, default=8192, help="Size of a serialized checkpoint")
+    parser.add_argument("--url", default=None, help="Use this backend instead of the stand-in")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = LocalRespServer(port=0, latency_ms=args.latency_ms)
+        server.start_in_thread()
+        url = server.url
+    payload = os.urandom(args.payload_bytes)
+    print(f"Backend: {url}  sessions: {args.sessions}  turns: {args.turns}")
+
+    for batched in (False, True):
+        store = SessionStateStore(load_backend(url), registry=MetricsRegistry())
+        if server:
+            server.stats.update(round_trips=0, commands=0)
+        durations = run_turns(store, args.sessions, args.turns, batched, payload)
+        trips = f"  round trips/turn: {server.stats['round_trips'] / len(durations):.1f}" if server else ""
+        print(f"{'batched' if batched else 'per-write':<9} state overhead/turn p50={statistics.median(durations) * 1000:.2f}ms "
+              f"max={max(durations) * 1000:.2f}ms{trips}")
+        store.close()
+
+    worker_a = SessionStateStore(load_backend(url), registry=MetricsRegistry())
+    worker_b = SessionStateStore(load_backend(url), registry=MetricsRegistry())
+    key = session_key("handoff", CHECKPOINT)
+    worker_a.put(key, b"turn-1", flush=True)
+    assert worker_b.get(key) == b"turn-1"
+    worker_b.put(key, b"turn-2", flush=True)
+    stale = worker_a.get(key)
+    worker_a.forget("handoff")
+    fresh = worker_a.get(key)
+    print(f"Hand-off: cached read before forget={stale!r}, after forget={fresh!r}")
+    assert fresh == b"turn-2"
+    worker_a.close()
+    worker_b.close()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Spoken rendition check.
+
+Runs `spoken_rendition` over product replies in the prompt template's format
+and checks what text-to-speech would say: prices with grouping commas or a
+decimal comma, and closing lines with more than one question.
+
+Usage:
+    python backend/agents/tests/spoken_rendition.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.output.spoken import spoken_rendition
+
+# price as written in the reply -> as it must be spoken
+PRICES = {
+    "$98": "98 dollars",
+    "$98.00": "98 dollars",
+    "$1,299.99": "1299.99 dollars",
+    "1,299.00 USD": "1299 dollars",
+    "1,050.00 EUR": "1050 euros",
+    "€49,90": "49.90 euros",
+    "£1,200": "1200 pounds",
+    "98.0 USD": "98 dollars",
+}
+
+
+def reply(price: str, closing: str = "Would you like to see more?") -> str:
+    return (f"Here is what I found:\n\n"
+            f"### [Wool Runner](https://www.allbirds.com/products/wool-runner)\n"
+            f"- **Price**: {price}\n"
+            f"- **Sizes**: 8, 9, 10\n\n"
+            f"{closing}\n")
+
+
+def main():
+    failures = []
+    for written, expected in PRICES.items():
+        spoken = spoken_rendition(reply(written))
+        status = "ok" if f"Wool Runner for {expected}." in spoken else "FAIL"
+        print(f"  {status:<4} {written:<14} -> {spoken}")
+        if status == "FAIL":
+            failures.append(written)
+
+    closing = "Would you like to see more colors? Or check sizes?"
+    spoken = spoken_rendition(reply("$98", closing))
+    status = "ok" if spoken.endswith(closing) else "FAIL"
+    print(f"  {status:<4} closing line -> {spoken}")
+    if status == "FAIL":
+        failures.append("closing line")
+
+    if failures:
+        print(f"FAIL: {', '.join(failures)}")
+        return 1
+    print("All renditions ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Parallel tool-call benchmark against the local MCP stand-in.
+
+Drives a react agent with a scripted model that asks for several
+product searches in one step, then answers. The store is the local stand-in
+with injected latency, so the numbers show how a step's tool calls are run:
+    - sequential: one call at a time (WEPPO_TOOL_CONCURRENCY=1)
+    - threaded:   concurrent calls, each blocking a worker thread on HTTP
+                  (how `_arun` used to work)
+    - async:      concurrent calls awaited on the event loop with httpx
+For each mode it reports turn latency percentiles across sessions and the
+worst event-loop stall seen while they ran. The default is a single session,
+the per-turn fan-out; with many sessions the store connection cap, not the
+tool-call scheduling, sets the latency.
+
+Usage:
+    python backend/agents/tests/tool_calls.py --calls 4 --latency constant:80
+    python backend/agents/tests/tool_calls.py --calls 4 --sessions 16 --latency constant:80
+"""
+
+import argparse
+import asyncio
+import contextvars
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.prebuilt import create_react_agent
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+from backend.agents.mcp.local_server import FaultConfig, LocalMCPServer
+from backend.agents.mcp.shopify_server import ShopifyMCPServer
+from backend.agents.orchestrator.product_search import ShopifySearchTool
+
+QUERIES = ["wool runners", "tree dashers", "mens shoes", "womens shoes", "socks", "running shoes", "slippers", "loungers"]
+
+
+class ScriptedModel(BaseChatModel):
+    """Asks for `calls` searches in its first step, then answers from the results."""
+
+    calls: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if isinstance(messages[-1], HumanMessage):
+            tool_calls = [{"name": "product_search", "args": {"query": QUERIES[i % len(QUERIES)]}, "id": f"call_{i}"}
+                          for i in range(self.calls)]
+            message = AIMessage(content="", tool_calls=tool_calls)
+        else:
+            message = AIMessage(content=f"Found results for {self.calls} searches.")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ThreadedSearchTool(ShopifySearchTool):
+    """The previous `_arun`: the blocking search runs on the default executor."""
+
+    async def _arun(self, query: str = "", queries=None, config=None) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run, self._run, query, queries, config)
+
+
+async def watch_loop(stalls: List[float], interval: float = 0.005):
+    """Record how late each tick fires; a late tick means something blocked the loop."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def run_mode(mode: str, server_url: str, calls: int, sessions: int, concurrency: int) -> dict:
+    tool_class = ThreadedSearchTool if mode == "threaded" else ShopifySearchTool
+    mcp_server = ShopifyMCPServer("allbirds.com", server_url=server_url)
+    tool = tool_class(mcp_server)
+    agent = create_react_agent(model=ScriptedModel(calls=calls), tools=[tool])
+    # The agent's cap on parallel graph tasks, i.e. on one step's tool calls
+    config = {"max_concurrency": 1 if mode == "sequential" else concurrency}
+
+    async def turn(i: int) -> float:
+        started = time.perf_counter()
+        result = await agent.ainvoke({"messages": [HumanMessage(content=f"session {i}")]}, config)
+        assert result["messages"][-1].content.startswith("Found results")
+        return time.perf_counter() - started
+
+    # Warm up connections before measuring
+    await turn(-1)
+    stalls: List[float] = []
+    watcher = asyncio.create_task(watch_loop(stalls))
+    started = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(turn(i) for i in range(sessions))))
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+    await mcp_server.aclose()
+    return {
+        "mode": mode,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000,
+        "turns_per_s": sessions / elapsed,
+        "max_stall_ms": max(stalls, default=0.0) * 1000,
+    }
+
+
+def main(argv: Any = None):
+    parser = argparse.ArgumentParser(description="Benchmark parallel tool-call execution")
+    parser.add_argument("--calls", type=int, default=4, help="Tool calls the model emits in its first step")
+    parser.add_argument("--sessions", type=int, default=1, help="Concurrent agent turns per mode")
+    parser.add_argument("--concurrency", type=int, default=4, help="Tool-call cap for the concurrent modes")
+    parser.add_argument("--latency", default="constant:80", help="Stand-in store latency (see local_server.py)")
+    parser.add_argument("--modes", nargs="+", default=["sequential", "threaded", "async"])
+    args = parser.parse_args(argv)
+
+    server = LocalMCPServer(port=0, faults=FaultConfig(latency=args.latency))
+    server.start_in_thread()
+    print(f"{args.calls} tool calls per turn, {args.sessions} concurrent sessions, store latency {args.latency}")
+    print(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}{'turns/s':>10}{'max stall ms':>15}")
+    for mode in args.modes:
+        row = asyncio.run(run_mode(mode, server.url, args.calls, args.sessions, args.concurrency))
+        print(f"{row['mode']:<12}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['turns_per_s']:>10.1f}"
+              f"{row['max_stall_ms']:>15.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Load generator for AudioWebSocketServer.
+
+Opens N concurrent voice clients, streams 16 kHz LINEAR16 audio in 100 ms
+frames the same way `example/script.js` does, and ramps N up stage by stage.
+For every session it records:
+    - time to first final transcript (from the first audio frame)
+    - time to agent response (from the final transcript)
+    - TTS throughput (bytes/s between tts_starting and tts_finished)
+    - time to filler audio (from the final transcript), for turns where the
+      server played one; filler clips ("filler": true) are kept out of the
+      agent response and TTS numbers
+    - websocket ping round-trips, a proxy for server event-loop lag
+      since pongs are answered from the server's event loop
+
+Each stage is summarised into percentiles and the run produces a saturation
+curve plus the largest session count that stayed within the latency SLO.
+
+Usage:
+    python backend/agents/tests/websocket_load.py --url ws://localhost:8000 \
+        --audio utterance.wav --start 1 --step 2 --max 16 --output saturation.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import struct
+import sys
+import time
+import wave
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+# Add the project root to the Python path
+project_root = str(Path(__file__).parent.parent.parent.parent)
+sys.path.append(project_root)
+
+RATE = 16000
+CHUNK = int(RATE / 10)  # 100ms
+FRAME_SECONDS = CHUNK / RATE
+
+
+def load_frames(audio_path: Optional[str], seconds: float = 3.0) -> List[bytes]:
+    """Split a 16 kHz mono 16-bit WAV into 100 ms frames, or synthesise a tone if no file is given.
+
+    The synthetic tone exercises ingestion only; the recogniser needs real speech to emit transcripts.
+    """
+    if audio_path:
+        with wave.open(audio_path, "rb") as wav:
+            if wav.getframerate() != RATE or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError(f"{audio_path} must be 16 kHz mono LINEAR16")
+            pcm = wav.readframes(wav.getnframes())
+    else:
+        samples = int(RATE * seconds)
+        pcm = b"".join(
+            struct.pack("<h", int(0.3 * 0x7FFF * math.sin(2 * math.pi * 220 * i / RATE)))
+            for i in range(samples)
+        )
+
+    frame_bytes = CHUNK * 2
+    return [pcm[i:i + frame_bytes] for i in range(0, len(pcm), frame_bytes)]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+class SessionResult:
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.time_to_transcript: Optional[float] = None
+        self.time_to_agent_response: Optional[float] = None
+        self.tts_bytes = 0
+        self.tts_seconds: Optional[float] = None
+        self.time_to_filler: Optional[float] = None
+        self.filler_bytes = 0
+        self.ping_rtts: List[float] = []
+        self.error: Optional[str] = None
+
+    @property
+    def tts_throughput(self) -> Optional[float]:
+        if not self.tts_seconds:
+            return None
+        return self.tts_bytes / self.tts_seconds
+
+
+async def run_session(session_id: int, url: str, frames: List[bytes], trailing_silence: float,
+                      response_timeout: float, ping_interval: float, expect_tts: bool = True) -> SessionResult:
+    """Drive one voice session: stream an utterance, keep the stream alive with silence, wait for TTS."""
+    result = SessionResult(session_id)
+    silence = b"\x00" * (CHUNK * 2)
+    done = asyncio.Event()
+
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            first_frame_at: Optional[float] = None
+            transcript_at: Optional[float] = None
+            tts_started_at: Optional[float] = None
+            in_filler = False
+
+            async def send_audio():
+                nonlocal first_frame_at
+                next_send = time.perf_counter()
+                silence_frames = int(trailing_silence / FRAME_SECONDS)
+                for frame in frames + [silence] * silence_frames:
+                    if done.is_set():
+                        return
+                    if first_frame_at is None:
+                        first_frame_at = time.perf_counter()
+                    await ws.send(frame)
+                    # Pace frames in real time like the browser worklet does
+                    next_send += FRAME_SECONDS
+                    await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+                # Keep the recogniser fed until the turn completes
+                while not done.is_set():
+                    await ws.send(silence)
+                    await asyncio.sleep(FRAME_SECONDS)
+
+            async def receive():
+                nonlocal transcript_at, tts_started_at, in_filler
+                async for message in ws:
+                    now = time.perf_counter()
+                    if isinstance(message, bytes):
+                        if in_filler:
+                            result.filler_bytes += len(message)
+                        else:
+                            result.tts_bytes += len(message)
+                        continue
+                    data = json.loads(message)
+                    if data.get("filler"):
+                        # Played while the agent works; the answer's own TTS follows
+                        in_filler = data.get("status") == "tts_starting"
+                        if in_filler and transcript_at is not None and result.time_to_filler is None:
+                            result.time_to_filler = now - transcript_at
+                        continue
+                    if data.get("is_final") and transcript_at is None and first_frame_at is not None:
+                        transcript_at = now
+                        result.time_to_transcript = now - first_frame_at
+                    elif "agent_response" in data and transcript_at is not None:
+                        result.time_to_agent_response = now - transcript_at
+                        if not expect_tts:
+                            break
+                    elif data.get("status") == "tts_starting":
+                        tts_started_at = now
+                    elif data.get("status") == "tts_finished" and tts_started_at is not None:
+                        result.tts_seconds = now - tts_started_at
+                        break
+                    elif data.get("status") == "tts_error" or "error" in data:
+                        result.error = data.get("error", "server error")
+                        break
+
+            async def probe_loop_lag():
+                while not done.is_set():
+                    started = time.perf_counter()
+                    pong_waiter = await ws.ping()
+                    await pong_waiter
+                    result.ping_rtts.append(time.perf_counter() - started)
+                    await asyncio.sleep(ping_interval)
+
+            sender = asyncio.create_task(send_audio())
+            prober = asyncio.create_task(probe_loop_lag())
+            try:
+                await asyncio.wait_for(receive(), timeout=response_timeout)
+            except asyncio.TimeoutError:
+                result.error = "timeout"
+            finally:
+                done.set()
+                for task in (sender, prober):
+                    task.cancel()
+                await asyncio.gather(sender, prober, return_exceptions=True)
+    except Exception as e:
+        result.error = result.error or f"{type(e).__name__}: {e}"
+
+    return result
+
+
+async def run_stage(concurrency: int, args, frames: List[bytes]) -> Dict[str, Any]:
+    """Run `concurrency` sessions at once, staggered over the ramp window."""
+    async def delayed(i: int):
+        await asyncio.sleep(args.ramp_seconds * i / max(1, concurrency))
+        return await run_session(i, args.url, frames, args.trailing_silence, args.response_timeout,
+                                 args.ping_interval, expect_tts=not args.no_tts)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(delayed(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r.error is None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "elapsed_seconds": elapsed,
+        "sessions": len(results),
+        "succeeded": len(ok),
+        "error_rate": 1 - len(ok) / len(results) if results else 0.0,
+        "errors": errors,
+        "time_to_transcript": summarize([r.time_to_transcript for r in results if r.time_to_transcript is not None]),
+        "time_to_agent_response": summarize([r.time_to_agent_response for r in results if r.time_to_agent_response is not None]),
+        "time_to_filler": summarize([r.time_to_filler for r in results if r.time_to_filler is not None]),
+        "tts_throughput_bytes_per_s": summarize([r.tts_throughput for r in results if r.tts_throughput is not None]),
+        "loop_lag_rtt": summarize([rtt for r in results for rtt in r.ping_rtts]),
+    }
+
+
+def within_slo(stage: Dict[str, Any], slo_seconds: float, max_error_rate: float) -> bool:
+    p95 = stage["time_to_agent_response"]["p95"]
+    return stage["error_rate"] <= max_error_rate and p95 is not None and p95 <= slo_seconds
+
+
+def _fmt(value: Optional[float], scale: float = 1000.0) -> str:
+    return "-" if value is None else f"{value * scale:8.0f}"
+
+
+async def main(args):
+    frames = load_frames(args.audio, args.synthetic_seconds)
+    stages = []
+    capacity = 0
+
+    print(f"{'N':>4} {'ok':>4} {'err%':>6} {'stt p95':>8} {'agent p50':>9} {'agent p95':>9} {'lag p95':>8} {'tts KB/s':>8}")
+    concurrency = args.start
+    while concurrency <= args.max:
+        stage = await run_stage(concurrency, args, frames)
+        stages.append(stage)
+        tts = stage["tts_throughput_bytes_per_s"]["p50"]
+        print(
+            f"{concurrency:>4} {stage['succeeded']:>4} {stage['error_rate'] * 100:>6.1f} "
+            f"{_fmt(stage['time_to_transcript']['p95'])} "
+            f"{_fmt(stage['time_to_agent_response']['p50']):>9} {_fmt(stage['time_to_agent_response']['p95']):>9} "
+            f"{_fmt(stage['loop_lag_rtt']['p95'])} {_fmt(tts, 1 / 1024)}"
+        )
+
+        if within_slo(stage, args.slo_seconds, args.max_error_rate):
+            capacity = concurrency
+        elif args.stop_on_saturation:
+            break
+        concurrency += args.step
+
+    report = {
+        "url": args.url,
+        "slo_seconds": args.slo_seconds,
+        "max_error_rate": args.max_error_rate,
+        "capacity_sessions": capacity,
+        "stages": stages,
+    }
+    print(f"\nSessions sustained within SLO (p95 agent response <= {args.slo_seconds}s): {capacity}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Saturation curve written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent websocket load generator for AudioWebSocketServer")
+    parser.add_argument("--url", default="ws://localhost:8000")
+    parser.add_argument("--audio", help="16 kHz mono LINEAR16 WAV containing one utterance (default: synthetic tone)")
+    parser.add_argument("--synthetic-seconds", type=float, default=3.0)
+    parser.add_argument("--start", type=int, default=1, help="Initial number of concurrent sessions")
+    parser.add_argument("--step", type=int, default=2, help="Sessions added per stage")
+    parser.add_argument("--max", type=int, default=32, help="Maximum number of concurrent sessions")
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="Window over which a stage's sessions connect")
+    parser.add_argument("--trailing-silence", type=float, default=1.5, help="Silence streamed after the utterance")
+    parser.add_argument("--response-timeout", type=float, default=60.0)
+    parser.add_argument("--ping-interval", type=float, default=0.5)
+    parser.add_argument("--no-tts", action="store_true", help="End each session at the agent response (server without TTS)")
+    parser.add_argument("--slo-seconds", type=float, default=8.0, help="p95 time-to-agent-response budget")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--stop-on-saturation", action="store_true", help="Stop ramping at the first stage that misses the SLO")
+    parser.add_argument("--output", help="Write the saturation curve as JSON")
+    asyncio.run(main(parser.parse_args()))
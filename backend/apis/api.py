@@ -1,4 +1,213 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from backend.agents.input.admission import AdmissionController
+from backend.agents.orchestrator.agent_pool import AgentPool, UnknownStoreError
+from backend.agents.orchestrator.catalog_sync import CATALOG, SIGNATURE_HEADER, verify_signature
+from backend.agents.outils.health import READINESS
+from backend.agents.outils.log_pipeline import session_id
+from backend.agents.outils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+
+def _agent_pool() -> AgentPool:
+    """The voice server's pool when it shares this process (run_websocket_server.py), else one of our own."""
+    if getattr(app.state, "agents", None) is None:
+        app.state.agents = AgentPool()
+    return app.state.agents
+
+
+def _admission() -> AdmissionController:
+    """Agent-run limits shared with voice sessions, so text turns count against WEPPO_MAX_AGENT_RUNS too."""
+    if getattr(app.state, "admission", None) is None:
+        app.state.admission = AdmissionController()
+    return app.state.admission
+
+
+async def _warm_up_own_pool():
+    """Build the default store's agent for an API serving on its own, then report the worker ready."""
+    started = time.perf_counter()
+
+    def build_agent():
+        agents = _agent_pool()
+        agents.acquire()
+        agents.release()
+
+    try:
+        await run_in_threadpool(build_agent)
+    except Exception as e:
+        READINESS.record_step("agent", time.perf_counter() - started, e)
+        logger.error("Agent warm-up failed; API stays unready: %s", e)
+        return
+    READINESS.record_step("agent", time.perf_counter() - started)
+    READINESS.mark_ready()
+    logger.info("API warm-up finished in %.2fs; worker is ready", time.perf_counter() - started)
+
+
+@app.on_event("startup")
+async def warm_up():
+    """
+    Alongside the voice server (run_websocket_server.py) its warm-up decides
+    readiness. Served on its own (uvicorn backend.apis.api:app), the API owns
+    its agent pool and warms it in the background, so /healthz answers meanwhile.
+    """
+    if getattr(app.state, "agents", None) is not None:
+        return
+    _agent_pool()
+    if os.environ.get("WEPPO_WARMUP", "1") == "0":
+        READINESS.mark_ready()
+        return
+    app.state.warmup = asyncio.create_task(_warm_up_own_pool())
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose turn latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up, warm or not."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until the worker has finished warming up."""
+    return JSONResponse(READINESS.status(), status_code=200 if READINESS.ready else 503)
+
+
+@app.post("/catalog/events")
+async def catalog_events(request: Request):
+    """
+    Product create/update/delete events relayed from Shopify webhooks, as one
+    {"store", "topic", "product"} event or {"events": [...]}. Cached searches and
+    answers for the affected products are patched or dropped; stores with no
+    agent in this process are skipped.
+    """
+    body = await request.body()
+    if not verify_signature(body, request.headers.get(SIGNATURE_HEADER)):
+        return JSONResponse({"error": "invalid signature"}, status_code=401)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return JSONResponse({"error": "invalid JSON"}, status_code=400)
+    events = payload.get("events", [payload]) if isinstance(payload, dict) else payload
+    if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+        return JSONResponse({"error": "expected an event or a list of events"}, status_code=400)
+    return CATALOG.apply_events(events)
+
+
+async def _chat_events(message: str, thread_id: str, store: str, customer_id: Optional[str], agents: AgentPool):
+    session_token = session_id.set(thread_id)
+    try:
+        agent = await agents.aacquire(store)
+        try:
+            yield _sse("session", {"thread_id": thread_id, "store": store})
+            async with _admission().agent_run():
+                async for event in agent.astream_chat(message, thread_id, customer_id):
+                    yield _sse(event.pop("event"), event)
+        finally:
+            agents.release(store)
+    except Exception as e:
+        yield _sse("error", {"error": str(e)})
+    finally:
+        session_id.reset(session_token)
+
+
+async def _chat_stream(message: Optional[str], thread_id: Optional[str], store: Optional[str],
+                       customer_id: Optional[str] = None):
+    if not READINESS.ready:
+        return JSONResponse({"error": "warming up"}, status_code=503)
+    if not message or not message.strip():
+        return JSONResponse({"error": "message is required"}, status_code=400)
+    agents = _agent_pool()
+    try:
+        store = agents.resolve(store)
+    except UnknownStoreError as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    thread_id = thread_id or f"text_{uuid.uuid4().hex}"
+    return StreamingResponse(
+        _chat_events(message.strip(), thread_id, store, customer_id, agents),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """
+    Text chat with the store's agent, streamed as Server-Sent Events. Body:
+    {"message", "thread_id"?, "store"?, "customer_id"?}; pass back the thread_id
+    from the `session` event to continue a conversation. With a customer_id,
+    results are ordered by the customer's affinity profile. Events: session,
+    token, tool_start, tool_end, done and error. No speech or TTS is involved.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "invalid JSON"}, status_code=400)
+    if not isinstance(body, dict):
+        return JSONResponse({"error": "expected a JSON object"}, status_code=400)
+    return await _chat_stream(body.get("message"), body.get("thread_id"), body.get("store"), body.get("customer_id"))
+
+
+@app.get("/chat/stream")
+async def chat_stream_get(message: str, thread_id: Optional[str] = None, store: Optional[str] = None,
+                          customer_id: Optional[str] = None):
+    """Same as POST /chat/stream, for EventSource clients, which can only send GET requests."""
+    return await _chat_stream(message, thread_id, store, customer_id)
+
+
+@app.post("/customers/{customer_id}/events")
+async def customer_events(customer_id: str, request: Request):
+    """
+    Product events for a customer's affinity profile: {"store"?, "thread_id"?,
+    "events": [{"event": "view" | "click" | "cart" | "purchase", "product": {...}
+    or "product_id": ...}]}. A product_id is resolved from the session's latest
+    results (thread_id) or the store's search cache.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "invalid JSON"}, status_code=400)
+    if not isinstance(body, dict) or not isinstance(body.get("events"), list):
+        return JSONResponse({"error": "expected {\"events\": [...]}"}, status_code=400)
+    agents = _agent_pool()
+    try:
+        store = agents.resolve(body.get("store"))
+    except UnknownStoreError as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+
+    def record():
+        agent = agents.acquire(store)
+        try:
+            recorded = sum(
+                1 for event in body["events"] if isinstance(event, dict) and agent.record_product_event(
+                    customer_id, str(event.get("event", "click")), event.get("product"), event.get("product_id"),
+                    body.get("thread_id"))
+            )
+            agent.session_state.flush()
+            return recorded
+        finally:
+            agents.release(store)
+
+    recorded = await run_in_threadpool(record)
+    return {"recorded": recorded, "ignored": len(body["events"]) - recorded}
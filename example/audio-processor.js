@@ -1,8 +1,8 @@
 class AudioProcessor extends AudioWorkletProcessor {
     constructor() {
         super();
-        // Match server's chunk size: 1600 samples (100ms at 16kHz)
-        this._bufferSize = 1600;
+        // 100ms chunks at the context's native rate (`sampleRate` is a worklet global)
+        this._bufferSize = Math.round(sampleRate / 10);
         this._buffer = new Float32Array(this._bufferSize);
         this._bufferIndex = 0;
     }
@@ -6,8 +6,17 @@ console.log('WebSocket instance created');
 let audioContext;
 let mediaStream;
 let workletNode;
-const SAMPLE_RATE = 16000; // Match backend's RATE
-const BUFFER_SIZE = 1024;
+// Audio is downsampled to the recognizer's 16 kHz and sent as 8-bit mu-law: 128 kbps instead of
+// 256 kbps LINEAR16 (and 352-384 kbps for mu-law at a 44.1/48 kHz native rate)
+const AUDIO_ENCODING = 'mulaw';
+const SEND_RATE = 16000;
+let sendRate = SEND_RATE;
+// Downsampler state carried across worklet frames
+let resampleStep = 1;
+let resamplePos = 0;
+let resampleSum = 0;
+let resampleCount = 0;
+let helloSent = false;
 
 // UI Elements
 const startButton = document.getElementById('startButton');
@@ -64,6 +73,43 @@ ws.onmessage = (event) => {
     }
 };
 
+// G.711 mu-law encoding of one 16-bit sample
+function linearToMulaw(sample) {
+    const BIAS = 0x84;
+    const CLIP = 32635;
+    sample = Math.round(sample);
+    const sign = sample < 0 ? 0x80 : 0;
+    if (sign) sample = -sample;
+    if (sample > CLIP) sample = CLIP;
+    sample += BIAS;
+    let exponent = 7;
+    for (let mask = 0x4000; (sample & mask) === 0 && exponent > 0; mask >>= 1) {
+        exponent--;
+    }
+    const mantissa = (sample >> (exponent + 3)) & 0x0F;
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF;
+}
+
+// Average the samples falling into each output period (a box filter against aliasing)
+function downsample(samples) {
+    if (resampleStep === 1) {
+        return samples;
+    }
+    const output = [];
+    for (let i = 0; i < samples.length; i++) {
+        resampleSum += samples[i];
+        resampleCount++;
+        resamplePos += 1;
+        if (resamplePos >= resampleStep) {
+            output.push(resampleSum / resampleCount);
+            resamplePos -= resampleStep;
+            resampleSum = 0;
+            resampleCount = 0;
+        }
+    }
+    return output;
+}
+
 // Function to format agent response for better display
 function formatAgentResponse(response) {
     // Convert markdown-style headers to HTML
@@ -95,11 +141,24 @@ async function startRecording() {
         mediaStream = await navigator.mediaDevices.getUserMedia({ audio: true });
         console.log('Microphone access granted');
         
-        // Create audio context
-        audioContext = new AudioContext({
-            sampleRate: SAMPLE_RATE
-        });
-        console.log('Audio context created with sample rate:', SAMPLE_RATE);
+        // Create audio context at the device's native rate (no browser-side resampling)
+        audioContext = new AudioContext();
+        console.log('Audio context created with sample rate:', audioContext.sampleRate);
+        // Never upsample: a device below 16 kHz sends at its own rate
+        sendRate = Math.min(SEND_RATE, audioContext.sampleRate);
+        resampleStep = audioContext.sampleRate / sendRate;
+        resamplePos = 0;
+        resampleSum = 0;
+        resampleCount = 0;
+
+        // Negotiate the inbound audio format before the first audio frame
+        if (!helloSent) {
+            ws.send(JSON.stringify({
+                type: 'hello',
+                audio: { encoding: AUDIO_ENCODING, sample_rate: sendRate, channels: 1 }
+            }));
+            helloSent = true;
+        }
 
         // Load and initialize the audio worklet
         await audioContext.audioWorklet.addModule('audio-processor.js');
@@ -116,15 +175,14 @@ async function startRecording() {
         // Handle audio data from the worklet
         workletNode.port.onmessage = (event) => {
             if (ws.readyState === WebSocket.OPEN) {
-                const audioData = event.data;
-                console.log('Received audio data from worklet, length:', audioData.length);
-                // Convert Float32Array to Int16Array for sending
-                const pcmData = new Int16Array(audioData.length);
+                const audioData = downsample(event.data);
+                console.log('Received audio data from worklet, length:', event.data.length);
+                // Encode the 16 kHz samples as mu-law (1 byte per sample instead of 2)
+                const encoded = new Uint8Array(audioData.length);
                 for (let i = 0; i < audioData.length; i++) {
-                    pcmData[i] = audioData[i] * 0x7FFF;
+                    encoded[i] = linearToMulaw(Math.max(-1, Math.min(1, audioData[i])) * 0x7FFF);
                 }
-                console.log('Sending PCM data to server, length:', pcmData.length);
-                ws.send(pcmData.buffer);
+                ws.send(encoded.buffer);
             } else {
                 console.warn('WebSocket not open, cannot send audio data');
             }
@@ -1,12 +1,42 @@
 import sys
 import os
+import argparse
 
 # Add the project root to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from backend.agents.input.websocket_server import AudioWebSocketServer
+from backend.agents.outils.log_pipeline import configure_logging, shutdown_logging
 import asyncio
 
+
+async def main(args):
+    server = AudioWebSocketServer(host=args.host, port=args.port)
+    services = [server.start()]
+
+    # Serve the FastAPI app from the same process so /metrics sees the voice server's metrics
+    if args.api_port:
+        import uvicorn
+        from backend.apis.api import app
+
+        # Text chat over HTTP shares the voice server's per-store agents and agent-run limits
+        app.state.agents = server.agents
+        app.state.admission = server.admission
+        config = uvicorn.Config(app, host=args.host, port=args.api_port, log_level="warning")
+        services.append(uvicorn.Server(config).serve())
+        print(f"API server started at http://{args.host}:{args.api_port}")
+
+    await asyncio.gather(*services)
+
+
 if __name__ == "__main__":
-    server = AudioWebSocketServer()
-    asyncio.run(server.start()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the Weppo voice websocket server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--api-port", type=int, default=int(os.environ.get("WEPPO_API_PORT", 8001)),
+                        help="Port for the FastAPI app (/metrics, /chat/stream); 0 disables it")
+    configure_logging()
+    try:
+        asyncio.run(main(parser.parse_args()))
+    finally:
+        shutdown_logging()
@@ -0,0 +1,60 @@
+import type { ActionFunctionArgs } from "@remix-run/node";
+import { createHmac } from "node:crypto";
+import { authenticate, unauthenticated } from "../shopify.server";
+
+// The voice agent keys stores by their storefront domain, not the myshopify one
+const primaryDomains = new Map<string, string>();
+
+async function primaryDomain(shop: string): Promise<string> {
+    const cached = primaryDomains.get(shop);
+    if (cached) {
+        return cached;
+    }
+    const { admin } = await unauthenticated.admin(shop);
+    const response = await admin.graphql(`#graphql
+        query primaryDomain {
+            shop {
+                primaryDomain {
+                    host
+                }
+            }
+        }`);
+    const { data } = await response.json();
+    const host = data?.shop?.primaryDomain?.host || shop;
+    primaryDomains.set(shop, host);
+    return host;
+}
+
+// Relays product create/update/delete webhooks to the agent server (WEPPO_CATALOG_EVENTS_URL),
+// which patches or drops its cached searches and answers for the changed product.
+export const action = async ({ request }: ActionFunctionArgs) => {
+    const { payload, topic, shop } = await authenticate.webhook(request);
+    console.log(`Received ${topic} webhook for ${shop}`);
+
+    const eventsUrl = process.env.WEPPO_CATALOG_EVENTS_URL;
+    if (!eventsUrl) {
+        return new Response();
+    }
+
+    const body = JSON.stringify({
+        store: await primaryDomain(shop),
+        topic: topic.toLowerCase().replace("_", "/"),
+        product: payload,
+    });
+    const headers: Record<string, string> = { "Content-Type": "application/json" };
+    const secret = process.env.WEPPO_CATALOG_WEBHOOK_SECRET;
+    if (secret) {
+        headers["X-Weppo-Hmac-Sha256"] = createHmac("sha256", secret).update(body).digest("base64");
+    }
+
+    try {
+        const response = await fetch(eventsUrl, { method: "POST", headers, body });
+        if (!response.ok) {
+            console.error(`Catalog event relay for ${shop} failed: ${response.status}`);
+        }
+    } catch (error) {
+        // Missed events are caught by the agent's periodic reconciliation
+        console.error(`Catalog event relay for ${shop} failed: ${error}`);
+    }
+    return new Response();
+};